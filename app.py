@@ -1,16 +1,28 @@
 import os
+import json
 import yaml
 import logging
+import argparse
 import logging.config
 import coloredlogs
 
 from os.path import join, dirname
 from dotenv import load_dotenv
-from usos.authentication import Authentication, Credentials
+from usos import notifications, parsing
+from usos.archive import PageArchive
+from usos.authentication import Authentication, Credentials, SessionCache
+from usos.batch import BatchRunner, load_accounts
 from usos.data import DataController
-from usos.web_driver import SeleniumDriver
+from usos.frontier import Frontier
+from usos.history import ChangeLog
+from usos.web_driver import (SeleniumDriver, HttpDriver, DriverPool,
+                             ReplayDriver)
 from usos.notifications import Dispatcher
+from usos.outbox import Outbox
+from usos.query import ResultIndex
+from usos.routing import TemplateRegistry
 from usos.scraper import Scraper
+from usos.storage import DEFAULT_FSYNC, JsonStorage, SqliteStorage, migrate
 
 
 def load_environmental_variables(file) -> bool:
@@ -67,43 +79,470 @@ def load_logging_setup(debug_mode: bool) -> None:
     selenium_logger.setLevel(logging.ERROR)
 
 
+def parse_priorities(value: str) -> dict:
+    """Parses priorities of destinations, such as 
+    ``dla_stud/studia/oceny:0 dla_stud/studia/sprawdziany:1``.
+
+    :param value: pairs of a destination prefix and its priority, 
+        separated by spaces.
+    :returns: priorities keyed by the destination prefix.
+    """
+    priorities = {}
+    for pair in value.split():
+        prefix, priority = pair.rsplit(":", 1)
+        priorities[prefix] = int(priority)
+
+    return priorities
+
+
+def parse_limit(value: str) -> int:
+    """Parses an optional numeric limit, empty values mean no limit."""
+    if value:
+        return int(value)
+    return None
+
+
+def create_storage(data_dir: str, account: str = "",
+                   backend: str = None) -> object:
+    """Creates the storage for the entities of an account.
+
+    :param data_dir: directory the account's entities are stored in by 
+        the JSON storage.
+    :param account: name of the account the entities are stored under 
+        in the SQLite database.
+    :param backend: ``json`` or ``sqlite``, defaults to the one set with 
+        ``USOS_DATA_STORAGE``.
+    """
+    backend = backend or os.environ.get('USOS_DATA_STORAGE', "json")
+    fsync = os.environ.get('USOS_DATA_FSYNC', DEFAULT_FSYNC)
+
+    if backend == "sqlite":
+        return SqliteStorage(
+            os.environ.get('USOS_DATA_DATABASE',
+                           os.path.join("data", "usos.sqlite3")),
+            account=account,
+            fsync=fsync)
+
+    return JsonStorage(data_dir, fsync=fsync)
+
+
+def create_outbox(account: str = "") -> Outbox:
+    """Creates the outbox shared by every account.
+
+    :param account: name of the account the enqueued notifications are 
+        coalesced for.
+    """
+    return Outbox(
+        os.path.join("data", "outbox.sqlite3"),
+        max_attempts=int(os.environ.get('USOS_NOTIFICATIONS_MAX_ATTEMPTS', 8)),
+        account=account,
+        window=float(os.environ.get('USOS_NOTIFICATIONS_WINDOW', 0)),
+        timeout=float(os.environ.get('USOS_NOTIFICATIONS_TIMEOUT', 60)))
+
+
+def scrape(credentials: object, web_driver: object,
+           driver_factory: object = None, workers: int = 1,
+           data_dir: str = "data", config_file: str = None,
+           quit_on_finish: bool = True, account: str = "") -> None:
+    """Scrapes the data of a single account and dispatches notifications
+    about the detected changes.
+
+    :param credentials: an instance of 
+        :class:`usos.authentication.Credentials`.
+    :param web_driver: a web driver used for signing in and navigating.
+    :param driver_factory: a callable returning drivers for additional 
+        workers.
+    :param workers: number of destinations scraped concurrently.
+    :param data_dir: directory the account's entities are stored in.
+    :param config_file: notifications config file, defaults to the one 
+        set in the .env file.
+    :param quit_on_finish: whether to terminate the web driver afterwards.
+    :param account: name the account's entities are stored under in the 
+        SQLite database.
+    """
+    session_cache = None
+    if os.environ.get('USOS_SCRAPER_SESSION_CACHE') == "True":
+        session_cache = SessionCache(os.path.join("data", "sessions"))
+
+    authentication = Authentication(
+        credentials=credentials,
+        root_url=os.environ['USOS_SCRAPER_ROOT_URL'],
+        web_driver=web_driver,
+        session_cache=session_cache)
+
+    notifications_dispatcher = Dispatcher(
+        channels=os.environ['USOS_NOTIFICATIONS_STREAMS'],
+        enable=(os.environ['USOS_NOTIFICATIONS_ENABLE'] == "True"),
+        config_file=(config_file
+                     or os.environ['USOS_NOTIFICATIONS_CONFIG_FILE']),
+        timeout=float(os.environ.get('USOS_NOTIFICATIONS_TIMEOUT', 60)))
+
+    storage = create_storage(data_dir, account)
+
+    history = None
+    if os.environ.get('USOS_DATA_HISTORY') == "True":
+        history = ChangeLog(os.path.join(data_dir, "history"))
+
+    outbox = None
+    if os.environ.get('USOS_NOTIFICATIONS_OUTBOX') == "True":
+        outbox = create_outbox(account)
+
+    data = DataController(
+        dispatcher=notifications_dispatcher,
+        data_dir=data_dir,
+        storage=storage,
+        history=history,
+        incremental=(os.environ.get('USOS_DATA_INCREMENTAL') == "True"),
+        outbox=outbox)
+
+    http_driver = None
+    if os.environ.get('USOS_SCRAPER_HTTP_FAST_PATH') == "True":
+        http_driver = HttpDriver()
+
+    snapshot = None
+    if os.environ.get('USOS_SCRAPER_FRONTIER_SNAPSHOT') == "True":
+        snapshot = os.path.join(data_dir, "frontier.json")
+
+    frontier = Frontier(
+        priorities=parse_priorities(
+            os.environ.get('USOS_SCRAPER_PRIORITIES', "")),
+        max_depth=parse_limit(os.environ.get('USOS_SCRAPER_MAX_DEPTH')),
+        max_pages=parse_limit(os.environ.get('USOS_SCRAPER_MAX_PAGES')),
+        snapshot=snapshot)
+
+    archive = None
+    if os.environ.get('USOS_SCRAPER_RECORD') == "True":
+        archive = PageArchive(os.path.join(data_dir, "archive"))
+
+    scraper = Scraper(
+        root_url=os.environ['USOS_SCRAPER_ROOT_URL'],
+        destinations=os.environ['USOS_SCRAPER_DESTINATIONS'],
+        authentication=authentication,
+        data_controller=data,
+        web_driver=web_driver,
+        http_driver=http_driver,
+        workers=workers,
+        driver_factory=driver_factory,
+        http_driver_factory=HttpDriver,
+        quit_on_finish=quit_on_finish,
+        frontier=frontier,
+        archive=archive)
+
+    try:
+        scraper.run()
+        data.analyze()
+
+        if history is not None and history.compaction_due():
+            history.compact()
+    finally:
+        storage.close()
+        if outbox is not None:
+            outbox.close()
+
+
+def account_data_dir(username: str) -> str:
+    """Returns the directory the data of a batch account is kept in."""
+    return os.path.join("data", "accounts", username.replace(os.sep, "_"))
+
+
+def scrape_account(account: dict, web_driver: object) -> None:
+    """Scrapes a single account of a batch with a pooled web driver.
+
+    The data of every account is kept in its own directory under 
+    ``data/accounts/``.
+
+    :param account: an account loaded by :func:`usos.batch.load_accounts`.
+    :param web_driver: a web driver leased from the pool.
+    """
+    credentials = Credentials(
+        username=account["username"],
+        password=account["password"])
+
+    scrape(
+        credentials=credentials,
+        web_driver=web_driver,
+        data_dir=account_data_dir(account["username"]),
+        config_file=account.get("notifications_config_file"),
+        quit_on_finish=False,
+        account=account["username"])
+
+
 def main() -> None:
     """Runs the scraper with configuration fetched from the .env file."""
     load_logging_setup(
         debug_mode=(os.environ['USOS_SCRAPER_DEBUG_MODE'] == "True"))
 
-    web_driver = SeleniumDriver(
+    selenium_driver = SeleniumDriver(
         headless=(os.environ['USOS_SCRAPER_WEBDRIVER_HEADLESS'] == "True"))
-    web_driver = web_driver.get_instance()
 
     credentials = Credentials(
         username=os.environ['USOS_SETTINGS_USERNAME'],
         password=os.environ['USOS_SETTINGS_PASSWORD'])
 
-    authentication = Authentication(
+    scrape(
         credentials=credentials,
-        root_url=os.environ['USOS_SCRAPER_ROOT_URL'],
-        web_driver=web_driver)
+        web_driver=selenium_driver.get_instance(),
+        driver_factory=selenium_driver.new_instance,
+        workers=int(os.environ.get('USOS_SCRAPER_WORKERS', 1)))
+
+
+def batch(accounts_file: str) -> None:
+    """Runs the scraper for every account listed in a given file, sharing
+    a bounded pool of web drivers between them.
+
+    :param accounts_file: path to a JSON file with the accounts.
+    """
+    load_logging_setup(
+        debug_mode=(os.environ['USOS_SCRAPER_DEBUG_MODE'] == "True"))
+
+    selenium_driver = SeleniumDriver(
+        headless=(os.environ['USOS_SCRAPER_WEBDRIVER_HEADLESS'] == "True"))
+
+    driver_pool = DriverPool(
+        factory=selenium_driver.new_instance,
+        size=int(os.environ.get('USOS_BATCH_POOL_SIZE', 2)))
+
+    runner = BatchRunner(
+        accounts=load_accounts(accounts_file),
+        driver_pool=driver_pool,
+        task=scrape_account)
+
+    try:
+        runner.run()
+    finally:
+        driver_pool.quit()
+
+
+def replay(at: str = None, data_dir: str = "data/replay",
+           notify: bool = False, account: str = "",
+           archive: str = None) -> None:
+    """Runs the ScrapingTemplates on pages recorded with 
+    ``USOS_SCRAPER_RECORD=True`` and analyzes the results, without 
+    starting the browser.
+
+    :param at: a timestamp to replay the pages as they were at that 
+        time, defaults to the latest recordings.
+    :param data_dir: directory the replayed entities are stored in.
+    :param notify: whether to dispatch notifications about the changes.
+    :param account: a batch account to replay the recordings of, 
+        defaults to the account set in the .env file.
+    :param archive: directory of the recordings, overrides ``account``.
+    """
+    if archive is None:
+        archive = os.path.join(
+            account_data_dir(account) if account else "data", "archive")
+
+    load_logging_setup(
+        debug_mode=(os.environ['USOS_SCRAPER_DEBUG_MODE'] == "True"))
+
+    root_url = os.environ['USOS_SCRAPER_ROOT_URL']
 
     notifications_dispatcher = Dispatcher(
         channels=os.environ['USOS_NOTIFICATIONS_STREAMS'],
-        enable=(os.environ['USOS_NOTIFICATIONS_ENABLE'] == "True"),
+        enable=notify,
         config_file=os.environ['USOS_NOTIFICATIONS_CONFIG_FILE'])
 
     data = DataController(
-        dispatcher=notifications_dispatcher)
+        dispatcher=notifications_dispatcher,
+        data_dir=data_dir)
 
     scraper = Scraper(
-        root_url=os.environ['USOS_SCRAPER_ROOT_URL'],
+        root_url=root_url,
         destinations=os.environ['USOS_SCRAPER_DESTINATIONS'],
-        authentication=authentication,
+        authentication=None,
         data_controller=data,
-        web_driver=web_driver)
+        web_driver=ReplayDriver(
+            archive=PageArchive(archive),
+            root_url=root_url,
+            at=at))
 
     scraper.run()
     data.analyze()
 
 
+def migrate_storage(target: str, data_dir: str = "data",
+                    account: str = "") -> None:
+    """Copies the stored entities of an account between the JSON files 
+    and the SQLite database.
+
+    :param target: ``sqlite`` to move the entities from JSON files into 
+        the database, ``json`` for the opposite direction.
+    :param data_dir: directory of the account's JSON files.
+    :param account: name of the account in the database.
+    """
+    source = "json" if target == "sqlite" else "sqlite"
+    source_storage = create_storage(data_dir, account, backend=source)
+    target_storage = create_storage(data_dir, account, backend=target)
+
+    try:
+        count = migrate(source_storage, target_storage)
+        print("Migrated {} entities from {} to {}".format(
+            count, source, target))
+    finally:
+        source_storage.close()
+        target_storage.close()
+
+
+def query(data_dir: str = "data", account: str = "",
+          entity: str = None, group: str = None, subgroup: str = None,
+          hierarchy: str = None, as_json: bool = False) -> None:
+    """Prints the stored items of an account matching given criteria, 
+    without starting the browser.
+
+    :param data_dir: directory of the account's entities.
+    :param account: name of the account in the database.
+    :param entity: name of the entity, e.g. ``final-grades``.
+    :param group: the items' group, e.g. a semester or a course code.
+    :param subgroup: the items' subgroup.
+    :param hierarchy: the items' hierarchy.
+    :param as_json: whether to print the items as JSON lines.
+    """
+    storage = create_storage(data_dir, account)
+
+    if isinstance(storage, JsonStorage):
+        cache = os.path.join(data_dir, "index.json")
+    else:
+        cache = os.path.join(os.path.dirname(storage.database), "index",
+                             (account or "default") + ".json")
+
+    try:
+        items = ResultIndex(storage, cache=cache).query(
+            entity=entity, group=group, subgroup=subgroup,
+            hierarchy=hierarchy)
+    finally:
+        storage.close()
+
+    for item in items:
+        if as_json:
+            print(json.dumps(item, ensure_ascii=False, sort_keys=True))
+        else:
+            print("{:<15} {:<30} {:<30} {}: {}".format(
+                item.get("group") or "", item.get("subgroup") or "",
+                item.get("hierarchy") or "", item.get("item"),
+                ", ".join(str(value) for value in item.get("values") or [])))
+
+
+def drain() -> None:
+    """Delivers the notifications waiting in the outbox."""
+    outbox = create_outbox()
+
+    try:
+        counts = outbox.drain()
+        print("Sent {sent}, retrying {retried}, ".format(**counts)
+              + "dead-lettered {dead} notifications".format(**counts))
+
+        for message in outbox.dead():
+            print("Dead #{id} via {channel} after {attempts} ".format(
+                **message) + "attempts: {last_error}".format(**message))
+    finally:
+        outbox.close()
+
+
+def routes() -> None:
+    """Prints the route table of the ScrapingTemplates."""
+    for route in TemplateRegistry().routes():
+        print("{:<50} {}".format(route.pattern, route.module))
+
+
+def parse_arguments() -> object:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Automates tasks on the USOSweb interface. Without "
+                    + "a command, scrapes the account set in the .env "
+                    + "file.")
+    commands = parser.add_subparsers(dest="command")
+
+    batch_command = commands.add_parser(
+        "batch", help="scrape multiple accounts in a single process")
+    batch_command.add_argument(
+        "accounts_file", help="JSON file with a list of accounts")
+
+    replay_command = commands.add_parser(
+        "replay", help="run the templates on recorded pages")
+    replay_command.add_argument(
+        "--at", help="replay pages as they were at a given timestamp, "
+                     + "e.g. 20180615T101500")
+    replay_command.add_argument(
+        "--data-dir", default="data/replay",
+        help="directory to store the replayed entities in")
+    replay_command.add_argument(
+        "--notify", action="store_true",
+        help="dispatch notifications about the detected changes")
+    replay_command.add_argument(
+        "--account", default="",
+        help="batch account to replay the recordings of")
+    replay_command.add_argument(
+        "--archive",
+        help="directory of the recordings, e.g. data/archive")
+
+    commands.add_parser(
+        "routes", help="show which templates handle which destinations")
+
+    query_command = commands.add_parser(
+        "query", help="show stored items, e.g. all grades of a semester")
+    query_command.add_argument(
+        "--entity", help="name of the entity, e.g. final-grades")
+    query_command.add_argument(
+        "--group", help="group of the items, e.g. 2018L or a course code")
+    query_command.add_argument(
+        "--subgroup", help="subgroup of the items")
+    query_command.add_argument(
+        "--hierarchy", help="hierarchy of the items")
+    query_command.add_argument(
+        "--json", action="store_true", help="print the items as JSON lines")
+    query_command.add_argument(
+        "--data-dir", default="data",
+        help="directory of the JSON files")
+    query_command.add_argument(
+        "--account", default="",
+        help="account the entities are stored under in the database")
+
+    commands.add_parser(
+        "drain", help="deliver the notifications waiting in the outbox")
+
+    migrate_command = commands.add_parser(
+        "migrate", help="move stored entities between JSON and SQLite")
+    migrate_command.add_argument(
+        "target", choices=["json", "sqlite"],
+        help="storage to move the entities to")
+    migrate_command.add_argument(
+        "--data-dir", default="data",
+        help="directory of the JSON files")
+    migrate_command.add_argument(
+        "--account", default="",
+        help="account the entities are stored under in the database")
+
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    if load_environmental_variables('.env') and check_required_dirs():
-        main()
+    arguments = parse_arguments()
+
+    if arguments.command == "routes":
+        routes()
+    elif load_environmental_variables('.env') and check_required_dirs():
+        parsing.set_default_backend(
+            os.environ.get('USOS_SCRAPER_PARSER', "html.parser"))
+
+        template_cache = os.environ.get(
+            'USOS_NOTIFICATIONS_CACHE',
+            os.path.join("data", "cache", "templates"))
+        if template_cache:
+            notifications.set_bytecode_cache(template_cache)
+
+        if arguments.command == "batch":
+            batch(arguments.accounts_file)
+        elif arguments.command == "drain":
+            drain()
+        elif arguments.command == "query":
+            query(arguments.data_dir, arguments.account, arguments.entity,
+                  arguments.group, arguments.subgroup, arguments.hierarchy,
+                  arguments.json)
+        elif arguments.command == "migrate":
+            migrate_storage(
+                arguments.target, arguments.data_dir, arguments.account)
+        elif arguments.command == "replay":
+            replay(arguments.at, arguments.data_dir, arguments.notify,
+                   arguments.account, arguments.archive)
+        else:
+            main()
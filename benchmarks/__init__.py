@@ -0,0 +1,11 @@
+"""Offline benchmarks of the scraping and analysis pipeline.
+
+Run every suite from the project's root directory with::
+
+    python3 -m benchmarks
+
+Results are saved to ``benchmarks/results/<commit>.json`` and can be
+compared with an earlier run::
+
+    python3 -m benchmarks --compare benchmarks/results/1a2b3c4.json
+"""
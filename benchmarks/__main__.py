@@ -0,0 +1,82 @@
+"""Runs the benchmarks and saves the results for later comparison."""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from benchmarks import bench_data, bench_notifications, bench_templates
+from benchmarks.harness import measure
+
+SUITES = [bench_templates, bench_data, bench_notifications]
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+def current_commit() -> str:
+    """Returns the abbreviated hash of the checked out commit."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Prints the change of every metric against a baseline."""
+    print("\n{:<60} {:>10} {:>10}".format("vs. baseline", "time", "peak"))
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        print("{:<60} {:>+9.1f}% {:>+9.1f}%".format(
+            name,
+            100 * (metrics["min_seconds"] / old["min_seconds"] - 1),
+            100 * (metrics["peak_bytes"] / max(old["peak_bytes"], 1) - 1)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-k", dest="keyword", default="",
+                        help="run only benchmarks containing a keyword")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of timed runs of every benchmark")
+    parser.add_argument("--compare", metavar="RESULTS",
+                        help="results of an earlier run to compare with")
+    arguments = parser.parse_args()
+
+    sys.setrecursionlimit(10000)
+
+    results = {}
+    print("{:<60} {:>10} {:>10} {:>12} {:>14} {:>10}".format(
+        "benchmark", "min [ms]", "med [ms]", "peak [KiB]",
+        "retained [KiB]", "blocks"))
+
+    for suite in SUITES:
+        for name, function in suite.benchmarks():
+            if arguments.keyword not in name:
+                continue
+
+            metrics = measure(function, repeat=arguments.repeat)
+            results[name] = metrics
+            print("{:<60} {:>10.2f} {:>10.2f} {:>12.1f} {:>14.1f} {:>10}"
+                  .format(name,
+                          metrics["min_seconds"] * 1000,
+                          metrics["median_seconds"] * 1000,
+                          metrics["peak_bytes"] / 1024,
+                          metrics["retained_bytes"] / 1024,
+                          metrics["retained_blocks"]))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    filename = os.path.join(RESULTS_DIR, current_commit() + ".json")
+    with open(filename, 'w') as working_file:
+        json.dump(results, working_file, indent=2, sort_keys=True)
+    print("\nResults saved to '{}'".format(filename))
+
+    if arguments.compare:
+        with open(arguments.compare, 'r') as working_file:
+            compare(results, json.load(working_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmarks of the analysis of entities.
+
+The comparison benchmarks diff an entity with a previous version of 
+itself, the way :class:`usos.data.DataController` does after every run. 
+The loading benchmarks measure the memory retained by the items of an 
+entity read from a JSON file, as dictionaries and as 
+:class:`usos.data.Item` objects. Building Items costs time and a higher 
+peak, since the parsed dictionaries are alive until they are converted.
+"""
+import json
+from benchmarks import synthetic
+from usos.data import DataController, Item
+
+
+def _compare_benchmark(items: int, changed: int) -> object:
+    """Returns a callable diffing two versions of an entity, differing
+    in the values of ``changed`` items."""
+    old = synthetic.course_tree_entity(items, seed=0)["items"]
+    new = [dict(item) for item in old]
+    for item in new[::max(items // max(changed, 1), 1)][:changed]:
+        item["values"] = item["values"] + ["(poprawa)"]
+
+    old = [Item.from_dict(item) for item in old]
+    new = [Item.from_dict(item) for item in new]
+
+    data = DataController(dispatcher=None)
+
+    def run() -> object:
+        return data._diff_items(old, new)
+
+    return run
+
+
+def _load_benchmark(items: int, compact: bool) -> object:
+    """Returns a callable loading the items of a stored entity."""
+    stored = json.dumps(synthetic.course_tree_entity(items))
+
+    def run() -> object:
+        loaded = json.loads(stored)["items"]
+        if compact:
+            return [Item.from_dict(item) for item in loaded]
+        return loaded
+
+    return run
+
+
+def benchmarks() -> list:
+    """Returns pairs of a benchmark's name and a callable to measure."""
+    return ([("compare-items/items={},changed={}".format(items, changed),
+              _compare_benchmark(items, changed))
+             for items in [1000, 10000]
+             for changed in [0, 100]]
+            + [("load-items/items={}[{}]".format(
+                    items, "slots" if compact else "dict"),
+                _load_benchmark(items, compact))
+               for items in [10000]
+               for compact in [False, True]])
@@ -0,0 +1,37 @@
+"""Benchmarks of rendering the notifications.
+
+The rendering benchmarks render the Email template for a changed course,
+compiling the template for every message, as every notification used to,
+and reusing the template compiled once by 
+:func:`usos.notifications.get_template`.
+"""
+from jinja2 import Environment, FileSystemLoader
+from benchmarks import synthetic
+from usos import notifications
+
+
+def _render_benchmark(items: int, cached: bool) -> object:
+    """Returns a callable rendering the Email template."""
+    data = [synthetic.course_tree_entity(items)]
+
+    def run() -> object:
+        if cached:
+            template = notifications.get_template("Email.html")
+        else:
+            template = Environment(
+                loader=FileSystemLoader(notifications.TEMPLATES_DIR),
+                lstrip_blocks=True,
+                trim_blocks=True).get_template("Email.html")
+
+        return template.render(data=data)
+
+    return run
+
+
+def benchmarks() -> list:
+    """Returns pairs of a benchmark's name and a callable to measure."""
+    return [("render-email/items={}[{}]".format(
+                items, "cached" if cached else "compiled"),
+             _render_benchmark(items, cached))
+            for items in [20]
+            for cached in [False, True]]
@@ -0,0 +1,57 @@
+"""Benchmarks of the ScrapingTemplates on synthetic pages.
+
+Every benchmark processes a whole page, the way it happens with the 
+HTTP fast path: the template receives a snapshot of the page's HTML and 
+returns parsed results.
+"""
+from benchmarks import synthetic
+from usos import parsing
+from usos.routing import TemplateRegistry
+
+ROOT_URL = "https://usosweb.uni.wroc.pl/kontroler.php?_action="
+
+
+def _page_benchmark(destination: str, html: str, backend: str) -> object:
+    """Returns a callable running the template of a destination on a 
+    given page, with a given parser backend."""
+    template = TemplateRegistry().resolve(destination)
+    url = ROOT_URL + destination
+
+    def run() -> object:
+        parsing.set_default_backend(backend)
+        snapshot = parsing.Snapshot(url, html)
+        return template(snapshot=snapshot).get_data()
+
+    return run
+
+
+def benchmarks() -> list:
+    """Returns pairs of a benchmark's name and a callable to measure."""
+    pokaz = "dla_stud/studia/sprawdziany/pokaz&wez_id=33693"
+    pages = []
+
+    for courses in [100, 500, 2000]:
+        pages.append((
+            "oceny-index/courses={}".format(courses),
+            "dla_stud/studia/oceny/index",
+            synthetic.grades_page(courses)))
+
+    for courses in [50, 500]:
+        pages.append((
+            "sprawdziany-index/links={}".format(courses),
+            "dla_stud/studia/sprawdziany/index",
+            synthetic.sprawdziany_index_page(courses)))
+
+    for name, depth, width in [("wide", 1, 2000),
+                               ("bushy", 5, 5),
+                               ("deep", 100, 1)]:
+        pages.append((
+            "sprawdziany-pokaz/{}(depth={},width={})".format(
+                name, depth, width),
+            pokaz,
+            synthetic.course_tree_page(depth, width)))
+
+    return [("{}[{}]".format(name, backend),
+             _page_benchmark(destination, html, backend))
+            for name, destination, html in pages
+            for backend in parsing.BACKENDS]
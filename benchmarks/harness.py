@@ -0,0 +1,50 @@
+"""Measures time and memory of a single benchmark."""
+import gc
+import time
+import tracemalloc
+
+
+def measure(function: object, repeat: int = 5) -> dict:
+    """Runs a function several times and measures it.
+
+    Time is measured without tracing memory, memory is measured during 
+    one additional run.
+
+    :param function: a callable without arguments.
+    :param repeat: number of timed runs.
+    :returns: the fastest and the median time in seconds, peak traced 
+        memory in bytes, and the bytes and the number of memory blocks 
+        allocated during the run and still referenced by its result. 
+        The peak includes temporary allocations, e.g. the parsed JSON an
+        entity is built from, the retained memory is what the result 
+        keeps alive.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    statistics = after.compare_to(before, "lineno")
+    blocks = sum(max(stat.count_diff, 0) for stat in statistics)
+    retained = sum(max(stat.size_diff, 0) for stat in statistics)
+    del result
+
+    timings.sort()
+    return {
+        "min_seconds": timings[0],
+        "median_seconds": timings[len(timings) // 2],
+        "peak_bytes": peak,
+        "retained_bytes": retained,
+        "retained_blocks": blocks,
+    }
@@ -0,0 +1,122 @@
+"""Generators of synthetic USOSweb pages, structured the same way as the
+pages handled by the ScrapingTemplates."""
+import random
+
+SEMESTERS = ["2016Z", "2016L", "2017Z", "2017L", "2018Z", "2018L"]
+GRADES = ["2", "3", "3,5", "4", "4,5", "5", "ZAL", "NZAL"]
+TERMS = ["Egzamin, termin 1", "Egzamin, termin 2", "Ćwiczenia", "Wykład"]
+
+
+def grades_page(courses: int, seed: int = 0) -> str:
+    """Returns the grades tab of ``dla_stud/studia/oceny/index``.
+
+    :param courses: number of courses (table rows).
+    :param seed: seed of the random grades.
+    """
+    rng = random.Random(seed)
+    rows = []
+
+    for index in range(courses):
+        grades = "".join(
+            '<div><a href="#">{}</a> <span class="ocena">{}</span></div>'
+            .format(term, rng.choice(GRADES))
+            for term in rng.sample(TERMS, rng.randint(1, len(TERMS))))
+
+        rows.append(
+            '<tr class="{}">'
+            '<td><a href="kontroler.php?_action=katalog2/przedmioty/'
+            'pokazPrzedmiot&prz_kod=28-INF-{index}">Przedmiot numer '
+            '{index}</a><br><span class="note">28-INF-{index}</span></td>'
+            '<td><span>{semester}</span></td>'
+            '<td>{grades}</td>'
+            '</tr>'.format(
+                "even" if index % 2 else "odd",
+                index=index,
+                semester=SEMESTERS[index % len(SEMESTERS)],
+                grades=grades))
+
+    return ('<html><body><div id="tab1"><table class="grey">{}</table>'
+            '</div></body></html>').format("".join(rows))
+
+
+def course_tree_page(depth: int, width: int, seed: int = 0) -> str:
+    """Returns a ``dla_stud/studia/sprawdziany/pokaz`` page with a tree 
+    of results.
+
+    Every node of the tree has ``width`` children, down to ``depth`` 
+    levels, so ``depth=1, width=2000`` gives a wide, flat tree and 
+    ``depth=100, width=1`` a deep chain.
+
+    :param depth: number of levels of the tree.
+    :param width: number of children of every node.
+    :param seed: seed of the random results.
+    """
+    rng = random.Random(seed)
+    counter = [0]
+
+    def subtree(level: int) -> str:
+        if level > depth:
+            return ""
+
+        parts = []
+        for _ in range(width):
+            counter[0] += 1
+            node = counter[0]
+            parts.append(
+                '<table class="grey"><tr>'
+                '<td><img src="img/node.gif"></td>'
+                '<td>Sprawdzian {node} <span class="note">'
+                '(opis)</span></td>'
+                '<td><b>{points:.1f} pkt</b></td>'
+                '<td>Wystawił: Jan Kowalski\n  2018-06-{day:02d}</td>'
+                '</tr></table>'.format(
+                    node=node, points=rng.random() * 100,
+                    day=rng.randint(1, 30)))
+            parts.append('<div id="childs-{}">{}</div>'.format(
+                node, subtree(level + 1)))
+
+        return "".join(parts)
+
+    return ('<html><body><div id="layout-c22a">'
+            '<h1><span><a href="#">Logika dla informatyków</a> '
+            '<span>28-INF-S-DOLI</span></span><span>2018L</span></h1>'
+            '<div id="drzewo"><div id="childs-0">{}</div></div>'
+            '</div></body></html>').format(subtree(1))
+
+
+def sprawdziany_index_page(courses: int) -> str:
+    """Returns ``dla_stud/studia/sprawdziany/index`` listing links to 
+    the course trees.
+
+    :param courses: number of links.
+    """
+    links = "".join(
+        '<tr><td><a class="fwdlink" href="kontroler.php?_action=dla_stud'
+        '/studia/sprawdziany/pokaz&wez_id={}">Przedmiot {}</a></td></tr>'
+        .format(30000 + index, index)
+        for index in range(courses))
+
+    return ('<html><body><div id="lista"><table>{}</table></div>'
+            '</body></html>').format(links)
+
+
+def course_tree_entity(items: int, seed: int = 0) -> dict:
+    """Returns a ``course-results-tree`` entity, as produced by the 
+    template of ``dla_stud/studia/sprawdziany/pokaz``.
+
+    :param items: number of items of the entity.
+    :param seed: seed of the random results.
+    """
+    rng = random.Random(seed)
+
+    return {
+        "entity": "course-results-tree",
+        "items": [{
+            "group": "28-INF-S-DOLI",
+            "subgroup": "Logika dla informatyków",
+            "hierarchy": "/{}/Sprawdzian {}".format(
+                rng.choice(TERMS), index // 10),
+            "item": "Zadanie {}".format(index),
+            "values": ["{:.1f} pkt".format(rng.random() * 100)]
+        } for index in range(items)]
+    }
@@ -0,0 +1,9 @@
+# Query parameters required by the templates, see
+# usos.routing.TemplateRegistry for details.
+ROUTES = {
+    "dla_stud/studia/sprawdziany/pokaz": ["wez_id"],
+}
+
+# Entities uploaded by the templates, see usos.entities.EntityRegistry
+# for details. The built-in entities are declared by default.
+ENTITIES = {}
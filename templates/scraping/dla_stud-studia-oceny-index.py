@@ -1,5 +1,5 @@
 import logging
-from bs4 import BeautifulSoup
+from usos.data import Item
 
 logging = logging.getLogger(__name__)
 
@@ -7,8 +7,8 @@ logging = logging.getLogger(__name__)
 class ScrapingTemplate:
     """Scrapes the specific type of page by using predefined
     set of actions."""
-    def __init__(self, web_driver: object) -> None:
-        self.driver = web_driver
+    def __init__(self, snapshot: object) -> None:
+        self.snapshot = snapshot
         self.results = None
 
     def get_data(self) -> object:
@@ -20,17 +20,18 @@ class ScrapingTemplate:
 
     def _soup(self) -> object:
         """Generates a soup object out of a specific element
-        provided by the web driver."""
-        tree = self.driver.find_element_by_id("tab1")
-        soup = BeautifulSoup(
-            tree.get_attribute("innerHTML"),
-            "html.parser")
+        of the page snapshot."""
+        soup = self.snapshot.parse(select=["#tab1"])
+        container = soup.find(id="tab1")
+        if container is None:
+            raise ValueError("Page '{}' has no grades".format(
+                self.snapshot.url))
 
-        return soup
+        return container
 
     def _parse(self, soup: object) -> None:
         """Initializes parsing of the innerHTML."""
-        parser = Parser(soup=soup, web_driver=self.driver)
+        parser = Parser(soup=soup)
         self.results = {
             "module": __name__,
             "parsed_results": parser.get_parsed_results()
@@ -39,9 +40,8 @@ class ScrapingTemplate:
 
 class Parser:
     """Parses the provided HTML with BeautifulSoup."""
-    def __init__(self, web_driver: object, soup: object) -> None:
+    def __init__(self, soup: object) -> None:
         self.soup = soup
-        self.driver = web_driver
         self.results = []
 
     def get_parsed_results(self) -> list:
@@ -68,12 +68,11 @@ class Parser:
                 grades.append(
                     "".join([grade_title, grade_value]))
 
-            entries.append({
-                "group": semester,
-                "subgroup": course_code,
-                "item": course,
-                "values": grades
-            })
+            entries.append(Item(
+                group=semester,
+                subgroup=course_code,
+                item=course,
+                values=grades))
 
         self._populate_results("final-grades", entries)
 
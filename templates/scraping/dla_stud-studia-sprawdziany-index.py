@@ -1,5 +1,4 @@
 import logging
-from bs4 import BeautifulSoup
 
 logging = logging.getLogger(__name__)
 
@@ -7,8 +6,8 @@ logging = logging.getLogger(__name__)
 class ScrapingTemplate:
     """Scrapes the specific type of page by using predefined
     set of actions."""
-    def __init__(self, web_driver: object) -> None:
-        self.driver = web_driver
+    def __init__(self, snapshot: object) -> None:
+        self.snapshot = snapshot
         self.results = None
 
     def get_data(self) -> object:
@@ -20,17 +19,18 @@ class ScrapingTemplate:
 
     def _soup(self) -> object:
         """Generates a soup object out of a specific element
-        provided by the web driver."""
-        tree = self.driver.find_element_by_id("lista")
-        soup = BeautifulSoup(
-            tree.get_attribute("innerHTML"),
-            "html.parser")
-    
-        return soup
+        of the page snapshot."""
+        soup = self.snapshot.parse(select=["#lista"])
+        container = soup.find(id="lista")
+        if container is None:
+            raise ValueError("Page '{}' has no tests".format(
+                self.snapshot.url))
+
+        return container
 
     def _parse(self, soup: object) -> None:
         """Initializes parsing of the innerHTML."""
-        parser = Parser(soup=soup, web_driver=self.driver)
+        parser = Parser(soup=soup, snapshot=self.snapshot)
         self.results = {
             "module": __name__,
             "new_destinations": parser.get_destinations()
@@ -38,15 +38,15 @@ class ScrapingTemplate:
 
 class Parser:
     """Parses the provided HTML with BeautifulSoup."""
-    def __init__(self, web_driver: object, soup: object) -> None:
+    def __init__(self, snapshot: object, soup: object) -> None:
         self.soup = soup
-        self.driver = web_driver
+        self.snapshot = snapshot
 
     def get_destinations(self) -> list:
         """Returns the results back to the ScrapingTemplate."""
-        links = self.driver.find_elements_by_class_name("fwdlink")
+        links = self.soup.find_all(class_="fwdlink", href=True)
         destinations = []
         for link in links:
-            destinations.append(link.get_attribute("href"))
+            destinations.append(self.snapshot.absolute_url(link["href"]))
 
-        return destinations
\ No newline at end of file
+        return destinations
@@ -1,6 +1,5 @@
-import copy
 import logging
-from bs4 import BeautifulSoup
+from usos.data import Item
 
 logging = logging.getLogger(__name__)
 
@@ -8,8 +7,8 @@ logging = logging.getLogger(__name__)
 class ScrapingTemplate:
     """Scrapes the specific type of page by using predefined
     set of actions."""
-    def __init__(self, web_driver: object) -> None:
-        self.driver = web_driver
+    def __init__(self, snapshot: object) -> None:
+        self.snapshot = snapshot
         self.results = None
 
     def get_data(self) -> object:
@@ -20,17 +19,18 @@ class ScrapingTemplate:
 
     def _soup(self) -> object:
         """Generates a soup object out of a specific element
-        provided by the web driver."""
-        tree = self.driver.find_element_by_id("layout-c22a")
-        soup = BeautifulSoup(
-            tree.get_attribute("innerHTML"),
-            "html.parser")
+        of the page snapshot."""
+        soup = self.snapshot.parse(select=["#layout-c22a"])
+        container = soup.find(id="layout-c22a")
+        if container is None:
+            raise ValueError("Page '{}' has no course results".format(
+                self.snapshot.url))
 
-        return soup
+        return container
 
     def _parse(self, soup: object) -> None:
         """Initializes parsing of the innerHTML."""
-        parser = Parser(soup=soup, web_driver=self.driver)
+        parser = Parser(soup=soup)
         self.results = {
             "module": __name__,
             "parsed_results": parser.get_parsed_results()
@@ -39,9 +39,8 @@ class ScrapingTemplate:
 
 class Parser:
     """Parses the provided HTML with BeautifulSoup."""
-    def __init__(self, web_driver: object, soup: object) -> None:
+    def __init__(self, soup: object) -> None:
         self.soup = soup
-        self.driver = web_driver
         self.results = []
         self._group = None
         self._subgroup = None
@@ -89,13 +88,12 @@ class Parser:
                 and "pokaż szczegóły" not in columns[3].text):
             values.append(self._strip_cell(columns[3].text))
 
-        self._tree_entries.append({
-            "group": self._group,
-            "subgroup": self._subgroup,
-            "hierarchy": hierarchy[2:],
-            "item": title,
-            "values": values
-        })
+        self._tree_entries.append(Item(
+            group=self._group,
+            subgroup=self._subgroup,
+            hierarchy=hierarchy[2:],
+            item=title,
+            values=values))
 
     def _parse_subtree_recursively(self, tree: object,
                                    hierarchy: str) -> dict:
@@ -0,0 +1,47 @@
+import pytest
+from usos.archive import PageArchive, PageNotArchived
+
+DESTINATION = "dla_stud/studia/sprawdziany/pokaz&wez_id=33693"
+
+@pytest.fixture
+def archive(tmpdir):
+    return PageArchive(str(tmpdir.join("archive")))
+
+# recording
+
+def test__archive_record__compressed(archive):
+    filename = archive.record(DESTINATION, "<html>" + "x" * 10000)
+    assert filename.endswith(".html.gz")
+    with open(filename, 'rb') as working_file:
+        assert len(working_file.read()) < 1000
+
+def test__archive_record__destinations(archive):
+    archive.record(DESTINATION, "<html></html>")
+    archive.record("dla_stud/studia/oceny/index", "<html></html>")
+    assert archive.destinations() == [
+        "dla_stud/studia/oceny/index", DESTINATION]
+
+# loading
+
+def test__archive_load__latest(archive):
+    archive.record(DESTINATION, "first", timestamp="20180601T100000000000")
+    archive.record(DESTINATION, "second", timestamp="20180602T100000000000")
+    assert archive.load(DESTINATION) == "second"
+
+def test__archive_load__at_timestamp(archive):
+    archive.record(DESTINATION, "first", timestamp="20180601T100000000000")
+    archive.record(DESTINATION, "second", timestamp="20180602T100000000000")
+    assert archive.load(DESTINATION, at="20180601T235959") == "first"
+
+def test__archive_load__at_date(archive):
+    archive.record(DESTINATION, "first", timestamp="20180601T100000000000")
+    archive.record(DESTINATION, "second", timestamp="20180602T100000000000")
+    assert archive.load(DESTINATION, at="20180601") == "first"
+    assert archive.load(DESTINATION, at="20180602T10") == "second"
+
+def test__archive_load__missing(archive):
+    archive.record(DESTINATION, "first", timestamp="20180601T100000000000")
+    with pytest.raises(PageNotArchived):
+        archive.load(DESTINATION, at="20180501")
+    with pytest.raises(PageNotArchived):
+        archive.load("dla_stud/studia/oceny/index")
@@ -0,0 +1,118 @@
+import time
+import pytest
+import requests
+from usos import authentication
+from usos.authentication import Authentication, Credentials, SessionCache
+
+COOKIES = [
+    {"name": "PHPSESSID", "value": "abc", "domain": "usosweb.uni.wroc.pl",
+     "path": "/"},
+    {"name": "remember", "value": "1", "domain": "usosweb.uni.wroc.pl",
+     "path": "/", "expiry": int(time.time()) + 3600}
+]
+
+@pytest.fixture
+def session_cache(tmpdir):
+    return SessionCache(str(tmpdir.join("sessions")))
+
+# session cache
+
+def test__session_cache__store_and_load(session_cache):
+    session_cache.store("johndoe", "password", COOKIES)
+    assert session_cache.load("johndoe", "password") == COOKIES
+
+def test__session_cache__missing(session_cache):
+    assert session_cache.load("johndoe", "password") == []
+
+def test__session_cache__encrypted_at_rest(session_cache, tmpdir):
+    session_cache.store("johndoe", "password", COOKIES)
+    stored = b"".join(f.read_binary()
+                      for f in tmpdir.join("sessions").listdir())
+    assert b"PHPSESSID" not in stored
+    assert b"johndoe" not in stored
+
+def test__session_cache__changed_password(session_cache):
+    session_cache.store("johndoe", "password", COOKIES)
+    assert session_cache.load("johndoe", "new-password") == []
+
+def test__session_cache__expired_cookies(session_cache):
+    expired = dict(COOKIES[1], expiry=int(time.time()) - 1)
+    session_cache.store("johndoe", "password", [COOKIES[0], expired])
+    assert session_cache.load("johndoe", "password") == [COOKIES[0]]
+
+def test__session_cache__invalidate(session_cache):
+    session_cache.store("johndoe", "password", COOKIES)
+    session_cache.invalidate("johndoe")
+    assert session_cache.load("johndoe", "password") == []
+
+# restoring sessions
+
+ROOT_URL = "https://usosweb.uni.wroc.pl/kontroler.php?_action="
+
+class Driver:
+    def __init__(self):
+        self.visited = []
+        self.cookies = []
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+def probed(monkeypatch, response):
+    requests_made = []
+    def get(url, cookies, timeout):
+        requests_made.append(dict(cookies))
+        if isinstance(response, Exception):
+            raise response
+        return Response(response)
+    monkeypatch.setattr(authentication.requests, "get", get)
+    return requests_made
+
+@pytest.fixture
+def auth(session_cache, monkeypatch):
+    auth = Authentication(
+        credentials=Credentials(username="johndoe", password="password"),
+        root_url=ROOT_URL, web_driver=Driver(), session_cache=session_cache)
+    auth.signed_in = 0
+    def sign_in():
+        auth.signed_in += 1
+        return True
+    monkeypatch.setattr(auth, "sign_in", sign_in)
+    return auth
+
+def test__authentication_restore__valid_session(auth, monkeypatch):
+    auth.session_cache.store("johndoe", "password", COOKIES)
+    requests_made = probed(monkeypatch, "Zalogowany użytkownik: John Doe")
+    assert auth.is_authenticated()
+    assert auth.signed_in == 0
+    assert requests_made == [{"PHPSESSID": "abc", "remember": "1"}]
+    assert auth.driver.visited == [ROOT_URL + "&lang=pl"]
+    assert auth.driver.cookies == COOKIES
+    assert auth.is_authenticated()
+    assert len(requests_made) == 1
+
+def test__authentication_restore__expired_session(auth, monkeypatch):
+    auth.session_cache.store("johndoe", "password", COOKIES)
+    probed(monkeypatch, "<form id='fm1'>zaloguj się</form>")
+    assert auth.is_authenticated()
+    assert auth.signed_in == 1
+    assert auth.driver.cookies == []
+    assert auth.session_cache.load("johndoe", "password") == []
+
+def test__authentication_restore__probe_failed(auth, monkeypatch):
+    auth.session_cache.store("johndoe", "password", COOKIES)
+    probed(monkeypatch, requests.ConnectionError("unreachable"))
+    assert auth.is_authenticated()
+    assert auth.signed_in == 1
+
+def test__authentication_restore__nothing_stored(auth, monkeypatch):
+    requests_made = probed(monkeypatch, "Zalogowany użytkownik: John Doe")
+    assert auth.is_authenticated()
+    assert auth.signed_in == 1
+    assert requests_made == []
@@ -0,0 +1,74 @@
+import json
+import threading
+import pytest
+from contextlib import contextmanager
+from usos.batch import BatchRunner, InvalidAccountsFile, load_accounts
+
+
+class FakePool:
+    def __init__(self, size):
+        self.size = size
+        self.leased = 0
+        self.max_leased = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self):
+        with self._lock:
+            self.leased += 1
+            self.max_leased = max(self.max_leased, self.leased)
+        try:
+            yield "driver"
+        finally:
+            with self._lock:
+                self.leased -= 1
+
+
+def accounts(count):
+    return [{"username": "user{}".format(i), "password": "secret"}
+            for i in range(count)]
+
+# loading accounts
+
+def test__batch_accounts__load(tmpdir):
+    filename = tmpdir.join("accounts.json")
+    filename.write(json.dumps(accounts(2)))
+    assert load_accounts(str(filename)) == accounts(2)
+
+def test__batch_accounts__missing_password(tmpdir):
+    filename = tmpdir.join("accounts.json")
+    filename.write(json.dumps([{"username": "user0"}]))
+    with pytest.raises(InvalidAccountsFile):
+        load_accounts(str(filename))
+
+# running
+
+def test__batch_run__every_account_processed():
+    processed = []
+    runner = BatchRunner(
+        accounts=accounts(10),
+        driver_pool=FakePool(size=3),
+        task=lambda account, driver: processed.append(account["username"]))
+    reports = runner.run()
+    assert sorted(processed) == sorted(a["username"] for a in accounts(10))
+    assert len(reports) == 10
+    assert all(report["succeeded"] for report in reports)
+
+def test__batch_run__bounded_by_pool_size():
+    pool = FakePool(size=2)
+    runner = BatchRunner(
+        accounts=accounts(8), driver_pool=pool,
+        task=lambda account, driver: None)
+    runner.run()
+    assert pool.max_leased <= 2
+
+def test__batch_run__failure_does_not_stop_others():
+    def task(account, driver):
+        if account["username"] == "user1":
+            raise RuntimeError("login failed")
+
+    runner = BatchRunner(
+        accounts=accounts(3), driver_pool=FakePool(size=1), task=task)
+    reports = {r["username"]: r for r in runner.run()}
+    assert not reports["user1"]["succeeded"]
+    assert reports["user0"]["succeeded"] and reports["user2"]["succeeded"]
@@ -1,5 +1,6 @@
 import pytest
-from usos.data import DataController, NotAnEntity
+from usos.data import DataController, Item, NotAnEntity
+from usos.storage import JsonStorage
 
 @pytest.fixture
 def data_controller():
@@ -55,3 +56,189 @@ def test__data_uploads__multiple_no_items(data_controller):
     entities = []
     data_controller.upload_multiple(entities)
     assert len(data_controller._data) == 0
+
+# comparing items
+
+def tree_item(node, values, hierarchy="Exam"):
+    return {
+        "group": "28-INF-S-DOLI",
+        "subgroup": "Logic for Computer Science",
+        "hierarchy": hierarchy,
+        "item": "Test {}".format(node),
+        "values": values
+    }
+
+def items(*dicts):
+    return [Item.from_dict(item) for item in dicts]
+
+def test__data_diff_items__changed_values(data_controller):
+    old = items(tree_item(1, ["1 pkt"]), tree_item(2, ["2 pkt"]))
+    new = items(tree_item(1, ["1 pkt"]), tree_item(2, ["5 pkt"]))
+    results = data_controller._diff_items(old, new)
+    assert [entry.to_dict() for entry in results] == [
+        dict(tree_item(2, ["5 pkt"]), old_values=["2 pkt"], change="changed")]
+    assert new[1].old_values is None
+
+def test__data_diff_items__unchanged(data_controller):
+    old = items(tree_item(1, ["1 pkt"]), tree_item(2, ["2 pkt"]))
+    assert data_controller._diff_items(old, list(reversed(old))) == []
+
+def test__data_diff_items__moved(data_controller):
+    old = items(tree_item(1, ["1 pkt"], hierarchy="Exam"))
+    new = items(tree_item(1, ["2 pkt"], hierarchy="Quiz"))
+    results = data_controller._diff_items(old, new)
+    assert [entry.to_dict() for entry in results] == [
+        dict(tree_item(1, ["2 pkt"], hierarchy="Quiz"), change="moved",
+             old_hierarchy="Exam", old_values=["1 pkt"])]
+
+def test__data_diff_items__exact_match_before_move(data_controller):
+    old = items(tree_item(1, ["1 pkt"], hierarchy="Exam"),
+                tree_item(1, ["1 pkt"], hierarchy="Quiz"))
+    new = items(tree_item(1, ["1 pkt"], hierarchy="Lab"),
+                tree_item(1, ["1 pkt"], hierarchy="Exam"))
+    results = data_controller._diff_items(old, new)
+    assert [(entry.change, entry.old_hierarchy) for entry in results] == [
+        ("moved", "Quiz")]
+
+def test__data_diff_items__hierarchy_ignored_if_missing(data_controller):
+    old = items(tree_item(1, ["1 pkt"]))
+    new = items({key: value for key, value in tree_item(1, ["2 pkt"]).items()
+                 if key != "hierarchy"})
+    results = data_controller._diff_items(old, new)
+    assert results[0]["change"] == "changed"
+    assert results[0]["old_values"] == ["1 pkt"]
+
+def test__data_diff_items__duplicates(data_controller):
+    old = items(tree_item(1, ["1 pkt"]), tree_item(1, ["3 pkt"]),
+                tree_item(1, ["4 pkt"]))
+    new = items(tree_item(1, ["4 pkt"]), tree_item(1, ["5 pkt"]))
+    results = data_controller._diff_items(old, new)
+    assert [(entry.change, entry["values"]) for entry in results] == [
+        ("changed", ["5 pkt"]), ("removed", ["3 pkt"])]
+
+def test__data_diff_items__added_and_removed(data_controller):
+    old = items(tree_item(1, ["1 pkt"]), tree_item(2, ["2 pkt"]))
+    new = items(tree_item(1, ["1 pkt"]), tree_item(3, ["3 pkt"]))
+    results = data_controller._diff_items(old, new)
+    assert [(entry.change, entry.item) for entry in results] == [
+        ("added", "Test 3"), ("removed", "Test 2")]
+    assert "old_values" not in results[1]
+
+# items
+
+def test__data_item__round_trip():
+    item = dict(tree_item(1, ["1 pkt"]), note="extra", change="moved",
+                old_hierarchy="Quiz")
+    assert Item.from_dict(item).to_dict() == item
+
+def test__data_item__read_like_a_dict(monkeypatch):
+    data = dict(tree_item(1, ["1 pkt"]), note="extra")
+    item = Item.from_dict(data)
+    monkeypatch.setattr(Item, "to_dict", None)
+    for name in ["group", "hierarchy", "values", "note", "change",
+                 "old_values", "extra"]:
+        assert (name in item) == (name in data)
+        assert (item[name] if name in item else None) == data.get(name)
+    with pytest.raises(KeyError):
+        item["change"]
+
+def test__data_item__unhashable():
+    with pytest.raises(TypeError):
+        hash(Item(group="2018L", subgroup="Logic", item="Logic", values=[]))
+
+def test__data_item__interned_strings():
+    first, second = [Item(group="".join(["28-INF", "-S-DOLI"]),
+                          subgroup="Logic", item=str(node), values=[])
+                     for node in range(2)]
+    assert first.group is second.group
+    assert not hasattr(first, "__dict__")
+
+# digests
+
+class Dispatcher:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, results):
+        self.sent.append(results)
+
+def analyze(data_dir, entity):
+    data = DataController(dispatcher=Dispatcher(), data_dir=data_dir)
+    data.upload(entity)
+    data.analyze()
+    return data
+
+def test__data_digests__unchanged_entity_skipped(tmpdir, monkeypatch):
+    entity = {"entity": "final-grades", "items": [tree_item(1, ["5"])]}
+    analyze(str(tmpdir), entity)
+    assert tmpdir.join("digests.json").check()
+
+    def fail(*args):
+        raise AssertionError("the entity's file has been accessed")
+    monkeypatch.setattr(JsonStorage, "load", fail)
+    monkeypatch.setattr(JsonStorage, "save", fail)
+    analyze(str(tmpdir), dict(reversed(list(entity.items()))))
+
+def test__data_digests__changed_entity_compared(tmpdir):
+    analyze(str(tmpdir), {"entity": "final-grades",
+                          "items": [tree_item(1, ["4"])]})
+    data = analyze(str(tmpdir), {"entity": "final-grades",
+                                 "items": [tree_item(1, ["5"])]})
+    assert data.results[0]["items"][0]["old_values"] == ["4"]
+    assert len(data.dispatcher.sent) == 1
+
+def test__data_digests__missing_file_not_skipped(tmpdir):
+    entity = {"entity": "final-grades", "items": [tree_item(1, ["5"])]}
+    analyze(str(tmpdir), entity)
+    tmpdir.join("final-grades.json").remove()
+    analyze(str(tmpdir), entity)
+    assert tmpdir.join("final-grades.json").check()
+
+# incremental analysis
+
+def test__data_incremental__compared_on_upload(tmpdir):
+    analyze(str(tmpdir), {"entity": "final-grades",
+                          "items": [tree_item(1, ["4"])]})
+    data = DataController(dispatcher=Dispatcher(), data_dir=str(tmpdir),
+                          incremental=True)
+    data.upload({"entity": "final-grades", "items": [tree_item(1, ["5"])]})
+    data._queue.join()
+    assert data._data == []
+    assert data.results[0]["items"][0]["old_values"] == ["4"]
+    data.analyze()
+    assert data._worker is None
+    assert len(data.dispatcher.sent) == 1
+    assert analyze(str(tmpdir), {"entity": "final-grades",
+                                 "items": [tree_item(1, ["5"])]}).results == []
+
+def test__data_incremental__failure_isolated(tmpdir, monkeypatch):
+    data = DataController(dispatcher=Dispatcher(), data_dir=str(tmpdir),
+                          incremental=True)
+    compare = data._compare
+    def fail(old, new, entity_type=None):
+        if new["entity"] == "course-results-tree":
+            raise KeyError("group")
+        compare(old, new, entity_type)
+    monkeypatch.setattr(data, "_compare", fail)
+    data.upload({"entity": "course-results-tree",
+                 "items": [tree_item(1, ["5"])]})
+    data.upload({"entity": "final-grades", "items": [tree_item(1, ["5"])]})
+    data.analyze()
+    assert [entity["entity"] for entity in data.results] == ["final-grades"]
+    assert data.failed == ["course-results-tree"]
+
+def test__data_incremental__failed_entity_retried(tmpdir, monkeypatch):
+    entity = {"entity": "final-grades", "items": [tree_item(1, ["5"])]}
+    data = DataController(dispatcher=Dispatcher(), data_dir=str(tmpdir),
+                          incremental=True)
+    def fail(key, entity):
+        raise OSError("disk full")
+    monkeypatch.setattr(data.storage, "save", fail)
+    data.upload(entity)
+    data.analyze()
+    assert data.results == []
+    assert data.failed == ["final-grades"]
+    assert data.dispatcher.sent == []
+    monkeypatch.undo()
+    data = analyze(str(tmpdir), entity)
+    assert data.results[0]["entity"] == "final-grades"
@@ -0,0 +1,44 @@
+import sys
+import types
+from usos.data import Item
+from usos.entities import EntityRegistry, EntityType
+
+def item(group, node, **extra):
+    return Item(group=group, subgroup="Logic", item="Test {}".format(node),
+                values=[], extra=extra)
+
+def test__entities__course_tree_sharded_by_course():
+    entity_type = EntityRegistry().get("course-results-tree")
+    entity = {"entity": "course-results-tree",
+              "items": [item("28-INF-S-DOLI", 1), item("28-INF-S-AM", 1),
+                        item("28-INF-S-DOLI", 2)]}
+    shards = entity_type.shards(entity)
+    assert [key for key, _ in shards] == ["courses/28-inf-s-doli",
+                                          "courses/28-inf-s-am"]
+    assert [len(shard["items"]) for _, shard in shards] == [2, 1]
+    assert shards[0][1]["entity"] == "course-results-tree"
+
+def test__entities__undeclared_stored_whole():
+    registry = EntityRegistry(package="missing.package")
+    assert registry.get("exam-schedule").shards(
+        {"entity": "exam-schedule", "items": []})[0][0] \
+        == "entities/exam-schedule"
+    assert registry.get("final-grades").storage_key() == "final-grades"
+
+def test__entities__shard_key_sanitized():
+    entity_type = EntityType("exam-schedule", shard_by="group")
+    assert entity_type.storage_key("../Inf S") == (
+        "entities/exam-schedule/.._inf_s")
+
+def test__entities__custom_identity():
+    entity_type = EntityType("exam-schedule", identity=("group", "room"))
+    assert entity_type.key(item("28-INF-S-DOLI", 1, room="A1"),
+                           hierarchy=False) == ("28-INF-S-DOLI", "A1")
+
+def test__entities__declared_by_package(monkeypatch):
+    package = types.ModuleType("declared_templates")
+    package.ENTITIES = {"exam-schedule": {"shard_by": "group"}}
+    monkeypatch.setitem(sys.modules, "declared_templates", package)
+    entity_type = EntityRegistry(package="declared_templates").get(
+        "exam-schedule")
+    assert entity_type.layout == "entities/{entity}/{shard}"
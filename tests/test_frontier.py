@@ -0,0 +1,98 @@
+import threading
+import pytest
+from usos.frontier import Frontier
+
+def drain(frontier):
+    visited = []
+    while True:
+        entry = frontier.get()
+        if entry is None:
+            return visited
+        visited.append(entry)
+        frontier.task_done()
+
+# discovering
+
+def test__frontier_put__deduplicates():
+    frontier = Frontier()
+    assert frontier.put("dla_stud/studia/oceny/index")
+    assert not frontier.put("dla_stud/studia/oceny/index")
+    assert len(frontier) == 1
+
+def test__frontier_put__visited_not_requeued():
+    frontier = Frontier()
+    frontier.put("dla_stud/studia/oceny/index")
+    drain(frontier)
+    assert not frontier.put("dla_stud/studia/oceny/index")
+    assert frontier.visited == {"dla_stud/studia/oceny/index"}
+
+def test__frontier_put__max_depth():
+    frontier = Frontier(max_depth=1)
+    assert frontier.put("a", depth=1)
+    assert not frontier.put("b", depth=2)
+
+def test__frontier_put__max_pages():
+    frontier = Frontier(max_pages=2)
+    assert frontier.put("a") and frontier.put("b")
+    assert not frontier.put("c")
+
+# ordering
+
+def test__frontier_get__priorities_then_depth_then_order():
+    frontier = Frontier(priorities={"dla_stud/studia/oceny": 0})
+    frontier.put("dla_stud/studia/sprawdziany/pokaz&wez_id=2", depth=1)
+    frontier.put("dla_stud/studia/sprawdziany/index")
+    frontier.put("dla_stud/studia/sprawdziany/pokaz&wez_id=1", depth=1)
+    frontier.put("dla_stud/studia/oceny/index")
+    assert [destination for destination, _ in drain(frontier)] == [
+        "dla_stud/studia/oceny/index",
+        "dla_stud/studia/sprawdziany/index",
+        "dla_stud/studia/sprawdziany/pokaz&wez_id=2",
+        "dla_stud/studia/sprawdziany/pokaz&wez_id=1",
+    ]
+
+def test__frontier_get__waits_for_workers_discovering_links():
+    frontier = Frontier()
+    frontier.put("index")
+    visited = []
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            entry = frontier.get()
+            if entry is None:
+                return
+            destination, depth = entry
+            if destination == "index":
+                for i in range(20):
+                    frontier.put("page{}".format(i), depth + 1)
+            with lock:
+                visited.append(destination)
+            frontier.task_done()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(visited) == 21
+
+# snapshots
+
+def test__frontier_snapshot__restores_discovered(tmpdir):
+    snapshot = str(tmpdir.join("frontier.json"))
+    frontier = Frontier(snapshot=snapshot)
+    frontier.put("index")
+    frontier.put("page", depth=1)
+    drain(frontier)
+    frontier.save()
+
+    restored = Frontier(snapshot=snapshot)
+    restored.put("index")
+    assert restored.restore() == 1
+    assert drain(restored) == [("index", 0), ("page", 1)]
+
+def test__frontier_snapshot__missing_file(tmpdir):
+    frontier = Frontier(snapshot=str(tmpdir.join("missing.json")))
+    assert frontier.restore() == 0
@@ -0,0 +1,101 @@
+import os
+import pytest
+from usos.history import ChangeLog
+
+def results(*items):
+    return [{
+        "entity": "course-results-tree",
+        "items": [{
+            "group": group,
+            "subgroup": "Course",
+            "hierarchy": "Exam",
+            "item": item,
+            "values": [value]
+        } for group, item, value in items]
+    }]
+
+@pytest.fixture
+def history(tmpdir):
+    return ChangeLog(str(tmpdir.join("history")), compact_every=3)
+
+# logging
+
+def test__history_append__one_line_per_change(history):
+    assert history.append(results(("A", "Task 1", "1"), ("B", "Task 1", "2")),
+                          timestamp="20180601T100000000000") == 2
+    with open(history.log_file) as working_file:
+        assert len(working_file.readlines()) == 2
+
+def test__history_append__after_torn_line(history):
+    history.append(results(("A", "Task 1", "1")))
+    with open(history.log_file, 'a') as working_file:
+        working_file.write('{"at": "2018')
+    assert history.append(results(("A", "Task 2", "1"))) == 1
+    assert [change["item"]["item"] for change in history.changes("A")] == [
+        "Task 1", "Task 2"]
+
+def test__history_append__does_not_compact(history):
+    history.append(results(("A", "Task 1", "1"), ("B", "Task 1", "2")),
+                   timestamp="20180601T100000000000")
+    history.append(results(("A", "Task 2", "3")),
+                   timestamp="20180602T100000000000")
+    assert history.compaction_due()
+    assert not os.path.exists(history.snapshot_dir)
+    assert len(history.changes("A")) == 2
+
+def test__history_compact__snapshot_per_course(history):
+    history.append(results(("A", "Task 1", "1"), ("B", "Task 1", "2")),
+                   timestamp="20180601T100000000000")
+    history.append(results(("A", "Task 2", "3")),
+                   timestamp="20180602T100000000000")
+    history.compact()
+    assert not history.compaction_due()
+    with open(history.log_file) as working_file:
+        assert working_file.read() == ""
+    assert sorted(os.listdir(history.snapshot_dir)) == ["a.json", "b.json"]
+    os.remove(os.path.join(history.snapshot_dir, "b.json"))
+    assert [change["item"]["item"] for change in history.changes("A")] == [
+        "Task 1", "Task 2"]
+
+def test__history_compact__shared_snapshot(history):
+    history.append(results(("A 1", "Task 1", "1"), ("A_1", "Task 2", "2")),
+                   timestamp="20180601T100000000000")
+    history.compact()
+    assert os.listdir(history.snapshot_dir) == ["a_1.json"]
+    assert [change["item"]["item"] for change in history.changes("A 1")] == [
+        "Task 1"]
+    assert [change["item"]["item"] for change in history.changes("A_1")] == [
+        "Task 2"]
+
+def test__history_compact__interrupted(history):
+    history.append(results(("A", "Task 1", "1")),
+                   timestamp="20180601T100000000000")
+    with open(history.log_file) as working_file:
+        logged = working_file.read()
+    history.compact()
+    with open(history.log_file, 'w') as working_file:
+        working_file.write(logged)
+    assert len(history.changes("A")) == 1
+    history.compact()
+    assert len(history.changes("A")) == 1
+
+# querying
+
+def test__history_changes__dates(history):
+    for day in ["01", "02", "03", "04"]:
+        history.append(results(("A", "Task 1", day)),
+                       timestamp="201806{}T100000000000".format(day))
+    changes = history.changes("A", since="20180602", until="20180603")
+    assert [change["item"]["values"] for change in changes] == [
+        ["02"], ["03"]]
+
+def test__history_first_seen(history):
+    history.append(results(("A", "Task 1", "1")),
+                   timestamp="20180601T100000000000")
+    history.append(results(("A", "Task 2", "1"), ("A", "Task 1", "2")),
+                   timestamp="20180605T100000000000")
+    assert history.first_seen("A", "Task 1", "Exam") == (
+        "20180601T100000000000")
+    assert history.first_seen("A", "Task 2", "Exam") == (
+        "20180605T100000000000")
+    assert history.first_seen("B", "Task 1", "Exam") is None
@@ -0,0 +1,152 @@
+import time
+import socket
+import smtplib
+import threading
+import pytest
+from aiosmtpd.controller import Controller
+from usos import notifications
+from usos.notifications import Dispatcher, Email, Notification, SmtpSession
+
+class Instant(Notification):
+    def _render(self):
+        self._rendered_template = "rendered"
+
+    def _send(self):
+        return True
+
+class Hanging(Instant):
+    released = threading.Event()
+
+    def _send(self):
+        self.released.wait(5)
+        return True
+
+class Broken(Instant):
+    def _send(self):
+        raise ConnectionError("connection refused")
+
+def dispatcher(monkeypatch, tmpdir, channels, config=None, timeout=5):
+    for channel in [Instant, Hanging, Broken]:
+        monkeypatch.setattr(notifications, channel.__name__, channel,
+                            raising=False)
+    config_file = tmpdir.join("notifications.json")
+    config_file.write(notifications.json.dumps(config or {}))
+    return Dispatcher(channels=channels, enable=True,
+                      config_file=str(config_file), timeout=timeout)
+
+def test__dispatcher__statuses(monkeypatch, tmpdir):
+    statuses = dispatcher(monkeypatch, tmpdir, "Instant Broken").send({})
+    assert statuses == {"Instant": "sent", "Broken": "failed"}
+
+def test__dispatcher__channel_timeout(monkeypatch, tmpdir):
+    Hanging.released.clear()
+    started = time.monotonic()
+    statuses = dispatcher(monkeypatch, tmpdir, "Hanging Instant",
+                          config={"Hanging": {"timeout": 0.1}}).send({})
+    Hanging.released.set()
+    assert statuses == {"Hanging": "timeout", "Instant": "sent"}
+    assert time.monotonic() - started < 1
+
+def test__dispatcher__disabled(tmpdir):
+    assert Dispatcher(channels="Email", enable=False,
+                      config_file=str(tmpdir.join("missing.json"))).send(
+                          {}) == {"Email": "disabled"}
+
+def test__templates__compiled_once(monkeypatch, tmpdir):
+    tmpdir.join("Message.html").write("{{ data|length }} changes")
+    monkeypatch.setattr(notifications, "_environments", {})
+    template = notifications.get_template("Message.html", str(tmpdir))
+    assert template.render(data=[1, 2]) == "2 changes"
+    assert notifications.get_template("Message.html", str(tmpdir)) \
+        is template
+
+def test__templates__bytecode_cache(monkeypatch, tmpdir):
+    tmpdir.join("Message.html").write("{{ data|length }} changes")
+    monkeypatch.setattr(notifications, "_environments", {})
+    monkeypatch.setattr(notifications, "_bytecode_cache", None)
+    notifications.set_bytecode_cache(str(tmpdir.join("cache")))
+    notifications.get_template("Message.html", str(tmpdir))
+    assert len(tmpdir.join("cache").listdir()) == 1
+
+# smtp
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.rcpt_tos)
+        self.sessions.add(id(session))
+        return "250 OK"
+
+@pytest.fixture
+def inbox():
+    with socket.socket() as free:
+        free.bind(("127.0.0.1", 0))
+        port = free.getsockname()[1]
+    controller = Controller(Inbox(), hostname="127.0.0.1", port=port)
+    controller.start()
+    controller.handler.port = port
+    yield controller.handler
+    controller.stop()
+
+def email(inbox, recipients, **config):
+    config = dict({
+        "mail_sender": "usos@example.com",
+        "mail_recipient": recipients,
+        "mail_subject": "Changes",
+        "smtp_host": "127.0.0.1",
+        "smtp_port": inbox.port,
+    }, **config)
+    return Email(data=[], config=config)
+
+def test__smtp__fan_out_single_handshake(inbox):
+    recipients = ["{}@example.com".format(name) for name in "abcde"]
+    mail = email(inbox, recipients)
+    mail._rendered_template = "<p>5 changes</p>"
+    assert mail.send()
+    assert mail.send()
+    assert inbox.messages == [[recipient] for recipient in recipients] * 2
+    assert len(inbox.sessions) == 1
+    notifications.close_smtp_sessions()
+
+def test__smtp__max_messages_per_connection(inbox):
+    mail = email(inbox, ["a@example.com", "b@example.com", "c@example.com"],
+                 smtp_max_messages=2)
+    mail._rendered_template = "<p>3 changes</p>"
+    assert mail.send()
+    assert len(inbox.sessions) == 2
+    notifications.close_smtp_sessions()
+
+def test__smtp__reconnects_when_dropped(inbox):
+    session = SmtpSession(lambda: smtplib.SMTP("127.0.0.1", inbox.port))
+    mail = email(inbox, "a@example.com")
+    mail._rendered_template = "<p>1 change</p>"
+    assert session.send(mail._message("a@example.com"))
+    session._connection.close()
+    assert session.send(mail._message("b@example.com"))
+    assert session.handshakes == 2
+    assert len(inbox.messages) == 2
+    session.close()
+
+def test__smtp__does_not_reconnect_on_refusal(inbox):
+    class Refusing:
+        def send_message(self, message):
+            raise smtplib.SMTPDataError(554, "Rejected")
+        def quit(self):
+            pass
+    connections = []
+    session = SmtpSession(lambda: connections.append(Refusing())
+                          or connections[-1])
+    mail = email(inbox, "a@example.com")
+    mail._rendered_template = "<p>1 change</p>"
+    assert not session.send(mail._message("a@example.com"))
+    assert session.handshakes == 1
+
+def test__smtp__close_skips_busy_session():
+    session = SmtpSession(lambda: None)
+    session._lock.acquire()
+    assert not session.close(timeout=0.01)
+    session._lock.release()
+    assert session.close(timeout=0.01)
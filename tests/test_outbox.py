@@ -0,0 +1,232 @@
+import json
+import time
+import sqlite3
+import threading
+import pytest
+from usos import notifications
+from usos.data import DataController
+from usos.entities import EntityRegistry, EntityType
+from usos.notifications import Dispatcher, Notification
+from usos.outbox import Outbox, coalesce
+
+class Recorded(Notification):
+    delivered = []
+    active = []
+    lock = threading.Lock()
+
+    def _render(self):
+        self._rendered_template = json.dumps(self.data)
+
+    def _send(self):
+        with self.lock:
+            self.active.append(1)
+            overlapping = len(self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active.pop()
+            self.delivered.append((self.data, overlapping))
+        return True
+
+class Failing(Recorded):
+    def _send(self):
+        return False
+
+RESULTS = [{"entity": "final-grades", "items": [{"item": "Logic"}]}]
+
+@pytest.fixture
+def dispatcher(monkeypatch, tmpdir):
+    Recorded.delivered.clear()
+    for channel in [Recorded, Failing]:
+        monkeypatch.setattr(notifications, channel.__name__, channel,
+                            raising=False)
+    def create(channels, config=None):
+        config_file = tmpdir.join("notifications.json")
+        config_file.write(json.dumps(config or {}))
+        return Dispatcher(channels=channels, enable=True,
+                          config_file=str(config_file))
+    return create
+
+@pytest.fixture
+def outbox(tmpdir):
+    outbox = Outbox(str(tmpdir.join("outbox.sqlite3")), max_attempts=3,
+                    backoff=10)
+    yield outbox
+    outbox.close()
+
+def test__outbox__delivered(outbox, dispatcher):
+    assert outbox.enqueue(RESULTS, dispatcher("Recorded Failing")) == 2
+    assert outbox.drain() == {"sent": 1, "retried": 1, "dead": 0}
+    assert [data for data, _ in Recorded.delivered] == [RESULTS]
+    assert outbox.pending() == 1
+
+def test__outbox__backoff_and_dead_letters(outbox, dispatcher):
+    outbox.enqueue(RESULTS, dispatcher("Failing"), now=0)
+    assert outbox.drain(now=0)["retried"] == 1
+    assert outbox.drain(now=9) == {"sent": 0, "retried": 0, "dead": 0}
+    assert outbox.drain(now=10)["retried"] == 1
+    assert outbox.drain(now=29) == {"sent": 0, "retried": 0, "dead": 0}
+    assert outbox.drain(now=30)["dead"] == 1
+    assert outbox.pending() == 0
+    assert outbox.dead() == [{"id": 1, "channel": "Failing", "attempts": 3,
+                              "last_error": "failed via Failing"}]
+
+def test__outbox__retries_failed_recipients(outbox, dispatcher,
+                                            monkeypatch):
+    class Recipients(Recorded):
+        RECIPIENTS = "to"
+        def _send(self):
+            self.delivered.append((self.config["to"], 1))
+            return self.config["to"] != "b@example.com"
+    monkeypatch.setattr(notifications, "Recipients", Recipients,
+                        raising=False)
+    channels = dispatcher("Recipients", {"Recipients": {
+        "to": ["a@example.com", "b@example.com"]}})
+    assert outbox.enqueue(RESULTS, channels, now=0) == 2
+    assert outbox.drain(now=0) == {"sent": 1, "retried": 1, "dead": 0}
+    assert outbox.drain(now=10) == {"sent": 0, "retried": 1, "dead": 0}
+    assert sorted(to for to, _ in Recorded.delivered) == [
+        "a@example.com", "b@example.com", "b@example.com"]
+
+def test__outbox__channel_timeout(tmpdir, dispatcher):
+    outbox = Outbox(str(tmpdir.join("outbox.sqlite3")), timeout=5)
+    config_file = dispatcher("Recorded").config_file
+    assert outbox._dispatcher(config_file).timeout == 5
+    outbox.close()
+
+def test__outbox__leased_while_delivered(outbox, dispatcher, monkeypatch):
+    concurrent = []
+    class Draining(Recorded):
+        def _send(self):
+            other = Outbox(outbox.database)
+            concurrent.append(other.drain())
+            other.close()
+            return True
+    monkeypatch.setattr(notifications, "Draining", Draining, raising=False)
+    outbox.enqueue(RESULTS, dispatcher("Draining"))
+    assert outbox.drain()["sent"] == 1
+    assert concurrent == [{"sent": 0, "retried": 0, "dead": 0}]
+
+def test__outbox__channel_concurrency(outbox, dispatcher):
+    channels = dispatcher("Recorded", {"Recorded": {"concurrency": 2}})
+    for _ in range(6):
+        outbox.enqueue(RESULTS, channels)
+    assert outbox.drain()["sent"] == 6
+    assert max(overlapping for _, overlapping in Recorded.delivered) == 2
+
+def test__outbox__data_controller_enqueues(outbox, dispatcher, tmpdir):
+    channels = dispatcher("Recorded")
+    data = DataController(dispatcher=channels, data_dir=str(tmpdir),
+                          outbox=outbox)
+    data.upload({"entity": "final-grades", "items": [
+        {"group": "2018L", "subgroup": "Logic", "item": "Logic",
+         "values": ["5"]}]})
+    data.analyze()
+    assert Recorded.delivered == []
+    assert outbox.pending() == 1
+    outbox.drain()
+    assert Recorded.delivered[0][0][0]["entity"] == "final-grades"
+
+# coalescing
+
+def grade(values, old_values=None, change="changed", course="Logic",
+          **extra):
+    item = dict({"group": "2018L", "subgroup": course, "item": course,
+                 "values": values, "change": change}, **extra)
+    if old_values is not None:
+        item["old_values"] = old_values
+    return item
+
+def grades(*items):
+    return [{"entity": "final-grades", "items": list(items)}]
+
+def test__coalesce__earliest_old_latest_values():
+    merged = coalesce(grades(grade(["3"], ["2"]), grade(["5"], ["4"],
+                                                        course="Algebra")),
+                      grades(grade(["4"], ["3"])))
+    assert merged == grades(grade(["4"], ["2"]),
+                            grade(["5"], ["4"], course="Algebra"))
+
+def test__coalesce__reverted_and_transient_items_dropped():
+    merged = coalesce(
+        grades(grade(["3"], ["2"]),
+               grade(["5"], change="added", course="Algebra")),
+        grades(grade(["2"], ["3"]),
+               grade(["5"], change="removed", course="Algebra")))
+    assert merged == []
+
+def test__coalesce__moved_then_changed():
+    course = {"group": "28-INF-S-DOLI", "subgroup": "Logic",
+              "item": "Test 1"}
+    merged = coalesce(
+        [{"entity": "course-results-tree", "items": [dict(
+            course, hierarchy="Quiz", old_hierarchy="Exam", values=["1"],
+            change="moved")]}],
+        [{"entity": "course-results-tree", "items": [dict(
+            course, hierarchy="Quiz", values=["2"], old_values=["1"],
+            change="changed"), dict(course, group="28-INF-S-AM",
+                                    values=["3"], change="added")]}])
+    assert merged == [
+        {"entity": "course-results-tree", "items": [dict(
+            course, hierarchy="Quiz", old_hierarchy="Exam", values=["2"],
+            old_values=["1"], change="moved")]},
+        {"entity": "course-results-tree", "items": [dict(
+            course, group="28-INF-S-AM", values=["3"], change="added")]}]
+
+def test__outbox__window_merges_changes(tmpdir, dispatcher):
+    outbox = Outbox(str(tmpdir.join("outbox.sqlite3")), account="anna",
+                    window=3600)
+    channels = dispatcher("Recorded")
+    outbox.enqueue(grades(grade(["3"], ["2"])), channels, now=0)
+    outbox.enqueue(grades(grade(["4"], ["3"])), channels, now=1800)
+    assert outbox.drain(now=1800)["sent"] == 0
+    assert outbox.drain(now=3600)["sent"] == 1
+    assert Recorded.delivered[0][0] == grades(grade(["4"], ["2"]))
+    outbox.enqueue(grades(grade(["5"], ["4"])), channels, now=3600)
+    assert outbox.pending() == 1
+    outbox.close()
+
+def test__outbox__window_per_account(tmpdir, dispatcher):
+    channels = dispatcher("Recorded")
+    for account in ["anna", "john"]:
+        outbox = Outbox(str(tmpdir.join("outbox.sqlite3")),
+                        account=account, window=3600)
+        outbox.enqueue(grades(grade(["3"], ["2"])), channels, now=0)
+    assert outbox.pending() == 2
+    outbox.close()
+
+def test__outbox__migrates_databases_without_accounts(tmpdir, dispatcher):
+    database = str(tmpdir.join("outbox.sqlite3"))
+    connection = sqlite3.connect(database)
+    connection.executescript("""
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY,
+            config_file TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            last_error TEXT
+        );
+        INSERT INTO messages (config_file, channel, payload, next_attempt)
+            VALUES ('notifications.json', 'Recorded', '[]', 0);
+    """)
+    connection.close()
+    outbox = Outbox(database, account="anna", window=3600)
+    outbox.enqueue(grades(grade(["3"], ["2"])), dispatcher("Recorded"), now=0)
+    assert outbox.pending() == 2
+    outbox.close()
+
+def test__coalesce__items_sharing_identifiers_kept():
+    merged = coalesce(grades(grade(["3"], change="added"),
+                             grade(["4"], change="added")),
+                      grades(grade(["5"], ["3"])))
+    assert merged == grades(grade(["5"], change="added"),
+                            grade(["4"], change="added"))
+
+def test__coalesce__entity_identity():
+    entities = EntityRegistry(package="missing.package")
+    entities.register(EntityType("final-grades", identity=("item",)))
+    merged = coalesce(grades(grade(["3"], ["2"])),
+                      grades(grade(["4"], ["3"], group="2019Z")), entities)
+    assert merged == grades(grade(["4"], ["2"], group="2019Z"))
@@ -0,0 +1,69 @@
+import pytest
+from usos import parsing
+
+pytest.importorskip("lxml")
+
+PAGE = ('<div id="layout"><h1>Course</h1><p class="note">skipped</p>'
+        '<table id="drzewo"><tr><td>Exam</td></tr>'
+        '<tr><td><table><tr><td>nested</td></tr></table></td></tr>'
+        '</table></div>')
+
+# selectors
+
+def test__parsing_split_selector__tag_and_id():
+    assert parsing._split_selector("div#drzewo") == ("div", "drzewo", None)
+
+def test__parsing_split_selector__class():
+    assert parsing._split_selector(".fwdlink") == (None, None, "fwdlink")
+
+# parsing
+
+@pytest.mark.parametrize("backend", parsing.BACKENDS)
+def test__parsing_parse__whole_document(backend):
+    soup = parsing.parse(PAGE, backend=backend)
+    assert soup.find("p", class_="note").text == "skipped"
+
+@pytest.mark.parametrize("backend", parsing.BACKENDS)
+def test__parsing_parse__same_results(backend):
+    soup = parsing.parse(PAGE, select=["h1", "#drzewo"], backend=backend)
+    assert soup.find("h1").text == "Course"
+    assert [td.text for td in soup.find(id="drzewo").find_all("td")] == [
+        "Exam", "nested", "nested"]
+
+def test__parsing_parse__selector_skips_the_rest():
+    soup = parsing.parse(PAGE, select=["h1", "#drzewo"], backend="selector")
+    assert soup.find("p") is None
+    assert len(soup.find_all("table", id="drzewo")) == 1
+
+def test__parsing_parse__nested_selected_once():
+    soup = parsing.parse(PAGE, select=["table"], backend="selector")
+    assert len(soup.find_all("table")) == 2
+
+def test__parsing_parse__unknown_backend():
+    with pytest.raises(parsing.UnknownBackend):
+        parsing.parse(PAGE, backend="html5")
+
+def test__parsing_parse__selector_requires_lxml(monkeypatch):
+    monkeypatch.setattr(parsing, "lxml", None)
+    with pytest.raises(parsing.UnknownBackend):
+        parsing.parse(PAGE, select=["h1"], backend="selector")
+
+# snapshots
+
+def test__parsing_snapshot__absolute_url():
+    snapshot = parsing.Snapshot(
+        "https://usosweb.uni.wroc.pl/kontroler.php"
+        "?_action=dla_stud/studia/sprawdziany/index", "")
+    assert snapshot.absolute_url(
+        "kontroler.php?_action=dla_stud/studia/sprawdziany/pokaz"
+        "&wez_id=1") == ("https://usosweb.uni.wroc.pl/kontroler.php"
+                         "?_action=dla_stud/studia/sprawdziany/pokaz"
+                         "&wez_id=1")
+
+def test__parsing_snapshot__take():
+    class Driver:
+        current_url = "https://usosweb.uni.wroc.pl/"
+        page_source = PAGE
+    snapshot = parsing.Snapshot.take(Driver())
+    assert snapshot.url == Driver.current_url
+    assert snapshot.parse(select=["h1"]).find("h1").text == "Course"
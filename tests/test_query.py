@@ -0,0 +1,94 @@
+import os
+import pytest
+from usos.query import ResultIndex
+from usos.storage import JsonStorage, SqliteStorage
+
+def course(group, *values, hierarchy="Exam"):
+    return {
+        "entity": "course-results-tree",
+        "items": [{
+            "group": group,
+            "subgroup": "Logic for Computer Science",
+            "hierarchy": hierarchy,
+            "item": "Task {}".format(index),
+            "values": [value]
+        } for index, value in enumerate(values)]
+    }
+
+def grades(semester, *courses):
+    return {
+        "entity": "final-grades",
+        "items": [{"group": semester, "subgroup": code, "item": code,
+                   "values": ["5"]} for code in courses]
+    }
+
+def store(storage, key, entity):
+    storage.save(key, entity)
+    storage.save_digests(dict(storage.load_digests(), **{key: str(entity)}))
+    storage.commit()
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(request, tmpdir):
+    if request.param == "json":
+        yield JsonStorage(str(tmpdir.join("data")))
+    else:
+        storage = SqliteStorage(str(tmpdir.join("usos.sqlite3")), "anna")
+        yield storage
+        storage.close()
+
+def test__query__by_group(storage):
+    store(storage, "final-grades", grades("2018L", "28-INF-S-DOLI", "28-AM"))
+    store(storage, "courses/28-inf-s-doli", course("28-INF-S-DOLI", "1 pkt"))
+    index = ResultIndex(storage)
+    assert [item["item"] for item in index.query(group="2018L")] == [
+        "28-INF-S-DOLI", "28-AM"]
+    assert [item["entity"] for item in index.query(
+        group="28-INF-S-DOLI", hierarchy="Exam")] == ["course-results-tree"]
+    assert index.query(group="28-INF-S-DOLI", hierarchy="Quiz") == []
+    assert len(index.query(entity="final-grades")) == 2
+
+def test__query__only_modified_reloaded(storage):
+    store(storage, "courses/a", course("A", "1 pkt"))
+    store(storage, "courses/b", course("B", "1 pkt"))
+    index = ResultIndex(storage)
+    assert index.refresh() == 2
+    assert index.refresh() == 0
+    store(storage, "courses/b", course("B", "2 pkt"))
+    if isinstance(storage, JsonStorage):
+        filename = storage.filename("courses/b")
+        os.utime(filename, ns=(0, os.stat(filename).st_mtime_ns + 1))
+    assert index.refresh() == 1
+    assert index.query(group="B")[0]["values"] == ["2 pkt"]
+
+def test__query__cache_kept_between_runs(tmpdir, monkeypatch):
+    storage = JsonStorage(str(tmpdir.join("data")))
+    store(storage, "courses/a", course("A", "1 pkt"))
+    cache = str(tmpdir.join("data", "index.json"))
+    ResultIndex(storage, cache=cache).query(group="A")
+    assert storage.keys() == ["courses/a"]
+
+    def fail(*args):
+        raise AssertionError("an unchanged entity has been loaded")
+    monkeypatch.setattr(JsonStorage, "load", fail)
+    assert len(ResultIndex(storage, cache=cache).query(group="A")) == 1
+
+def test__query__removed_entity_dropped(tmpdir):
+    storage = JsonStorage(str(tmpdir.join("data")))
+    store(storage, "entities/exam-schedule", course("A", "1 pkt"))
+    index = ResultIndex(storage)
+    assert len(index.query(group="A")) == 1
+    os.remove(storage.filename("entities/exam-schedule"))
+    assert index.query(group="A") == []
+
+def test__query__index_kept_between_runs(tmpdir, monkeypatch):
+    storage = SqliteStorage(str(tmpdir.join("usos.sqlite3")), "anna")
+    store(storage, "courses/a", course("A", "1 pkt"))
+    cache = str(tmpdir.join("index", "anna.json"))
+    ResultIndex(storage, cache=cache).query(group="A")
+
+    def fail(*args):
+        raise AssertionError("the index has been built again")
+    monkeypatch.setattr(ResultIndex, "_reindex", fail)
+    monkeypatch.setattr(SqliteStorage, "modified", fail)
+    assert len(ResultIndex(storage, cache=cache).query(group="A")) == 1
+    storage.close()
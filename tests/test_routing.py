@@ -0,0 +1,58 @@
+import pytest
+from usos.routing import TemplateRegistry
+
+TEMPLATE = """
+class ScrapingTemplate:
+    name = "{}"
+"""
+
+@pytest.fixture
+def registry(tmpdir, monkeypatch):
+    package = tmpdir.mkdir("routing_templates")
+    package.join("__init__.py").write(
+        'ROUTES = {"dla_stud/studia/sprawdziany/pokaz": ["wez_id"]}\n')
+    for name in ["dla_stud-studia-oceny-index",
+                 "dla_stud-studia-sprawdziany-pokaz"]:
+        package.join(name + ".py").write(TEMPLATE.format(name))
+    monkeypatch.syspath_prepend(str(tmpdir))
+    return TemplateRegistry(package="routing_templates")
+
+# route table
+
+def test__routing_table__built_from_package(registry):
+    patterns = [route.pattern for route in registry.routes()]
+    assert patterns == [
+        "dla_stud/studia/oceny/index",
+        "dla_stud/studia/sprawdziany/pokaz&wez_id=*"
+    ]
+
+def test__routing_table__lazy_import(registry):
+    assert not any(route.loaded for route in registry.routes())
+    registry.resolve("dla_stud/studia/oceny/index")
+    loaded = [route.pattern for route in registry.routes() if route.loaded]
+    assert loaded == ["dla_stud/studia/oceny/index"]
+
+# resolving
+
+def test__routing_resolve__action(registry):
+    template = registry.resolve("dla_stud/studia/oceny/index")
+    assert template.name == "dla_stud-studia-oceny-index"
+
+def test__routing_resolve__required_parameter(registry):
+    template = registry.resolve(
+        "dla_stud/studia/sprawdziany/pokaz&wez_id=33693")
+    assert template.name == "dla_stud-studia-sprawdziany-pokaz"
+    assert registry.resolve("dla_stud/studia/sprawdziany/pokaz") is None
+
+def test__routing_resolve__missing_template_cached(registry):
+    assert registry.resolve("dla_stud/studia/plan/index") is None
+    assert ("dla_stud/studia/plan/index", frozenset()) in registry._cache
+
+def test__routing_resolve__more_specific_route_first(registry):
+    registry.register("dla_stud/studia/oceny/index",
+                      "routing_templates.dla_stud-studia-sprawdziany-pokaz",
+                      parameters=["tab"])
+    assert (registry.resolve("dla_stud/studia/oceny/index&tab=2").name
+            == "dla_stud-studia-sprawdziany-pokaz")
+    assert (registry.resolve("dla_stud/studia/oceny/index").name
+            == "dla_stud-studia-oceny-index")
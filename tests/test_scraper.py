@@ -0,0 +1,97 @@
+import time
+import threading
+import pytest
+from usos.frontier import Frontier
+from usos.scraper import Scraper
+
+ROOT_URL = "https://usosweb.uni.wroc.pl/kontroler.php?_action="
+
+class Driver:
+    instances = []
+
+    def __init__(self):
+        self.current_url = None
+        self.page_source = ""
+        self.closed = False
+        Driver.instances.append(self)
+
+    def get(self, url):
+        self.current_url = url
+        self.page_source = "<h1>{}</h1>".format(url)
+
+    def quit(self):
+        self.closed = True
+
+class Template:
+    visits = []
+    lock = threading.Lock()
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def get_data(self):
+        time.sleep(0.1)
+        with Template.lock:
+            Template.visits.append(threading.get_ident())
+        return {"module": __name__}
+
+class Registry:
+    def resolve(self, destination):
+        return Template
+
+@pytest.fixture(autouse=True)
+def reset():
+    Driver.instances = []
+    Template.visits = []
+
+def scraper(destinations, **arguments):
+    return Scraper(
+        root_url=ROOT_URL,
+        destinations=" ".join(destinations),
+        authentication=None,
+        data_controller=None,
+        web_driver=Driver(),
+        registry=Registry(),
+        **arguments)
+
+# workers
+
+def test__scraper_workers__concurrent():
+    destinations = ["dla_stud/page{}".format(index) for index in range(8)]
+
+    started = time.perf_counter()
+    scraper(destinations, workers=4, driver_factory=Driver).run()
+    elapsed = time.perf_counter() - started
+
+    # eight destinations, 0.1 s each: 0.8 s one at a time, 0.2 s on four
+    assert len(Template.visits) == 8
+    assert len(set(Template.visits)) > 1
+    assert elapsed < 0.5
+    assert all(driver.closed for driver in Driver.instances)
+
+def test__scraper_workers__factory_required():
+    with pytest.raises(ValueError):
+        scraper(["dla_stud/page"], workers=2)
+
+def test__scraper_workers__spawn_failure_quits_drivers():
+    spawned = []
+
+    def factory():
+        if len(spawned) == 2:
+            raise RuntimeError("Chrome could not be started")
+        spawned.append(Driver())
+        return spawned[-1]
+
+    with pytest.raises(RuntimeError):
+        scraper(["dla_stud/page"], workers=4, driver_factory=factory).run()
+    assert len(spawned) == 2
+    assert all(driver.closed for driver in spawned)
+
+def test__scraper_frontier__configured_frontier_used(tmpdir):
+    frontier = Frontier(max_pages=2, snapshot=str(tmpdir.join("f.json")))
+    crawler = scraper(["dla_stud/page{}".format(index) for index in range(4)],
+                      frontier=frontier)
+    assert crawler.frontier is frontier
+    crawler.run()
+    assert len(Template.visits) == 2
+    assert tmpdir.join("f.json").check()
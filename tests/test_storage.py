@@ -0,0 +1,160 @@
+import pytest
+from usos.data import DataController
+from usos.storage import (DEFAULT_FSYNC, JsonStorage, SqliteStorage,
+                          UnknownPolicy, migrate)
+
+def entity(*values):
+    return {
+        "entity": "course-results-tree",
+        "items": [{
+            "group": "28-INF-S-DOLI",
+            "subgroup": "Logic for Computer Science",
+            "hierarchy": "/Exam",
+            "item": "Task {}".format(index),
+            "values": [value]
+        } for index, value in enumerate(values)]
+    }
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(request, tmpdir):
+    if request.param == "json":
+        yield JsonStorage(str(tmpdir.join("data")))
+    else:
+        storage = SqliteStorage(str(tmpdir.join("usos.sqlite3")), "anna")
+        yield storage
+        storage.close()
+
+# storing entities
+
+def test__storage_load__missing(storage):
+    assert storage.load("final-grades") == {}
+    assert not storage.exists("final-grades")
+
+def test__storage_save__round_trip(storage):
+    storage.save("courses/28-inf-s-doli", entity("1 pkt", "2 pkt"))
+    storage.save("courses/28-inf-s-doli", entity("1 pkt", "5 pkt", "7 pkt"))
+    storage.commit()
+    assert storage.load("courses/28-inf-s-doli") == entity(
+        "1 pkt", "5 pkt", "7 pkt")
+    assert storage.keys() == ["courses/28-inf-s-doli"]
+
+def test__storage_save__removed_items(storage):
+    storage.save("courses/28-inf-s-doli", entity("1 pkt", "2 pkt"))
+    storage.save("courses/28-inf-s-doli", entity("1 pkt"))
+    assert storage.load("courses/28-inf-s-doli") == entity("1 pkt")
+
+def test__storage_digests(storage):
+    storage.save("final-grades", entity("5"))
+    storage.save_digests({"final-grades": "abc"})
+    assert storage.load_digests() == {"final-grades": "abc"}
+
+# sqlite
+
+def test__storage_sqlite__only_changed_rows(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join("usos.sqlite3")))
+    storage.save("courses/28-inf-s-doli", entity("1 pkt", "2 pkt"))
+    changes = storage._connection.total_changes
+    storage.save("courses/28-inf-s-doli", entity("1 pkt", "5 pkt"))
+    # the entity's row and a single item
+    assert storage._connection.total_changes - changes == 2
+
+def test__storage_sqlite__accounts_apart(tmpdir):
+    database = str(tmpdir.join("usos.sqlite3"))
+    anna = SqliteStorage(database, "anna")
+    anna.save("final-grades", entity("5"))
+    anna.commit()
+    assert SqliteStorage(database, "jan").keys() == []
+
+def test__storage_sqlite__uncommitted_discarded(tmpdir):
+    database = str(tmpdir.join("usos.sqlite3"))
+    storage = SqliteStorage(database)
+    storage.save("final-grades", entity("5"))
+    storage.close()
+    assert SqliteStorage(database).load("final-grades") == {}
+
+def test__storage_sqlite__data_controller(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join("usos.sqlite3")))
+    for values in [("4",), ("5",)]:
+        data = DataController(dispatcher=None, storage=storage)
+        data.upload(entity(*values))
+        data._load_digests()
+        data._analyze_single(data._data[0])
+        data.storage.commit()
+    assert data.results[0]["items"][0]["old_values"] == ["4"]
+
+def test__storage_sqlite__incremental(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join("usos.sqlite3")))
+    data = DataController(dispatcher=None, storage=storage, incremental=True)
+    data.upload(entity("5"))
+    data._stop_worker()
+    storage.commit()
+    assert storage.load("courses/28-inf-s-doli") == entity("5")
+
+# migrating
+
+def test__storage_migrate__json_to_sqlite(tmpdir):
+    source = JsonStorage(str(tmpdir.join("data")))
+    source.save("final-grades", entity("5"))
+    source.save("courses/28-inf-s-doli", entity("1 pkt"))
+    source.save_digests({"final-grades": "abc"})
+    target = SqliteStorage(str(tmpdir.join("usos.sqlite3")))
+    assert migrate(source, target) == 2
+    assert target.keys() == ["courses/28-inf-s-doli", "final-grades"]
+    assert target.load("final-grades") == entity("5")
+    assert target.load_digests() == {"final-grades": "abc"}
+
+def test__storage_migrate__entities_keys(tmpdir):
+    source = JsonStorage(str(tmpdir.join("data")))
+    source.save("entities/exam-schedule", entity("1"))
+    source.save("entities/lecturers/2018l", entity("2"))
+    source.save_digests({"entities/lecturers/2018l": "abc"})
+    source.commit()
+    tmpdir.join("data", "entities", "notes.json.tmp").write("{}")
+    source = JsonStorage(str(tmpdir.join("data")))
+    assert source.keys() == ["entities/exam-schedule",
+                             "entities/lecturers/2018l"]
+    target = SqliteStorage(str(tmpdir.join("usos.sqlite3")))
+    assert migrate(source, target) == 2
+    assert target.load("entities/lecturers/2018l") == entity("2")
+    assert target.load_digests() == {"entities/lecturers/2018l": "abc"}
+
+# write-behind
+
+def test__storage_json__written_on_commit(tmpdir):
+    storage = JsonStorage(str(tmpdir), fsync="full")
+    storage.save("final-grades", entity("5"))
+    storage.save("courses/28-inf-s-doli", entity("1 pkt"))
+    assert not tmpdir.join("final-grades.json").check()
+    assert storage.load("final-grades") == entity("5")
+    storage.commit()
+    assert tmpdir.join("final-grades.json").check()
+    assert storage.flushed_files == 2
+    assert storage.flushed_bytes == sum(
+        len(path.read_binary()) for path in tmpdir.visit("*.json"))
+
+def test__storage_json__atomic_replace(tmpdir, monkeypatch):
+    storage = JsonStorage(str(tmpdir))
+    storage.save("final-grades", entity("4"))
+    storage.commit()
+    def crash(*args):
+        raise OSError("crash")
+    monkeypatch.setattr("os.replace", crash)
+    storage.save("final-grades", entity("5"))
+    with pytest.raises(OSError):
+        storage.commit()
+    assert JsonStorage(str(tmpdir)).load("final-grades") == entity("4")
+    assert storage.load("final-grades") == entity("5")
+    monkeypatch.undo()
+    storage.commit()
+    assert JsonStorage(str(tmpdir)).load("final-grades") == entity("5")
+
+def test__storage_fsync__same_default(tmpdir):
+    database = SqliteStorage(str(tmpdir.join("usos.sqlite3")))
+    assert JsonStorage(str(tmpdir)).fsync == DEFAULT_FSYNC
+    assert database._connection.execute(
+        "PRAGMA synchronous").fetchone()[0] == 1
+    database.close()
+
+def test__storage_fsync__unknown_policy(tmpdir):
+    with pytest.raises(UnknownPolicy):
+        JsonStorage(str(tmpdir), fsync="sometimes")
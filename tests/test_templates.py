@@ -0,0 +1,102 @@
+import ast
+import glob
+import os
+import pytest
+from usos import parsing
+from usos.routing import TemplateRegistry
+
+# ScrapingTemplates receive a single snapshot of the page, every call to
+# the driver API below would be a separate round-trip to the browser.
+DRIVER_CALLS = {
+    "find_element", "find_elements", "get_attribute", "get_property",
+    "execute_script", "value_of_css_property", "is_displayed",
+}
+
+TEMPLATES = sorted(glob.glob(os.path.join(
+    os.path.dirname(__file__), "..", "templates", "scraping", "[!_]*.py")))
+
+def driver_calls(source):
+    calls = []
+    for node in ast.walk(ast.parse(source)):
+        if (isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Attribute)):
+            name = node.func.attr
+            if name in DRIVER_CALLS or name.startswith("find_element"):
+                calls.append("{}:{}".format(node.lineno, name))
+        elif isinstance(node, ast.Attribute) and node.attr == "driver":
+            calls.append("{}:driver".format(node.lineno))
+    return sorted(calls)
+
+# linting
+
+def test__templates_lint__detects_driver_calls():
+    source = ('link = self.driver.find_element_by_id("lista")\n'
+              'link.get_attribute("href")\n')
+    assert driver_calls(source) == [
+        "1:driver", "1:find_element_by_id", "2:get_attribute"]
+
+@pytest.mark.parametrize("path", TEMPLATES,
+                         ids=[os.path.basename(p) for p in TEMPLATES])
+def test__templates_lint__no_driver_calls(path):
+    with open(path, encoding="utf-8") as working_file:
+        assert driver_calls(working_file.read()) == []
+
+# parsing whole pages
+
+ROOT_URL = "https://usosweb.uni.wroc.pl/kontroler.php?_action="
+
+LAYOUT = ('<html><body><div id="header"><h1>USOSweb</h1>'
+          '<table id="menu"><tr><td>Menu</td></tr></table></div>'
+          '{}<table id="footer"><tr><td>Stopka</td></tr></table>'
+          '</body></html>')
+
+GRADES = LAYOUT.format(
+    '<table id="tab1"><tr><td><a>Logic</a><span>28-INF-S-DOLI</span></td>'
+    '<td><span>2018L</span></td>'
+    '<td><div><a>Egzamin</a><span>5</span></div></td></tr></table>')
+
+COURSE = LAYOUT.format(
+    '<div id="layout-c22a"><h1><span><a>Logic</a><span>28-INF-S-DOLI'
+    '</span></span><span>2018L</span></h1><div id="drzewo"><div id="a">'
+    '<table><tr><td></td><td>Egzamin</td><td>5 pkt</td></tr></table>'
+    '<div id="b"><table><tr><td></td><td>Zadanie 1</td><td>2 pkt</td>'
+    '</tr></table></div></div></div></div>')
+
+TESTS = LAYOUT.format(
+    '<a class="fwdlink" href="kontroler.php?_action=news">News</a>'
+    '<div id="lista"><a class="fwdlink" href="kontroler.php?_action='
+    'dla_stud/studia/sprawdziany/pokaz&amp;wez_id=1">Logic</a></div>')
+
+@pytest.fixture(params=parsing.BACKENDS)
+def template(request, monkeypatch):
+    if request.param != "html.parser":
+        pytest.importorskip("lxml")
+    monkeypatch.setattr(parsing, "_default_backend", request.param)
+    registry = TemplateRegistry()
+    def run(destination, html):
+        snapshot = parsing.Snapshot(ROOT_URL + destination, html)
+        return registry.resolve(destination)(snapshot=snapshot).get_data()
+    return run
+
+def test__templates_parse__grades(template):
+    results = template("dla_stud/studia/oceny/index", GRADES)
+    items = results["parsed_results"][0]["items"]
+    assert [(item.group, item.subgroup, item.item, list(item.values))
+            for item in items] == [
+        ("2018L", "28-INF-S-DOLI", "Logic", ["Egzamin: 5"])]
+
+def test__templates_parse__course(template):
+    results = template("dla_stud/studia/sprawdziany/pokaz&wez_id=1", COURSE)
+    items = results["parsed_results"][0]["items"]
+    assert [(item.group, item.hierarchy, item.item) for item in items] == [
+        ("28-INF-S-DOLI", "", "Egzamin"),
+        ("28-INF-S-DOLI", "Egzamin", "Zadanie 1")]
+
+def test__templates_parse__tests(template):
+    results = template("dla_stud/studia/sprawdziany/index", TESTS)
+    assert results["new_destinations"] == [
+        ROOT_URL + "dla_stud/studia/sprawdziany/pokaz&wez_id=1"]
+
+def test__templates_parse__missing_container(template):
+    with pytest.raises(ValueError):
+        template("dla_stud/studia/oceny/index", LAYOUT.format(""))
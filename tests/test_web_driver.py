@@ -0,0 +1,129 @@
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from usos.scraper import Scraper
+from usos.web_driver import DriverPool, HttpDriver, SessionExpired
+
+class Usos(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/kontroler.php"):
+            if "PHPSESSID=abc" not in self.headers.get("Cookie", ""):
+                self.send_response(302)
+                self.send_header("Location", "/cas/login?service=usos")
+                self.end_headers()
+                return
+            body = "<h1>Oceny</h1>"
+        else:
+            body = "<form id='fm1'>Zaloguj</form>"
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+class Browser:
+    def __init__(self):
+        self.visited = []
+        self.current_url = None
+        self.page_source = ""
+
+    def get(self, url):
+        self.visited.append(url)
+        self.current_url = url
+        self.page_source = "<h1>Oceny (browser)</h1>"
+
+@pytest.fixture
+def usos():
+    server = HTTPServer(("127.0.0.1", 0), Usos)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,),
+                              daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/kontroler.php?_action=".format(
+        server.server_port)
+    server.shutdown()
+    server.server_close()
+
+def signed_in():
+    http_driver = HttpDriver()
+    http_driver.add_cookie({"name": "PHPSESSID", "value": "abc",
+                            "domain": "127.0.0.1"})
+    return http_driver
+
+# http driver
+
+def test__http_driver__get(usos):
+    http_driver = signed_in()
+    http_driver.get(usos + "dla_stud/studia/oceny/index")
+    assert http_driver.current_url == usos + "dla_stud/studia/oceny/index"
+    assert http_driver.page_source == "<h1>Oceny</h1>"
+    http_driver.quit()
+
+def test__http_driver__session_expired(usos):
+    http_driver = HttpDriver()
+    with pytest.raises(SessionExpired):
+        http_driver.get(usos + "dla_stud/studia/oceny/index")
+    http_driver.quit()
+
+# fast path
+
+def test__fetch__over_http(usos):
+    browser = Browser()
+    scraper = Scraper(usos, "", None, None, browser)
+    snapshot = scraper._fetch(
+        "dla_stud/studia/oceny/index", object, browser, signed_in())
+    assert snapshot.html == "<h1>Oceny</h1>"
+    assert browser.visited == []
+
+def test__fetch__expired_session_falls_back_to_browser(usos):
+    browser = Browser()
+    scraper = Scraper(usos, "", None, None, browser)
+    snapshot = scraper._fetch(
+        "dla_stud/studia/oceny/index", object, browser, HttpDriver())
+    assert snapshot.html == "<h1>Oceny (browser)</h1>"
+    assert browser.visited == [usos + "dla_stud/studia/oceny/index"]
+
+def test__fetch__browser_required(usos):
+    class Template:
+        requires_browser = True
+    browser = Browser()
+    scraper = Scraper(usos, "", None, None, browser)
+    scraper._fetch(
+        "dla_stud/studia/oceny/index", Template, browser, signed_in())
+    assert len(browser.visited) == 1
+
+# driver pool
+
+class Pooled:
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.cookies_deleted = 0
+        self.closed = False
+
+    def delete_all_cookies(self):
+        if self.broken:
+            raise ConnectionError("chromedriver is gone")
+        self.cookies_deleted += 1
+
+    def quit(self):
+        self.closed = True
+
+def test__driver_pool__reused():
+    pool = DriverPool(factory=Pooled, size=1)
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        pass
+    assert first is second
+    assert first.cookies_deleted == 2
+    pool.quit()
+    assert first.closed
+
+def test__driver_pool__broken_driver_quit():
+    pool = DriverPool(factory=lambda: Pooled(broken=True), size=1)
+    with pool.lease() as broken:
+        pass
+    assert broken.closed
+    assert pool._drivers == []
+    with pool.lease() as replacement:
+        assert replacement is not broken
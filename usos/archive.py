@@ -0,0 +1,104 @@
+import os
+import gzip
+import logging
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+logging = logging.getLogger(__name__)
+
+
+class PageNotArchived(Exception):
+    """There is no recording of a requested destination."""
+
+
+class PageArchive:
+    """Stores the HTML of visited destinations, so that the
+    ScrapingTemplates can be run again later without a browser. ::
+
+        from usos.archive import PageArchive
+
+        archive = PageArchive("data/archive")
+        archive.record("dla_stud/studia/oceny/index", html)
+
+        html = archive.load("dla_stud/studia/oceny/index")
+
+    Every recording is a gzip-compressed file, stored under a directory
+    named after the destination and a file named after the time of the
+    recording: ``<directory>/<destination>/<timestamp>.html.gz``.
+    Timestamps are in UTC, formatted as ``20180615T101500123456``, so
+    they sort chronologically.
+
+    :param directory: directory the recordings are stored in.
+    """
+    extension = ".html.gz"
+    timestamp_format = "%Y%m%dT%H%M%S%f"
+
+    def __init__(self, directory: str = "data/archive") -> None:
+        self.directory = directory
+
+    def record(self, destination: str, page_source: str,
+               timestamp: str = None) -> str:
+        """Stores the HTML of a destination.
+
+        :param destination: scraper-compatible destination path.
+        :param page_source: HTML of the whole page.
+        :param timestamp: time of the recording, defaults to now.
+        :returns: path to the recording.
+        """
+        if timestamp is None:
+            timestamp = datetime.utcnow().strftime(self.timestamp_format)
+
+        dirname = os.path.join(self.directory, quote(destination, safe=""))
+        os.makedirs(dirname, exist_ok=True)
+
+        filename = os.path.join(dirname, timestamp + self.extension)
+        with gzip.open(filename, 'wt', encoding="utf-8") as working_file:
+            working_file.write(page_source)
+
+        logging.debug("Recorded '{}' as '{}'".format(destination, filename))
+        return filename
+
+    def load(self, destination: str, at: str = None) -> str:
+        """Loads the HTML of a destination.
+
+        :param destination: scraper-compatible destination path.
+        :param at: a timestamp or its prefix, the most recent recording
+            made no later than that is returned, e.g. ``20180601``
+            includes the whole day. Defaults to the latest recording.
+        :returns: HTML of the page.
+        :raises PageNotArchived: if there is no such recording.
+        """
+        until = None if at is None else at + "\uffff"
+        timestamps = [timestamp for timestamp in self.timestamps(destination)
+                      if until is None or timestamp <= until]
+
+        if not timestamps:
+            raise PageNotArchived(
+                "No recording of '{}' made by {}".format(
+                    destination, at or "now"))
+
+        filename = os.path.join(
+            self.directory, quote(destination, safe=""),
+            timestamps[-1] + self.extension)
+
+        with gzip.open(filename, 'rt', encoding="utf-8") as working_file:
+            return working_file.read()
+
+    def destinations(self) -> list:
+        """Returns every destination that has been recorded."""
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted(unquote(name) for name in os.listdir(self.directory))
+
+    def timestamps(self, destination: str) -> list:
+        """Returns timestamps of every recording of a destination, from
+        the oldest one."""
+        dirname = os.path.join(self.directory, quote(destination, safe=""))
+
+        if not os.path.isdir(dirname):
+            return []
+
+        return sorted(filename[:-len(self.extension)]
+                      for filename in os.listdir(dirname)
+                      if filename.endswith(self.extension))
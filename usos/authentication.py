@@ -1,4 +1,11 @@
+import os
+import json
+import time
+import base64
+import hashlib
 import logging
+import requests
+from cryptography.fernet import Fernet, InvalidToken
 
 logging = logging.getLogger(__name__)
 
@@ -52,19 +59,25 @@ class Authentication:
     :param web_driver: an instance of 
         :class:`usos.web_driver.SeleniumDriver` responsible for 
         controlling the browser.
+    :param session_cache: an optional :class:`SessionCache` that allows
+        skipping the login procedure while the stored session is valid.
     """
     def __init__(self, credentials: object, root_url: str,
-                 web_driver: object) -> None:
+                 web_driver: object, session_cache: object = None) -> None:
         self.user_authenticated = False
         self.username = credentials.username
         self.password = credentials.password
         self.driver = web_driver
         self.root_url = root_url
+        self.session_cache = session_cache
 
     def sign_in(self) -> bool:
         """Performs the sign in procedure using a ``web_driver`` provided 
         to the initializer.
 
+        The driver is left running if the procedure fails, terminating 
+        it is up to its owner, e.g. a :class:`usos.web_driver.DriverPool`.
+
         :returns: ``True`` if the procedure was successful.
         """
         logging.info("Initializing login procedure")
@@ -80,10 +93,13 @@ class Authentication:
 
             except:
                 logging.exception("Login button could not be found")
-                self.driver.quit()
 
         if self._is_username_present_in_topbar():
             self.user_authenticated = True
+
+            if self.session_cache is not None:
+                self.session_cache.store(
+                    self.username, self.password, self.driver.get_cookies())
             return True
         return False
 
@@ -91,8 +107,9 @@ class Authentication:
         """Checks whether the user is authenticated.
         
         Current implementation of this method firstly checks whether the
-        user has been recently signed in, and if that condition is 
-        negative, attempts to execute :meth:`sign_in`. ::
+        user has been recently signed in, then tries to restore a session
+        stored in the ``session_cache`` and if that fails as well, 
+        attempts to execute :meth:`sign_in`. ::
 
             if auth.is_authenticated():
                 # Even though the user has not been signed in before,
@@ -109,8 +126,84 @@ class Authentication:
             return True
         else:
             logging.info("First authorization")
+            if self._restore_session():
+                return True
             return self.sign_in()
 
+    def share_session(self, web_driver: object) -> bool:
+        """Copies cookies of the authenticated browser session into
+        another driver, so it can access protected pages without going
+        through the login procedure again. ::
+
+            http_driver = HttpDriver()
+
+            if auth.share_session(http_driver):
+                http_driver.get(protected_url)
+
+        :param web_driver: a driver supporting ``add_cookie()``, such as
+            :class:`usos.web_driver.HttpDriver`.
+        :returns: ``False`` if the user could not be authenticated.
+        """
+        if not self.is_authenticated():
+            return False
+
+        logging.info("Sharing the authenticated session")
+        for cookie in self.driver.get_cookies():
+            web_driver.add_cookie(cookie)
+
+        return True
+
+    def _restore_session(self) -> bool:
+        """Restores cookies of a previously stored session, as long as 
+        they are still accepted by the server.
+
+        The validity is probed with a single HTTP request, so that the 
+        browser only has to load the page once to receive the cookies.
+
+        :returns: ``True`` if the session has been restored.
+        """
+        if self.session_cache is None:
+            return False
+
+        cookies = self.session_cache.load(self.username, self.password)
+        if not cookies:
+            return False
+
+        if not self._probe_session(cookies):
+            logging.info("Stored session has expired")
+            self.session_cache.invalidate(self.username)
+            return False
+
+        self.driver.get(self.root_url + "&lang=pl")
+        for cookie in cookies:
+            self.driver.add_cookie(cookie)
+
+        logging.info("Stored session has been restored")
+        self.user_authenticated = True
+        return True
+
+    def _probe_session(self, cookies: list) -> bool:
+        """Checks whether the server still recognizes the user signed in
+        with given cookies.
+
+        :param cookies: cookies in the format returned by Selenium.
+        :returns: ``True`` if the session is valid.
+        """
+        jar = requests.cookies.RequestsCookieJar()
+        for cookie in cookies:
+            jar.set(cookie["name"], cookie["value"],
+                    domain=cookie.get("domain", ""),
+                    path=cookie.get("path", "/"))
+
+        try:
+            response = requests.get(
+                self.root_url + "&lang=pl", cookies=jar, timeout=10)
+        except requests.RequestException:
+            logging.exception("Stored session could not be probed")
+            return False
+
+        return "Zalogowany użytkownik:" in response.text
+
     def _perform_login(self) -> None:
         """Fills the sign in form with credentials passed in the 
         initializer."""
@@ -126,7 +219,6 @@ class Authentication:
             logging.info("Login procedure finished")
         except:
             logging.exception("Credentials could not be entered")
-            self.driver.quit()
 
     def _is_username_present_in_topbar(self) -> bool:
         """Checks whether the username is present in the top bar of 
@@ -144,6 +236,98 @@ class Authentication:
             self.authenticated = False
         except:
             logging.exception("Top bar could not be located")
-            self.driver.quit()
 
         return False
+
+
+class SessionCache:
+    """Stores cookies of authenticated sessions on disk, so that the 
+    following runs can skip the login procedure. ::
+
+        from usos.authentication import SessionCache
+
+        auth = Authentication(
+            credentials=john,
+            root_url=os.environ["USOS_SCRAPER_ROOT_URL"],
+            web_driver=selenium_driver,
+            session_cache=SessionCache("data/sessions"))
+
+    Every session is kept in a separate file, encrypted with a key 
+    derived from the user's credentials. Changing the password 
+    invalidates the stored session.
+
+    :param directory: directory the sessions are stored in.
+    :param max_age: maximum age of a stored session in seconds.
+    """
+    def __init__(self, directory: str, max_age: int = 86400) -> None:
+        self.directory = directory
+        self.max_age = max_age
+
+    def load(self, username: str, password: str) -> list:
+        """Loads cookies of a stored session.
+
+        :param username: username the session belongs to.
+        :param password: password bound to the username.
+        :returns: cookies that have not expired yet, or an empty list.
+        """
+        filename = self._get_filename(username)
+
+        if not os.path.isfile(filename):
+            return []
+
+        try:
+            with open(filename, 'rb') as working_file:
+                token = working_file.read()
+            data = self._fernet(username, password).decrypt(
+                token, ttl=self.max_age)
+        except InvalidToken:
+            logging.info("Stored session is outdated or invalid")
+            return []
+        except IOError:
+            logging.exception("Stored session could not be read")
+            return []
+
+        now = time.time()
+        cookies = [cookie for cookie in json.loads(data.decode("utf-8"))
+                   if cookie.get("expiry", now + 1) > now]
+
+        return cookies
+
+    def store(self, username: str, password: str, cookies: list) -> None:
+        """Stores cookies of an authenticated session.
+
+        :param username: username the session belongs to.
+        :param password: password bound to the username.
+        :param cookies: cookies in the format returned by Selenium.
+        """
+        logging.info("Storing the session")
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        token = self._fernet(username, password).encrypt(
+            json.dumps(cookies).encode("utf-8"))
+
+        with open(self._get_filename(username), 'wb') as working_file:
+            working_file.write(token)
+
+    def invalidate(self, username: str) -> None:
+        """Removes the stored session of a given user."""
+        filename = self._get_filename(username)
+
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def _get_filename(self, username: str) -> str:
+        """Returns a filename that does not reveal the username."""
+        digest = hashlib.sha256(username.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.directory, digest + ".session")
+
+    def _fernet(self, username: str, password: str) -> object:
+        """Derives the encryption key from the user's credentials."""
+        key = hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"),
+            username.encode("utf-8"), 100000)
+
+        return Fernet(base64.urlsafe_b64encode(key))
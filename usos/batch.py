@@ -0,0 +1,154 @@
+import json
+import time
+import logging
+import threading
+
+logging = logging.getLogger(__name__)
+
+
+class InvalidAccountsFile(Exception):
+    """The accounts file is not in a supported format."""
+
+
+def load_accounts(filename: str) -> list:
+    """Loads accounts for a :class:`BatchRunner` from a JSON file.
+
+    The file should contain a list of accounts, for example::
+
+        [
+            {"username": "johndoe", "password": "..."},
+            {
+                "username": "anna1995",
+                "password": "...",
+                "notifications_config_file": "anna.json"
+            }
+        ]
+
+    :param filename: path to the JSON file.
+    :returns: a list of accounts as dictionaries.
+    :raises InvalidAccountsFile: if any account misses its credentials.
+    """
+    with open(filename, 'r') as working_file:
+        accounts = json.load(working_file)
+
+    if not isinstance(accounts, list):
+        raise InvalidAccountsFile(
+            "'{}' does not contain a list of accounts".format(filename))
+
+    for account in accounts:
+        if "username" not in account or "password" not in account:
+            raise InvalidAccountsFile(
+                "Account {} has no credentials".format(
+                    account.get("username", "?")))
+
+    return accounts
+
+
+class BatchRunner:
+    """Processes multiple accounts within a single process, sharing a
+    bounded pool of web drivers between them. ::
+
+        from usos.batch import BatchRunner, load_accounts
+        from usos.web_driver import DriverPool
+
+        def scrape_account(account: dict, web_driver: object) -> None:
+            ...
+
+        runner = BatchRunner(
+            accounts=load_accounts("accounts.json"),
+            driver_pool=DriverPool(factory=make_driver, size=4),
+            task=scrape_account)
+
+        for report in runner.run():
+            print(report["username"], report["seconds"])
+
+    Up to ``driver_pool.size`` accounts are processed at the same time.
+    A failure of a single account is logged and does not interrupt the
+    others.
+
+    :param accounts: accounts as returned by :func:`load_accounts`.
+    :param driver_pool: an instance of
+        :class:`usos.web_driver.DriverPool`.
+    :param task: a callable receiving an account and a leased web driver.
+    """
+    def __init__(self, accounts: list, driver_pool: object,
+                 task: object) -> None:
+        self.accounts = accounts
+        self.driver_pool = driver_pool
+        self.task = task
+        self.reports = []
+        self._pending = list(reversed(accounts))
+        self._lock = threading.Lock()
+
+    def run(self) -> list:
+        """Processes every account.
+
+        :returns: a report for every account, containing its
+            ``username``, ``seconds`` spent and ``succeeded`` status.
+        """
+        logging.info("Processing {} accounts".format(len(self.accounts)))
+
+        threads = []
+        for _ in range(min(self.driver_pool.size, len(self.accounts))):
+            thread = threading.Thread(target=self._work)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        self._log_summary()
+        return self.reports
+
+    def _work(self) -> None:
+        """Processes accounts until there are none left."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                account = self._pending.pop()
+
+            report = self._process(account)
+
+            with self._lock:
+                self.reports.append(report)
+
+    def _process(self, account: dict) -> dict:
+        """Processes a single account with a driver leased from the pool.
+
+        :param account: the account to process.
+        :returns: a report for the account.
+        """
+        username = account["username"]
+        logging.info("Processing account '{}'".format(username))
+
+        succeeded = False
+        started = time.perf_counter()
+        try:
+            with self.driver_pool.lease() as web_driver:
+                self.task(account, web_driver)
+            succeeded = True
+        except:
+            logging.exception(
+                "Processing account '{}' has failed".format(username))
+        seconds = time.perf_counter() - started
+
+        logging.info("Account '{}' processed in {:.2f}s".format(
+            username, seconds))
+
+        return {
+            "username": username,
+            "seconds": seconds,
+            "succeeded": succeeded
+        }
+
+    def _log_summary(self) -> None:
+        """Logs the timing of every processed account."""
+        total = sum(report["seconds"] for report in self.reports)
+        failed = [report["username"] for report in self.reports
+                  if not report["succeeded"]]
+
+        logging.info("Processed {} accounts, {:.2f}s in total".format(
+            len(self.reports), total))
+        if failed:
+            logging.error("Failed accounts: {}".format(", ".join(failed)))
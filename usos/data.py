@@ -1,15 +1,177 @@
+import sys
 import json
-import copy
-import os.path
+import queue
 import logging
 import hashlib
+import threading
+from usos.entities import EntityRegistry, EntityType
+from usos.storage import JsonStorage
 
 logging = logging.getLogger(__name__)
 
+CHANGES = ("added", "removed", "changed", "moved")
+
 
 class NotAnEntity(Exception):
     """An item is not in an entity-compatible format."""
 
+
+class Item:
+    """A single item of an entity, such as a grade or a test result.
+
+    Items are kept in slots rather than in dictionaries, their values in
+    tuples, and the strings shared by many items (group, subgroup and 
+    hierarchy) are interned, so a large entity takes a fraction of the 
+    memory. ScrapingTemplates can build them directly::
+
+        from usos.data import Item
+
+        Item(group="2018L", subgroup="28-INF-S-DOLI",
+             item="Logic for Computer Science", values=["5"])
+
+    Items are turned into dictionaries only when they are stored or sent 
+    to the notifications' dispatcher. They can also be read like 
+    dictionaries, e.g. ``item["values"]``.
+
+    :param group: the first-level identifier, e.g. a semester or a 
+        course code.
+    :param subgroup: the second-level identifier.
+    :param item: name of the item.
+    :param values: values of the item.
+    :param hierarchy: position of the item in a tree, if it has one.
+    :param old_values: values the item had before a detected change.
+    :param change: type of a detected change, one of :data:`CHANGES`.
+    :param old_hierarchy: hierarchy the item had before it was moved.
+    :param extra: any other keys of the item.
+    """
+    __slots__ = ("group", "subgroup", "hierarchy", "item", "values",
+                 "old_values", "change", "old_hierarchy", "extra")
+    FIELDS = __slots__[:-1]
+    OPTIONAL = ("hierarchy", "old_values", "change", "old_hierarchy")
+
+    def __init__(self, group: str, subgroup: str, item: str,
+                 values: list, hierarchy: str = None,
+                 old_values: list = None, change: str = None,
+                 old_hierarchy: str = None, extra: dict = None) -> None:
+        self.group = _intern(group)
+        self.subgroup = _intern(subgroup)
+        self.hierarchy = _intern(hierarchy)
+        self.item = item
+        self.values = _freeze(values)
+        self.old_values = _freeze(old_values)
+        self.change = change
+        self.old_hierarchy = _intern(old_hierarchy)
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> object:
+        """Creates an item out of its dictionary representation."""
+        extra = {name: value for name, value in data.items()
+                 if name not in cls.__slots__}
+
+        return cls(group=data.get("group"), subgroup=data.get("subgroup"),
+                   item=data.get("item"), values=data.get("values"),
+                   hierarchy=data.get("hierarchy"),
+                   old_values=data.get("old_values"),
+                   change=data.get("change"),
+                   old_hierarchy=data.get("old_hierarchy"), extra=extra)
+
+    def to_dict(self) -> dict:
+        """Returns the dictionary representation of the item, with the 
+        keys that are not set left out."""
+        data = dict(self.extra or {})
+        data["group"] = self.group
+        data["subgroup"] = self.subgroup
+        if self.hierarchy is not None:
+            data["hierarchy"] = self.hierarchy
+        data["item"] = self.item
+        data["values"] = _thaw(self.values)
+        if self.old_values is not None:
+            data["old_values"] = _thaw(self.old_values)
+        if self.change is not None:
+            data["change"] = self.change
+        if self.old_hierarchy is not None:
+            data["old_hierarchy"] = self.old_hierarchy
+
+        return data
+
+    def key(self, hierarchy: bool) -> tuple:
+        """Returns the identifiers of the item.
+
+        :param hierarchy: whether the item's hierarchy is a part of its 
+            identity.
+        """
+        if hierarchy:
+            return self.group, self.subgroup, self.item, self.hierarchy
+        return self.group, self.subgroup, self.item
+
+    def record(self, change: str, old: object = None) -> object:
+        """Returns a copy of the item describing a detected change.
+
+        :param change: type of the change, one of :data:`CHANGES`.
+        :param old: the previous version of the item, its values and 
+            hierarchy are carried only if they differ.
+        """
+        old_values = old_hierarchy = None
+        if old is not None:
+            if old.values != self.values:
+                old_values = old.values
+            if old.hierarchy != self.hierarchy:
+                old_hierarchy = old.hierarchy
+
+        return Item(self.group, self.subgroup, self.item, self.values,
+                    self.hierarchy, old_values, change, old_hierarchy,
+                    self.extra)
+
+    def __getitem__(self, name: str) -> object:
+        if name in self.FIELDS:
+            value = getattr(self, name)
+            if value is None and name in self.OPTIONAL:
+                raise KeyError(name)
+            return _thaw(value)
+
+        try:
+            return (self.extra or {})[name]
+        except KeyError:
+            raise KeyError(name) from None
+
+    def __contains__(self, name: str) -> bool:
+        if name in self.FIELDS:
+            return name not in self.OPTIONAL or getattr(self, name) is not None
+        return name in (self.extra or {})
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Item):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    # items are compared by their fields, which may change
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "Item({})".format(self.to_dict())
+
+
+def _intern(value: object) -> object:
+    """Interns strings repeated across many items."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def _freeze(values: object) -> object:
+    if isinstance(values, list):
+        return tuple(values)
+    return values
+
+
+def _thaw(values: object) -> object:
+    if isinstance(values, tuple):
+        return list(values)
+    return values
+
+
 class DataController:
     """Stores and performs analysis of collected data.
 
@@ -37,12 +199,42 @@ class DataController:
     :param dispatcher: instance of :class:`usos.notifications.Dispatcher` 
         responsible for providing the notifications via available 
         channels.
+    :param data_dir: directory the entities are stored in, allows keeping
+        the data of multiple accounts apart.
+    :param storage: a storage for the entities, such as 
+        :class:`usos.storage.SqliteStorage`. Defaults to a 
+        :class:`usos.storage.JsonStorage` in ``data_dir``.
+    :param history: an optional :class:`usos.history.ChangeLog` every 
+        detected change is appended to.
+    :param incremental: whether to compare every uploaded entity right 
+        away, on a background thread, instead of keeping all of them 
+        until :meth:`analyze`.
+    :param entities: a :class:`usos.entities.EntityRegistry` deciding 
+        how the entities are identified, sharded and stored.
+    :param outbox: an optional :class:`usos.outbox.Outbox` the results 
+        are enqueued into, to be delivered later, instead of being sent 
+        right away.
     """
 
-    def __init__(self, dispatcher: object) -> None:
+    def __init__(self, dispatcher: object, data_dir: str = "data",
+                 storage: object = None, history: object = None,
+                 incremental: bool = False,
+                 entities: object = None, outbox: object = None) -> None:
         self.dispatcher = dispatcher
+        self.data_dir = data_dir
+        self.storage = storage or JsonStorage(data_dir)
+        self.entities = entities or EntityRegistry()
+        self.outbox = outbox
+        self.history = history
+        self.incremental = incremental
         self.results = []
+        self.failed = []
         self._data = []
+        self._lock = threading.Lock()
+        self._digests = None
+        self._digests_changed = False
+        self._queue = queue.Queue()
+        self._worker = None
 
     def upload_multiple(self, items: list) -> None:
         """Uploads a list of items to a temporary data storage. 
@@ -79,7 +271,9 @@ class DataController:
         """Uploads a given item to a temporary data storage.
 
         The :meth:`upload` method works on dictionaries structured as
-        **entities**.
+        **entities**. It is safe to call it from multiple threads. In the 
+        incremental mode the entity is handed over to the background 
+        thread comparing and saving it.
 
         Learn more about entities here: :ref:`CustomEntity`. ::
 
@@ -91,136 +285,189 @@ class DataController:
         :param item: item in an **entity-compatible** format.
         """
         if "entity" in item and "items" in item:
-            self._data.append(item)
+            item = self._import_entity(item)
+
+            with self._lock:
+                if not self.incremental:
+                    self._data.append(item)
+                    return
+
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._work, daemon=True)
+                    self._worker.start()
+                self._queue.put(item)
         elif item:
             raise NotAnEntity(
                 "Given item {} is not an entity".format(item))
 
     def analyze(self) -> None:
         """Analyzes the data stored in the temporary storage and passes 
-        the results to the notifications' dispatcher."""
+        the results to the notifications' dispatcher.
+        
+        Entities identical to the ones stored by the previous run are 
+        recognized by their digests and skipped without touching the 
+        storage. Changes are committed to the storage once the analysis 
+        is finished. With an outbox, the results are enqueued before the
+        commit and delivered by :meth:`usos.outbox.Outbox.drain`.
+        
+        In the incremental mode most of the entities have already been
+        compared by the time the method is called, it only waits for the
+        remaining ones. An entity whose analysis has failed there is
+        listed in :attr:`failed` and left out of the results; neither it
+        nor its digest is stored, so the next run compares it again."""
         logging.info("Initializing the analysis")
+        self._stop_worker()
+        self._load_digests()
+
         for entity in self._data:
             if ("items" in entity and entity["items"]):
                 self._analyze_single(entity=entity)
 
-        # self._save("data/compared.json", self.results)
-        if self.results:
-            logging.info("Changes detected, passing onto dispatcher")
-            self.dispatcher.send(self.results)
-        else:
-            logging.info("No changes have been detected")
-
-    def _get_filename(self, data: dict) -> str:
-        """Returns a filename based on the data's **entity-type**. ::
-
-            >>> grades = {
-            ...     "entity": "final-grades",
-            ...     "items": []
-            ... }
-
-            >>> course_results = {
-            ...     "entity": "course-results-tree",
-            ...     "items": [
-            ...         {
-            ...             "group": "28-INF-S-DOLI",
-            ...             "subgroup": "Logic for Computer Science",
-            ...             "hierarchy": "/Exam",
-            ...             "item": "Results",
-            ...             "values": ["104.5 pkt"]
-            ...         }
-            ...     ]
-            ... }
+        if self.failed:
+            logging.error("Analysis of entities {} has failed, ".format(
+                ", ".join("'{}'".format(name) for name in self.failed))
+                + "they will be compared again by the next run")
 
-            >>> data._get_filename(grades)
-            'data/final-grades.json'
-            >>> data._get_filename(course_results)
-            'data/courses/28-inf-s-doli.json'
+        results = [self._export_entity(entity) for entity in self.results]
 
+        # enqueued before the changes are committed, so that a crash in
+        # between repeats the notification rather than losing it
+        if results and self.outbox is not None:
+            self.outbox.enqueue(results, self.dispatcher)
 
-        :returns: filename of the json file for a given entity."""
-        filename = "data/not-defined.json"
+        self._save_digests()
+        self.storage.commit()
 
-        if "entity" in data:
-            if data["entity"] == "final-grades":
-                filename = "data/final-grades.json"
-
-            elif data["entity"] == "course-results-tree":
-                group = data["items"][0]["group"].lower()
-                filename = "data/courses/{}.json".format(group)
+        # self._save("data/compared.json", self.results)
+        if results:
+            if self.history is not None:
+                self.history.append(results)
 
-        return filename
+            if self.outbox is None:
+                logging.info("Changes detected, passing onto dispatcher")
+                self.dispatcher.send(results)
+        else:
+            logging.info("No changes have been detected")
 
-    def _load(self, filename: str) -> dict:
-        """Loads the data from a specified JSON file.
+    def _work(self) -> None:
+        """Compares uploaded entities until :meth:`_stop_worker` is 
+        called."""
+        logging.info("Starting the incremental analysis")
+        self._load_digests()
 
-        :param filename: name of the JSON file to load the data from.
-        :returns: an entity retrieved from a file.
-        """
-        logging.info("Loading entity from '{}'".format(filename))
-        data = []
+        while True:
+            entity = self._queue.get()
 
-        if os.path.isfile(filename):
             try:
-                with open(filename, 'r') as working_file:
-                    data = json.load(working_file)
-                    logging.info("'{}'".format(filename)
-                                 + "- json has been fetched correctly")
-            except IOError:
-                logging.exception("File could not be opened")
+                if entity is None:
+                    break
+                if entity["items"]:
+                    self._analyze_single(entity=entity)
             except:
-                logging.exception("'{}'".format(filename)
-                                  + "- fetching json has failed "
-                                  + "for an unknown reason")
-
-        return data
-
-    def _save(self, filename: str, data: dict) -> None:
-        """Saves the data to a specified JSON file.
-
-        :param filename: name of the JSON file to save the data to.
-        :param data: data to store.
-        """
-        logging.info("Saving entity to '{}'".format(filename))
-        
-        dirname = os.path.dirname(filename)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-
-        with open(filename, 'w') as working_file:
-            json.dump(data, working_file)
+                logging.exception("Analysis of entity '{}' ".format(
+                    entity["entity"]) + "has failed")
+                self.failed.append(entity["entity"])
+            finally:
+                self._queue.task_done()
+
+    def _stop_worker(self) -> None:
+        """Waits for the background thread to compare every uploaded 
+        entity and stops it."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+    def _import_entity(self, entity: dict) -> dict:
+        """Returns a copy of the entity with its items turned into 
+        :class:`Item` objects."""
+        return dict(entity, items=[
+            item if isinstance(item, Item) else Item.from_dict(item)
+            for item in entity.get("items", [])])
+
+    def _export_entity(self, entity: dict) -> dict:
+        """Returns a copy of the entity with its items turned into 
+        dictionaries, ready to be stored or sent."""
+        return dict(entity, items=[item.to_dict()
+                                   for item in entity["items"]])
+
+    def _digest(self, entity: dict) -> str:
+        """Returns a digest of the entity's canonical JSON 
+        representation, independent of the order of keys."""
+        canonical = json.dumps(self._export_entity(entity), sort_keys=True,
+                               ensure_ascii=False, separators=(",", ":"))
+
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _load_digests(self) -> None:
+        """Loads the digests of the stored entities, once per 
+        controller."""
+        if self._digests is None:
+            self._digests = self.storage.load_digests()
+
+    def _save_digests(self) -> None:
+        """Saves the digests if any of the stored entities has changed."""
+        if self._digests_changed:
+            self.storage.save_digests(self._digests)
+            self._digests_changed = False
 
     def _analyze_single(self, entity: dict) -> None:
-        filename = self._get_filename(entity)
-        old = self._load(filename)
-
-        self._compare(old, entity)
-        self._save(filename, entity)
-
-    def _same_item(self, old: dict, new: dict) -> bool:
+        """Compares and stores every shard of an entity, as declared by 
+        its :class:`usos.entities.EntityType`."""
+        entity_type = self.entities.get(entity["entity"])
+
+        for key, shard in entity_type.shards(entity):
+            self._analyze_shard(key, shard, entity_type)
+
+    def _analyze_shard(self, key: str, entity: dict,
+                       entity_type: EntityType) -> None:
+        digest = self._digest(entity)
+
+        if (self._digests.get(key) == digest
+                and self.storage.exists(key)):
+            logging.info("Entity '{}' has not changed".format(key))
+            return
+
+        old = self.storage.load(key)
+        if "items" in old:
+            old = self._import_entity(old)
+
+        compared = len(self.results)
+        try:
+            self._compare(old, entity, entity_type)
+            self.storage.save(key, self._export_entity(entity))
+        except:
+            # changes that have not been stored would be reported again
+            del self.results[compared:]
+            raise
+
+        self._digests[key] = digest
+        self._digests_changed = True
+
+    def _same_item(self, old: Item, new: Item) -> bool:
         """Checks whether a given new item carries the same identifiers 
         as the old one. ::
 
-            >>> rectangle = {
-            ...     "group": "Shapes",
-            ...     "subgroup": "Two-dimensional",
-            ...     "item": "A rectangle",
-            ...     "values": [10, 20]
-            ... }
-
-            >>> new_rectangle = {
-            ...     "group": "Shapes",
-            ...     "subgroup": "Two-dimensional",
-            ...     "item": "A rectangle",
-            ...     "values": [30, 50]
-            ... }
-
-            >>> square = {
-            ...     "group": "Shapes",
-            ...     "subgroup": "Two-dimensional",
-            ...     "item": "A square",
-            ...     "values": [10, 10]
-            ... }
+            >>> rectangle = Item(
+            ...     group="Shapes",
+            ...     subgroup="Two-dimensional",
+            ...     item="A rectangle",
+            ...     values=[10, 20])
+
+            >>> new_rectangle = Item(
+            ...     group="Shapes",
+            ...     subgroup="Two-dimensional",
+            ...     item="A rectangle",
+            ...     values=[30, 50])
+
+            >>> square = Item(
+            ...     group="Shapes",
+            ...     subgroup="Two-dimensional",
+            ...     item="A square",
+            ...     values=[10, 10])
 
             >>> data._same_item(rectangle, square)
             False
@@ -230,56 +477,128 @@ class DataController:
         :param old: an element from the list of items of an old entity.
         :param new: an element from the list of items of a new entity.
         """
-        results = []
-        identifiers = ["group", "subgroup", "item"]
+        hierarchy = new.hierarchy is not None
 
-        if "hierarchy" in new:
-            identifiers.append("hierarchy")
+        return old.key(hierarchy) == new.key(hierarchy)
 
-        for identifier in identifiers:
-            results.append(old[identifier] == new[identifier])
+    def _index_items(self, items: list, entity_type: EntityType) -> tuple:
+        """Indexes items by their identifiers.
 
-        return (False not in results)
+        Items are indexed twice: with and without the hierarchy, because
+        the hierarchy is compared only if the new item has one. Items 
+        sharing the same identifiers are kept in their original order.
 
-    def _compare_items(self, old: list, new: list,
-                       append_if_missing: bool = False) -> list:
-        """Compares two lists of items.
+        :param items: items from an old entity.
+        :param entity_type: type of the entity declaring the identifiers.
+        :returns: an index ignoring the hierarchy and an index including
+            it.
+        """
+        flat, hierarchical = {}, {}
+
+        for item in items:
+            flat.setdefault(
+                entity_type.key(item, hierarchy=False), []).append(item)
+            if item.hierarchy is not None:
+                hierarchical.setdefault(
+                    entity_type.key(item, hierarchy=True), []).append(item)
+
+        return flat, hierarchical
+
+    def _diff_items(self, old: list, new: list,
+                    entity_type: EntityType = None) -> list:
+        """Lists the differences between two versions of the items of an 
+        entity.
+
+        Every detected difference is a copy of the item with its 
+        ``change`` set to one of:
+
+        - ``added``, for an item missing in :attr:`old`,
+        - ``removed``, for an item missing in :attr:`new`, with the values
+          it used to have,
+        - ``changed``, for an item with updated values, carrying the 
+          previous ones in ``old_values``,
+        - ``moved``, for an item found under another hierarchy node, 
+          carrying the previous one in ``old_hierarchy`` and, if its 
+          values have changed as well, ``old_values``.
+
+        The old items are indexed once and both lists are walked once, 
+        so the diff takes linear time. New items are matched exactly 
+        first, only the ones left unmatched are looked up under other 
+        hierarchy nodes. Among items sharing the same identifiers, one 
+        with the same values is preferred, so duplicates are not 
+        reported as changed.
 
         :param old: items from an old entity.
         :param new: items from a new entity.
-        :param append_if_missing: whether the item should be added to the 
-            final results if it is present in :attr:`new` but missing in 
-            :attr:`old`.
-        :returns: items that share the same identifiers but with updated
-            values.
+        :param entity_type: type of the entity declaring the identifiers 
+            of its items, by default items are identified by their group,
+            subgroup, name and hierarchy.
+        :returns: the differences, in the order of :attr:`new`, followed 
+            by the removed items in the order of :attr:`old`.
         """
-        results = []
+        entity_type = entity_type or EntityType(None)
+        flat, hierarchical = self._index_items(old, entity_type)
+        matched = set()
+        pairs = []
 
         for item_new in new:
-            present_in_both = False
-            
-            for index, item_old in enumerate(old):
-                if self._same_item(item_old, item_new):
-                    present_in_both = True
-                    if item_old["values"] != item_new["values"]:
-                        entry = copy.copy(item_new)
-                        entry["old_values"] = item_old["values"]
-                        results.append(entry)
-                        logging.debug(
-                            "Detected change: {}".format(entry))
-                        break
-
-            if append_if_missing and not present_in_both:
-                results.append(item_new)
-                logging.debug("New item found: {}".format(item_new))
+            hierarchy = item_new.hierarchy is not None
+            index = hierarchical if hierarchy else flat
+            item_old = self._match(
+                index.get(entity_type.key(item_new, hierarchy), ()),
+                item_new, matched)
+            pairs.append([item_new, item_old])
+
+        for pair in pairs:
+            item_new, item_old = pair
+            if item_old is None and item_new.hierarchy is not None:
+                pair[1] = self._match(
+                    flat.get(entity_type.key(item_new, False), ()),
+                    item_new, matched)
+
+        results = []
+        for item_new, item_old in pairs:
+            if item_old is None:
+                results.append(item_new.record("added"))
+            elif (item_new.hierarchy is not None
+                  and item_old.hierarchy != item_new.hierarchy):
+                results.append(item_new.record("moved", item_old))
+            elif item_old.values != item_new.values:
+                results.append(item_new.record("changed", item_old))
+
+        results.extend(item.record("removed") for item in old
+                       if id(item) not in matched)
+
+        for entry in results:
+            logging.debug("Detected change: {}".format(entry))
 
         return results
 
-    def _compare(self, old: dict, new: dict) -> None:
+    def _match(self, candidates: list, new: Item, matched: set) -> Item:
+        """Returns the first old item not matched yet, preferring the one 
+        with the same values as the new item, and marks it as matched.
+
+        :param candidates: old items sharing the new item's identifiers.
+        :param new: the new item.
+        :param matched: identifiers (``id()``) of matched old items.
+        """
+        unmatched = [item for item in candidates if id(item) not in matched]
+        if not unmatched:
+            return None
+
+        item = next((item for item in unmatched if item.values == new.values),
+                    unmatched[0])
+        matched.add(id(item))
+
+        return item
+
+    def _compare(self, old: dict, new: dict,
+                 entity_type: EntityType = None) -> None:
         """Compares two entities between eachother.
 
         :param old: locally stored entity.
         :param new: newly retrieved entity.
+        :param entity_type: type of the entities.
         """
         if ("entity" in old and
                 "entity" in new and
@@ -290,8 +609,8 @@ class DataController:
                          + "'{}'".format(entity_name))
             entry = {
                 "entity": new["entity"],
-                "items": self._compare_items(
-                    old["items"], new["items"]),
+                "items": self._diff_items(
+                    old["items"], new["items"], entity_type),
             }
 
             if entry["items"]:
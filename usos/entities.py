@@ -0,0 +1,158 @@
+import re
+import logging
+import importlib
+
+logging = logging.getLogger(__name__)
+
+
+class EntityType:
+    """Describes how the items of an entity are identified and where
+    they are stored. ::
+
+        EntityType(
+            name="course-results-tree",
+            shard_by="group",
+            layout="courses/{shard}")
+
+    An entity uploaded by a ScrapingTemplate is split into shards by the
+    value of the ``shard_by`` field of its items, e.g. one shard per
+    course. Every shard is stored under its own key and compared on its
+    own, so a run rewrites only the shards that have changed. Entities
+    of different accounts are kept apart by the storage.
+
+    :param name: name of the entity, as in its ``entity`` key.
+    :param identity: fields identifying an item of the entity. The
+        ``hierarchy`` is taken into account only for the items that have
+        one.
+    :param shard_by: a field of the items to split the entity by, or
+        ``None`` to store the whole entity together.
+    :param layout: storage key of a shard, with ``{entity}`` and
+        ``{shard}`` placeholders. Defaults to a key under ``entities/``,
+        so that entities without a declared layout never collide.
+    """
+    IDENTITY = ("group", "subgroup", "item", "hierarchy")
+
+    def __init__(self, name: str, identity: tuple = IDENTITY,
+                 shard_by: str = None, layout: str = None) -> None:
+        if layout is None:
+            layout = "entities/{entity}"
+            if shard_by is not None:
+                layout += "/{shard}"
+
+        self.name = name
+        self.identity = tuple(identity)
+        self.shard_by = shard_by
+        self.layout = layout
+
+    def key(self, item: object, hierarchy: bool) -> tuple:
+        """Returns the identifiers of an item.
+
+        :param item: a :class:`usos.data.Item`.
+        :param hierarchy: whether the item's hierarchy is a part of its
+            identity.
+        """
+        if self.identity == self.IDENTITY:
+            return item.key(hierarchy)
+
+        return tuple(_field(item, name) for name in self.identity
+                     if hierarchy or name != "hierarchy")
+
+    def storage_key(self, shard: object = None) -> str:
+        """Returns the key a shard is stored under. ::
+
+            >>> EntityType("course-results-tree", shard_by="group",
+            ...            layout="courses/{shard}").storage_key(
+            ...     "28-INF-S-DOLI")
+            'courses/28-inf-s-doli'
+        """
+        shard = re.sub(r"[^\w.-]", "_", str(shard).lower())
+
+        return self.layout.format(entity=self.name, shard=shard)
+
+    def shards(self, entity: dict) -> list:
+        """Splits an entity into shards.
+
+        :param entity: an entity with :class:`usos.data.Item` objects.
+        :returns: pairs of a storage key and an entity holding the items
+            of a single shard, in the order of their first item.
+        """
+        if self.shard_by is None:
+            return [(self.storage_key(), entity)]
+
+        shards = {}
+        for item in entity["items"]:
+            shards.setdefault(_field(item, self.shard_by), []).append(item)
+
+        return [(self.storage_key(shard), dict(entity, items=items))
+                for shard, items in shards.items()]
+
+
+class EntityRegistry:
+    """Keeps the types of entities produced by the ScrapingTemplates.
+
+    The built-in entities keep their storage layout: ``final-grades`` in
+    a single file and ``course-results-tree`` in a file per course.
+    Additional types can be declared in the ``ENTITIES`` dictionary of
+    the templates package, with the arguments of :class:`EntityType`::
+
+        ENTITIES = {
+            "exam-schedule": {"shard_by": "group"},
+        }
+
+    Entities that have not been declared are stored whole, under
+    ``entities/<name>``.
+
+    :param package: name of the package containing the templates.
+    """
+    DEFAULTS = {
+        "final-grades": {
+            "layout": "final-grades",
+        },
+        "course-results-tree": {
+            "shard_by": "group",
+            "layout": "courses/{shard}",
+        },
+    }
+
+    def __init__(self, package: str = "templates.scraping") -> None:
+        self.package = package
+        self._types = {}
+
+        for name, declaration in self.DEFAULTS.items():
+            self.register(EntityType(name, **declaration))
+        self._discover()
+
+    def register(self, entity_type: EntityType) -> None:
+        """Adds or replaces the type of an entity."""
+        self._types[entity_type.name] = entity_type
+
+    def get(self, name: str) -> EntityType:
+        """Returns the type of an entity, a default one if it has not
+        been declared."""
+        if name not in self._types:
+            logging.info("Entity '{}' has not been declared, ".format(name)
+                         + "storing it whole")
+            self.register(EntityType(name))
+
+        return self._types[name]
+
+    def _discover(self) -> None:
+        """Registers the entities declared by the templates package."""
+        try:
+            package = importlib.import_module(self.package)
+        except ImportError:
+            logging.debug("Templates package '{}' not found".format(
+                self.package))
+            return
+
+        for name, declaration in getattr(package, "ENTITIES", {}).items():
+            self.register(EntityType(name, **declaration))
+
+
+def _field(item: object, name: str) -> object:
+    """Returns a field of an item, including the ones kept in its
+    ``extra`` dictionary."""
+    if name in item.__slots__:
+        return getattr(item, name)
+
+    return (item.extra or {}).get(name)
@@ -0,0 +1,183 @@
+import os
+import json
+import heapq
+import logging
+import threading
+
+logging = logging.getLogger(__name__)
+
+
+class Frontier:
+    """Keeps track of destinations waiting to be visited by the scraper.
+
+    Every destination is accepted only once, no matter how many times it
+    is discovered. Pending destinations are handed out by their priority,
+    then by depth, then in the order of discovery. ::
+
+        from usos.frontier import Frontier
+
+        frontier = Frontier(
+            priorities={"dla_stud/studia/oceny": 0},
+            max_depth=2)
+
+        frontier.put("dla_stud/studia/sprawdziany/index")
+        frontier.put("dla_stud/studia/oceny/index")
+
+        while True:
+            entry = frontier.get()
+            if entry is None:
+                break
+
+            destination, depth = entry
+            ...
+            frontier.task_done()
+
+    :meth:`get` blocks while other threads are still processing their
+    destinations, as they may discover new ones. It returns ``None`` once
+    nothing is pending and nothing is being processed, so multiple
+    workers can drain the frontier without any coordination.
+
+    :param priorities: priorities of destinations starting with a given
+        prefix, lower values are visited first. Defaults to ``1``.
+    :param max_depth: maximum number of links followed from the initial
+        destinations, unlimited if ``None``.
+    :param max_pages: maximum number of destinations accepted during a
+        single run, unlimited if ``None``.
+    :param snapshot: path to a JSON file the discovered destinations are
+        saved to by :meth:`save` and restored from by :meth:`restore`.
+    """
+    def __init__(self, priorities: dict = {}, max_depth: int = None,
+                 max_pages: int = None, snapshot: str = None) -> None:
+        self.priorities = priorities
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.snapshot = snapshot
+        self.discovered = {}
+        self.visited = set()
+        self._pending = []
+        self._counter = 0
+        self._in_progress = 0
+        self._condition = threading.Condition()
+
+    def put(self, destination: str, depth: int = 0) -> bool:
+        """Adds a destination to the frontier.
+
+        :param destination: a normalized destination.
+        :param depth: number of links followed to discover it.
+        :returns: ``True`` if the destination has been accepted,
+            ``False`` if it is already known or exceeds the limits.
+        """
+        with self._condition:
+            if destination in self.discovered:
+                return False
+
+            if self.max_depth is not None and depth > self.max_depth:
+                logging.debug("'{}' exceeds the maximum depth".format(
+                    destination))
+                return False
+
+            if (self.max_pages is not None
+                    and len(self.discovered) >= self.max_pages):
+                logging.warning("Maximum number of pages reached, "
+                                + "skipping '{}'".format(destination))
+                return False
+
+            self.discovered[destination] = depth
+            self._counter += 1
+            heapq.heappush(self._pending, (
+                self._get_priority(destination), depth, self._counter,
+                destination))
+            self._condition.notify()
+
+        return True
+
+    def get(self) -> tuple:
+        """Takes the next destination to visit.
+
+        Every destination taken has to be followed by a call to
+        :meth:`task_done` once it has been processed.
+
+        :returns: a tuple of a destination and its depth, or ``None`` if
+            the crawl is complete.
+        """
+        with self._condition:
+            while not self._pending:
+                if not self._in_progress:
+                    return None
+                self._condition.wait()
+
+            _, depth, _, destination = heapq.heappop(self._pending)
+            self.visited.add(destination)
+            self._in_progress += 1
+
+        return destination, depth
+
+    def task_done(self) -> None:
+        """Marks a destination taken with :meth:`get` as processed."""
+        with self._condition:
+            self._in_progress -= 1
+
+            if not self._in_progress and not self._pending:
+                self._condition.notify_all()
+
+    def __len__(self) -> int:
+        """Returns the number of pending destinations."""
+        with self._condition:
+            return len(self._pending)
+
+    def restore(self) -> int:
+        """Adds destinations discovered during the previous run, as saved
+        in the ``snapshot`` file.
+
+        :returns: number of destinations added.
+        """
+        if not self.snapshot or not os.path.isfile(self.snapshot):
+            return 0
+
+        try:
+            with open(self.snapshot, 'r') as working_file:
+                discovered = json.load(working_file)["discovered"]
+        except (IOError, ValueError, KeyError):
+            logging.exception("Frontier snapshot '{}' ".format(
+                self.snapshot) + "could not be restored")
+            return 0
+
+        restored = 0
+        for destination, depth in discovered.items():
+            restored += self.put(destination, depth)
+
+        logging.info("Restored {} destinations from '{}'".format(
+            restored, self.snapshot))
+        return restored
+
+    def save(self) -> None:
+        """Saves the discovered destinations to the ``snapshot`` file."""
+        if not self.snapshot:
+            return
+
+        with self._condition:
+            data = {"discovered": dict(self.discovered)}
+
+        dirname = os.path.dirname(self.snapshot)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        temporary = self.snapshot + ".tmp"
+        with open(temporary, 'w') as working_file:
+            json.dump(data, working_file)
+        os.replace(temporary, self.snapshot)
+
+        logging.info("Saved {} destinations to '{}'".format(
+            len(data["discovered"]), self.snapshot))
+
+    def _get_priority(self, destination: str) -> int:
+        """Returns the priority of the longest matching prefix."""
+        priority = 1
+        longest = -1
+
+        for prefix, value in self.priorities.items():
+            if destination.startswith(prefix) and len(prefix) > longest:
+                priority = value
+                longest = len(prefix)
+
+        return priority
@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import bisect
+import logging
+from datetime import datetime
+
+logging = logging.getLogger(__name__)
+
+
+class ChangeLog:
+    """Keeps the history of changes detected for an account. ::
+
+        from usos.history import ChangeLog
+
+        history = ChangeLog("data/history")
+        history.append(data_controller.results)
+
+        history.first_seen("28-INF-S-DOLI", "Egzamin")
+        history.changes("28-INF-S-DOLI", since="20180601")
+
+    Every change is appended as a single JSON line to ``changes.log``,
+    so recording a run costs one write to the end of a file. Once the
+    log holds ``compact_every`` changes, :meth:`compaction_due` tells
+    the caller to :meth:`compact` it, e.g. at the end of a run, into
+    one snapshot per ``group`` of the items under ``courses/``, sorted by
+    time. Queries read the snapshot of a single group and the short tail
+    of the log, never the whole history.
+
+    The group is whatever the entity stores in the ``group`` of its
+    items: the course code for ``course-results-tree``, but the
+    semester, e.g. ``2018L``, for ``final-grades``, whose course is the
+    ``subgroup``. Changes of a final grade are therefore queried by its
+    semester.
+
+    Timestamps are in UTC, formatted as ``20180615T101500123456``, so
+    that any prefix of them, e.g. ``20180615``, can be used as a date.
+
+    :param directory: directory the history is stored in.
+    :param compact_every: number of logged changes after which a
+        compaction is due.
+    """
+    timestamp_format = "%Y%m%dT%H%M%S%f"
+
+    def __init__(self, directory: str = "data/history",
+                 compact_every: int = 1000) -> None:
+        self.directory = directory
+        self.compact_every = compact_every
+        self.log_file = os.path.join(directory, "changes.log")
+        self.snapshot_dir = os.path.join(directory, "courses")
+        self._logged = None
+
+    def append(self, results: list, timestamp: str = None) -> int:
+        """Appends detected changes to the log.
+
+        :param results: changed entities, in the format of
+            :attr:`usos.data.DataController.results`.
+        :param timestamp: time of the changes, defaults to now.
+        :returns: number of logged changes.
+        """
+        if timestamp is None:
+            timestamp = datetime.utcnow().strftime(self.timestamp_format)
+
+        lines = [json.dumps({"at": timestamp, "entity": entity["entity"],
+                             "item": item}, sort_keys=True) + "\n"
+                 for entity in results for item in entity["items"]]
+
+        if not lines:
+            return 0
+
+        logged = self._count_logged()
+
+        os.makedirs(self.directory, exist_ok=True)
+        if not self._log_terminated():
+            # a write torn by a crash would swallow the first new line
+            lines.insert(0, "\n")
+
+        with open(self.log_file, 'a', encoding="utf-8") as working_file:
+            working_file.write("".join(lines))
+
+        logged_lines = len(lines) - (lines[0] == "\n")
+        self._logged = logged + logged_lines
+        logging.info("Logged {} changes to '{}'".format(
+            logged_lines, self.log_file))
+
+        return logged_lines
+
+    def compaction_due(self) -> bool:
+        """Returns whether the log holds enough changes to be compacted."""
+        return self._count_logged() >= self.compact_every
+
+    def compact(self) -> None:
+        """Moves the changes from the log into the snapshots of their
+        courses.
+
+        Only the snapshots of the courses found in the log are rewritten,
+        each one atomically. The log is truncated only afterwards, so an
+        interrupted compaction never loses a change. A change found both
+        in a snapshot and in the log is kept once.
+        """
+        logged = self._read_log()
+        if not logged:
+            return
+
+        updates = {}
+        for change in logged:
+            group = change["item"].get("group")
+            updates.setdefault(self._snapshot_file(group), {}).setdefault(
+                group, []).append(change)
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        for filename, changes in updates.items():
+            courses = self._read_snapshot(filename)
+
+            for group, entries in changes.items():
+                compacted = courses.setdefault(group, [])
+                known = {_canonical(entry) for entry in compacted}
+                compacted.extend(entry for entry in entries
+                                 if _canonical(entry) not in known)
+                compacted.sort(key=lambda entry: entry["at"])
+
+            temporary = filename + ".tmp"
+            with open(temporary, 'w', encoding="utf-8") as working_file:
+                json.dump({"courses": courses}, working_file)
+            os.replace(temporary, filename)
+
+        open(self.log_file, 'w').close()
+        self._logged = 0
+
+        logging.info("Compacted {} changes of {} courses into '{}'".format(
+            len(logged), len(updates), self.snapshot_dir))
+
+    def changes(self, group: str, since: str = None,
+                until: str = None) -> list:
+        """Returns changes of a group, from the oldest one.
+
+        :param group: the ``group`` of the items, i.e. a course code or
+            the semester of final grades.
+        :param since: the earliest timestamp or date to include.
+        :param until: the latest timestamp or date to include, e.g.
+            ``20180615`` includes the whole day.
+        :returns: changes with their time (``at``), entity and item.
+        """
+        if until is not None:
+            until += "\uffff"
+
+        compacted = self._read_snapshot(
+            self._snapshot_file(group)).get(group, [])
+        timestamps = [entry["at"] for entry in compacted]
+
+        start = 0 if since is None else bisect.bisect_left(
+            timestamps, since)
+        end = len(compacted) if until is None else bisect.bisect_right(
+            timestamps, until)
+        compacted = compacted[start:end]
+
+        known = {_canonical(entry) for entry in compacted}
+        recent = [change for change in self._read_log()
+                  if change["item"].get("group") == group
+                  and (since is None or change["at"] >= since)
+                  and (until is None or change["at"] <= until)
+                  and _canonical(change) not in known]
+
+        return compacted + recent
+
+    def first_seen(self, group: str, item: str,
+                   hierarchy: str = None) -> str:
+        """Returns the time an item appeared for the first time, e.g.
+        when a grade has been published.
+
+        :param group: the ``group`` of the item.
+        :param item: name of the item.
+        :param hierarchy: hierarchy of the item, if it has one, without
+            a leading "/", e.g. ``Egzamin/Zadanie 1``.
+        :returns: a timestamp or ``None`` if the item has not been seen.
+        """
+        for change in self.changes(group):
+            logged = change["item"]
+            if (logged.get("item") == item
+                    and logged.get("hierarchy") == hierarchy):
+                return change["at"]
+
+        return None
+
+    def _log_terminated(self) -> bool:
+        """Returns whether the log is missing, empty or ends with a new
+        line, i.e. whether appending to it starts a new line."""
+        try:
+            with open(self.log_file, 'rb') as working_file:
+                working_file.seek(0, os.SEEK_END)
+                if working_file.tell() == 0:
+                    return True
+                working_file.seek(-1, os.SEEK_END)
+                return working_file.read(1) == b"\n"
+        except FileNotFoundError:
+            return True
+
+    def _count_logged(self) -> int:
+        """Returns the number of changes in the log, counted once."""
+        if self._logged is None:
+            self._logged = 0
+            if os.path.isfile(self.log_file):
+                with open(self.log_file, 'rb') as working_file:
+                    self._logged = sum(1 for _ in working_file)
+
+        return self._logged
+
+    def _read_log(self) -> list:
+        """Returns the changes from the log, skipping a line cut short by
+        an interrupted write."""
+        changes = []
+
+        if os.path.isfile(self.log_file):
+            with open(self.log_file, 'r', encoding="utf-8") as working_file:
+                for line in working_file:
+                    try:
+                        changes.append(json.loads(line))
+                    except ValueError:
+                        logging.warning("Skipping a damaged line of "
+                                        + "'{}'".format(self.log_file))
+
+        return changes
+
+    def _snapshot_file(self, group: str) -> str:
+        """Returns the path of the snapshot holding a course.
+
+        Courses whose names differ only in characters not allowed in a
+        filename share a snapshot, which keeps them apart by their name.
+        """
+        name = re.sub(r"[^\w.-]", "_", str(group).lower())
+        return os.path.join(self.snapshot_dir, name + ".json")
+
+    def _read_snapshot(self, filename: str) -> dict:
+        """Returns the compacted changes of a snapshot, keyed by the
+        course."""
+        if not os.path.isfile(filename):
+            return {}
+
+        with open(filename, 'r', encoding="utf-8") as working_file:
+            return json.load(working_file)["courses"]
+
+
+def _canonical(change: dict) -> str:
+    """Returns a hashable representation of a logged change."""
+    return json.dumps(change, sort_keys=True)
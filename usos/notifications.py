@@ -1,12 +1,76 @@
 import sys
 import json
+import time
+import atexit
+import socket
 import os.path
 import logging
+import smtplib
+import threading
 import yagmail
-from jinja2 import Environment, FileSystemLoader
+from email.message import EmailMessage
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 
 logging = logging.getLogger(__name__)
 
+TEMPLATES_DIR = "templates/notifications"
+
+_bytecode_cache = None
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def set_bytecode_cache(directory: str) -> None:
+    """Keeps the compiled notification templates in a given directory,
+    so that every template is compiled once per deploy rather than once
+    per process. A template is compiled again when its file changes.
+
+    :param directory: directory for the compiled templates, created if
+        missing.
+    """
+    global _bytecode_cache
+
+    os.makedirs(directory, exist_ok=True)
+    logging.info("Caching compiled templates in '{}'".format(directory))
+
+    with _environments_lock:
+        _bytecode_cache = FileSystemBytecodeCache(directory)
+        _environments.clear()
+
+
+_smtp_sessions = {}
+_smtp_sessions_lock = threading.Lock()
+
+
+def get_template(name: str, directory: str = TEMPLATES_DIR) -> object:
+    """Returns a compiled Jinja2 template.
+
+    Every directory of templates has a single environment shared by all
+    channels and threads, which keeps the compiled templates in memory,
+    so a template is loaded once and only checked for changes
+    afterwards::
+
+        from usos.notifications import get_template
+
+        template = get_template("Email.html")
+        template.render(data=results)
+
+    :param name: name of the template's file.
+    :param directory: directory of the templates.
+    """
+    with _environments_lock:
+        environment = _environments.get(directory)
+
+        if environment is None:
+            environment = Environment(
+                loader=FileSystemLoader(directory),
+                bytecode_cache=_bytecode_cache,
+                lstrip_blocks=True,
+                trim_blocks=True)
+            _environments[directory] = environment
+
+    return environment.get_template(name)
+
 
 class Dispatcher:
     """Allows for sending multiple messages via configured channels. 
@@ -25,32 +89,99 @@ class Dispatcher:
         notifications.
     :param config_file: path to a file that contains channel-specific 
         variables such as API Keys or special parameters.
+    :param timeout: seconds every channel is given to render and send 
+        its notification, unless its configuration sets a ``timeout`` 
+        of its own.
     """
+    STATUSES = ("sent", "failed", "timeout", "disabled")
 
     def __init__(self, channels: str, enable: bool,
-                 config_file: str) -> None:
+                 config_file: str, timeout: float = 60) -> None:
         self.channels = channels.split(" ")
         self.enable = enable
+        self.config_file = config_file
         self.config = self._load_config(config_file)
+        self.timeout = timeout
 
-    def send(self, data: dict) -> bool:
+    def send(self, data: dict) -> dict:
         """Sends notifications via channels set in the initializer.
 
+        Every channel renders and sends its notification on its own 
+        thread, so a slow channel does not hold up the others and the 
+        whole dispatch takes as long as the slowest channel. A channel 
+        that does not finish within its timeout is left behind on a 
+        daemon thread and reported as ``timeout``.
+
         :param data: the data that will be sent.
-        :returns: ``True`` if every notification has been sent 
-            successfuly on every channel.
+        :returns: the status of every channel: ``sent``, ``failed``, 
+            ``timeout`` or ``disabled``.
         """
         logging.info("Preparing dispatcher")
-        for channel in self.channels:
-            self.send_single(channel, data)
 
-        return True
+        if not self.enable:
+            return {channel: "disabled" for channel in self.channels}
+
+        results = {}
+        started = time.monotonic()
+        threads = [(channel, self._start(channel, data, results))
+                   for channel in self.channels]
 
-    def send_single(self, channel: str, data: dict) -> bool:
+        statuses = {channel: self._status(channel, thread, results, started)
+                    for channel, thread in threads}
+
+        logging.info("Dispatched notifications in {:.2f}s: {}".format(
+            time.monotonic() - started, statuses))
+
+        return statuses
+
+    def deliver(self, channel: str, data: dict,
+                recipient: str = None) -> str:
+        """Sends notifications via a single channel, within its timeout.
+
+        :param channel: a name of the channel.
+        :param data: data that will be used to render the templates.
+        :param recipient: one of the channel's :meth:`recipients` to
+            send the notification to, instead of all of them.
+        :returns: the status of the channel, as in :meth:`send`.
+        """
+        if not self.enable:
+            return "disabled"
+
+        results = {}
+        started = time.monotonic()
+        thread = self._start(channel, data, results, recipient)
+
+        return self._status(channel, thread, results, started)
+
+    def recipients(self, channel: str) -> list:
+        """Returns the recipients of a channel that can be sent their
+        notifications one at a time, see :attr:`Notification.RECIPIENTS`.
+
+        :param channel: a name of the channel.
+        :returns: the recipients, or ``[None]`` if the channel sends a
+            single notification to all of them.
+        """
+        field = getattr(getattr(sys.modules[__name__], channel, None),
+                        "RECIPIENTS", None)
+        channel_config = self.config.get(channel)
+
+        recipients = None
+        if field is not None and isinstance(channel_config, dict):
+            recipients = channel_config.get(field)
+
+        if isinstance(recipients, str):
+            return [recipients]
+
+        return list(recipients) if recipients else [None]
+
+    def send_single(self, channel: str, data: dict,
+                    recipient: str = None) -> bool:
         """Sends notifications via a single, given channel.
 
         :param channel: a name of the channel.
         :param data: data that will be used to render the templates.
+        :param recipient: one of the channel's :meth:`recipients`, all of
+            them by default.
         :returns: ``True`` if the notifications have been sent 
             successfuly on a given channel.
         """
@@ -61,13 +192,60 @@ class Dispatcher:
                 channel_config = {}
                 logging.exception("No configuration detected for {}".format(channel))
             
-            stream = getattr(sys.modules[__name__], channel)(
-                data=data, config=channel_config)
+            stream_class = getattr(sys.modules[__name__], channel)
+            if recipient is not None:
+                channel_config = dict(channel_config,
+                                      **{stream_class.RECIPIENTS: recipient})
+
+            stream = stream_class(data=data, config=channel_config)
             logging.info("Sending notifications via {}".format(channel))
             return stream.render_and_send()
 
         return False
 
+    def _start(self, channel: str, data: dict, results: dict,
+               recipient: str = None) -> threading.Thread:
+        """Starts sending notifications via a channel on a daemon thread."""
+        thread = threading.Thread(
+            target=self._send_channel,
+            args=(channel, data, results, recipient),
+            name="notifications-{}".format(channel), daemon=True)
+        thread.start()
+
+        return thread
+
+    def _status(self, channel: str, thread: threading.Thread,
+                results: dict, started: float) -> str:
+        """Waits for a channel until its timeout and returns its status."""
+        deadline = started + self._timeout(channel)
+        thread.join(max(deadline - time.monotonic(), 0))
+
+        if thread.is_alive():
+            logging.error("Channel {} has timed out".format(channel))
+            return "timeout"
+        elif results.get(channel):
+            return "sent"
+
+        return "failed"
+
+    def _send_channel(self, channel: str, data: dict, results: dict,
+                      recipient: str = None) -> None:
+        """Sends notifications via a single channel, recording whether
+        they have been sent."""
+        try:
+            results[channel] = self.send_single(channel, data, recipient)
+        except Exception:
+            logging.exception("Sending via {} has failed".format(channel))
+            results[channel] = False
+
+    def _timeout(self, channel: str) -> float:
+        """Returns the timeout of a channel, in seconds."""
+        channel_config = self.config.get(channel)
+        if isinstance(channel_config, dict) and "timeout" in channel_config:
+            return float(channel_config["timeout"])
+
+        return self.timeout
+
     def _load_config(self, filename: str) -> dict:
         """Loads a configuration file containing channel-specific 
         variables.
@@ -135,6 +313,10 @@ class Notification:
     :param config: variables that can be used for configuration purposes 
         such as API Keys or custom parameters.
     """
+    #: name of the configuration variable listing the recipients, set it
+    #: if every recipient can be sent the notification on their own, so
+    #: that a failed delivery is retried only for the ones it failed for
+    RECIPIENTS = None
 
     def __init__(self, data: dict, config: dict = {}) -> None:
         self.data = data
@@ -204,31 +386,212 @@ class Notification:
         return False
 
 
+class SmtpSession:
+    """Sends many messages over a single, long-lived SMTP connection.
+
+    The connection is opened with the first message and kept open, so a
+    fan-out to many recipients costs a single TLS and login handshake.
+    After ``max_messages`` messages the connection is opened again, as
+    servers limit the messages accepted per connection. A connection
+    dropped by the server is opened again and the message is retried
+    once. ::
+
+        session = SmtpSession(
+            connect=lambda: smtplib.SMTP("localhost", 8025),
+            max_messages=100)
+
+        session.send(message)
+        session.close()
+
+    A session may be shared between threads, the messages are sent one
+    at a time.
+
+    :param connect: a callable returning a connected and logged in
+        :class:`smtplib.SMTP`.
+    :param max_messages: number of messages sent before the connection
+        is opened again.
+    """
+
+    def __init__(self, connect: object, max_messages: int = 100) -> None:
+        self.connect = connect
+        self.max_messages = max_messages
+        self.handshakes = 0
+        self.sent = 0
+        self._connection = None
+        self._messages = 0
+        self._lock = threading.Lock()
+
+    def send(self, message: EmailMessage) -> bool:
+        """Sends a message, reconnecting if needed.
+
+        :param message: the message with its sender and recipients.
+        :returns: ``True`` if every recipient has been accepted.
+        """
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._messages >= self.max_messages:
+                        self._disconnect()
+                    if self._connection is None:
+                        self._connect()
+
+                    refused = self._connection.send_message(message)
+                except (smtplib.SMTPServerDisconnected, ConnectionError,
+                        socket.timeout):
+                    logging.warning("SMTP connection lost, reconnecting",
+                                    exc_info=True)
+                    self._disconnect()
+                    continue
+                except (smtplib.SMTPException, OSError):
+                    logging.exception("Sending a message to {} ".format(
+                        message["To"]) + "has failed")
+                    return False
+
+                self._messages += 1
+                self.sent += 1
+                if refused:
+                    logging.error("Recipients refused: {}".format(refused))
+
+                return not refused
+
+        logging.error("Sending a message to {} has failed ".format(
+            message["To"]) + "after reconnecting")
+        return False
+
+    def close(self, timeout: float = -1) -> bool:
+        """Closes the connection, if it is open.
+
+        :param timeout: seconds to wait for a message being sent by
+            another thread, waits as long as needed by default.
+        :returns: ``False`` if the session has been busy for longer than
+            ``timeout`` and has been left open.
+        """
+        if not self._lock.acquire(timeout=timeout):
+            logging.warning("SMTP session is busy, leaving it open")
+            return False
+
+        try:
+            self._disconnect()
+        finally:
+            self._lock.release()
+
+        return True
+
+    def _connect(self) -> None:
+        self._connection = self.connect()
+        self._messages = 0
+        self.handshakes += 1
+        logging.info("Opened SMTP connection #{}".format(self.handshakes))
+
+    def _disconnect(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._connection = None
+
+
+def smtp_session(config: dict) -> SmtpSession:
+    """Returns the SMTP session shared by every Email notification with
+    the same server and sender.
+
+    Without ``smtp_host``, the session signs in to Gmail with the OAuth2
+    credentials of ``oauth2_creds.json``. Otherwise it connects to a
+    given server, e.g. a local relay, with optional ``smtp_port``,
+    ``smtp_starttls`` and ``smtp_password``. ``smtp_max_messages`` sets
+    the messages sent per connection.
+
+    :param config: configuration of the Email channel.
+    """
+    key = (config.get("smtp_host"), config.get("smtp_port"),
+           config["mail_sender"])
+
+    with _smtp_sessions_lock:
+        if key not in _smtp_sessions:
+            _smtp_sessions[key] = SmtpSession(
+                connect=lambda: _smtp_connect(config),
+                max_messages=int(config.get("smtp_max_messages", 100)))
+
+        return _smtp_sessions[key]
+
+
+def close_smtp_sessions(timeout: float = 1) -> None:
+    """Closes the connections of every shared SMTP session.
+
+    Sessions still sending a message, e.g. from a delivery thread
+    abandoned after its timeout, are skipped after ``timeout`` seconds,
+    so that the process can exit.
+
+    :param timeout: seconds to wait for each busy session.
+    """
+    with _smtp_sessions_lock:
+        sessions = list(_smtp_sessions.values())
+        _smtp_sessions.clear()
+
+    for session in sessions:
+        session.close(timeout=timeout)
+
+
+atexit.register(close_smtp_sessions)
+
+
+def _smtp_connect(config: dict) -> smtplib.SMTP:
+    """Opens a connection for an Email channel, see :func:`smtp_session`."""
+    if "smtp_host" not in config:
+        yag = yagmail.SMTP(config["mail_sender"],
+                           oauth2_file="oauth2_creds.json")
+        yag.login()
+        return yag.smtp
+
+    connection = smtplib.SMTP(config["smtp_host"],
+                              int(config.get("smtp_port", 25)), timeout=30)
+    if config.get("smtp_starttls"):
+        connection.starttls()
+    if config.get("smtp_password"):
+        connection.login(config["mail_sender"], config["smtp_password"])
+
+    return connection
+
+
 class Email(Notification):
-    """Sends a notification via Email"""
+    """Sends a notification via Email.
+
+    ``mail_recipient`` may be a single address or a list of them, every
+    recipient gets a separate message, sent over a shared
+    :class:`SmtpSession`.
+    """
+    RECIPIENTS = "mail_recipient"
 
     def _render(self) -> None:
         """Renders an Email template"""
-        env = Environment(
-            loader=FileSystemLoader('templates/notifications'),
-            lstrip_blocks=True,
-            trim_blocks=True)
-        template = env.get_template('Email.html')
+        template = get_template('Email.html')
 
         self._rendered_template = template.render(data=self.data)
 
     def _send(self) -> bool:
         """Send an Email notification"""
-        with yagmail.SMTP(self.config["mail_sender"],
-                          oauth2_file="oauth2_creds.json") as yag:
-            status = yag.send(
-                self.config["mail_recipient"],
-                self.config["mail_subject"],
-                self._rendered_template)
+        session = smtp_session(self.config)
+
+        recipients = self.config["mail_recipient"]
+        if isinstance(recipients, str):
+            recipients = [recipients]
+
+        sent = [session.send(self._message(recipient))
+                for recipient in recipients]
+        logging.info("Sent {} of {} mails".format(sum(sent), len(sent)))
+
+        return all(sent)
 
-        logging.info("Sending mail status: {}".format(status))
+    def _message(self, recipient: str) -> EmailMessage:
+        """Builds the message for a single recipient."""
+        message = EmailMessage()
+        message["From"] = self.config["mail_sender"]
+        message["To"] = recipient
+        message["Subject"] = self.config["mail_subject"]
+        message.set_content(self._rendered_template, subtype="html")
 
-        return True  # FIXME
+        return message
 
 
 class SMS(Notification):
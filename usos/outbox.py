@@ -0,0 +1,449 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from usos.data import Item
+from usos.entities import EntityRegistry
+from usos.notifications import Dispatcher
+
+logging = logging.getLogger(__name__)
+
+
+class Outbox:
+    """Keeps the notifications until they are delivered, in a SQLite
+    database shared by every account. ::
+
+        from usos.outbox import Outbox
+
+        outbox = Outbox("data/outbox.sqlite3")
+        data = DataController(dispatcher=dispatcher, outbox=outbox)
+
+        ...
+        data.analyze()
+
+        # later, e.g. by a separate cron job
+        Outbox("data/outbox.sqlite3").drain()
+
+    :meth:`enqueue` stores a message for every channel of a dispatcher,
+    before the detected changes are committed, so a run finishes as soon
+    as the changes are persisted and a failed delivery never loses them.
+    Channels sending to every recipient on their own, such as ``Email``,
+    get a message per recipient, so a retry reaches only the recipients
+    the delivery has failed for.
+    :meth:`drain` delivers the due messages. A failed message is retried
+    after an exponentially growing delay: ``backoff``, twice as long,
+    four times as long and so on, up to ``max_backoff``. After
+    ``max_attempts`` failures, the message is marked as ``dead`` and
+    kept, with its last error, for inspection. Delivered messages are
+    deleted.
+
+    Messages are delivered at least once: a message whose channel has
+    timed out is retried, even if the channel sends it eventually.
+
+    With a coalescing ``window``, a message waits until the window
+    closes and the changes detected in the meantime for the same
+    account are merged into it, see :func:`coalesce`, so a course
+    changing several times an hour ends up in a single digest.
+
+    :param database: path to the database file, created if missing.
+    :param max_attempts: number of failed deliveries after which a
+        message is dead-lettered.
+    :param backoff: seconds before the first retry.
+    :param max_backoff: the longest delay between retries, in seconds.
+    :param concurrency: number of messages delivered at the same time
+        via a single channel, unless the channel's configuration sets a
+        ``concurrency`` of its own.
+    :param account: name of the account the enqueued messages belong to.
+    :param window: seconds a message waits for further changes before
+        it is delivered, ``0`` delivers it with the next drain.
+    :param entities: a :class:`usos.entities.EntityRegistry` used to
+        keep the merged entities apart by their shards, e.g. courses.
+    :param timeout: seconds every channel is given to deliver a message,
+        see :class:`usos.notifications.Dispatcher`.
+    """
+    STATUSES = ("pending", "dead")
+    LEASE = 600
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            account TEXT NOT NULL DEFAULT '',
+            config_file TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            recipient TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS due_messages
+            ON messages (status, next_attempt);
+    """
+
+    def __init__(self, database: str, max_attempts: int = 8,
+                 backoff: float = 60, max_backoff: float = 3600,
+                 concurrency: int = 4, account: str = "",
+                 window: float = 0, entities: object = None,
+                 timeout: float = 60) -> None:
+        self.database = database
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.concurrency = concurrency
+        self.account = account
+        self.window = window
+        self.entities = entities or EntityRegistry()
+        self.timeout = timeout
+        self._dispatchers = {}
+
+        dirname = os.path.dirname(database)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._connection = sqlite3.connect(database, timeout=30)
+        self._connection.executescript(self.SCHEMA)
+        self._migrate()
+
+    def enqueue(self, results: list, dispatcher: object,
+                now: float = None) -> int:
+        """Stores a message with the results for every channel of a
+        dispatcher, or merges the results into the account's message
+        whose coalescing window is still open.
+
+        :param results: changed entities, in the format of
+            :attr:`usos.data.DataController.results`.
+        :param dispatcher: the :class:`usos.notifications.Dispatcher`
+            of the account, its channels and configuration file are used
+            for the delivery.
+        :param now: time of the enqueueing, defaults to now.
+        :returns: number of stored messages.
+        """
+        if not dispatcher.enable:
+            logging.info("Notifications are disabled, nothing to enqueue")
+            return 0
+
+        now = time.time() if now is None else now
+        stored = 0
+
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+
+            for channel in dispatcher.channels:
+                for recipient in dispatcher.recipients(channel):
+                    self._enqueue(results, dispatcher.config_file, channel,
+                                  recipient, now)
+                    stored += 1
+
+        logging.info("Enqueued notifications via {}".format(
+            dispatcher.channels))
+        return stored
+
+    def drain(self, now: float = None) -> dict:
+        """Delivers the messages that are due.
+
+        Channels are delivered concurrently, each by up to its
+        ``concurrency`` messages at a time. The due messages are leased
+        for ``LEASE`` seconds first, so that drains running at the same
+        time never deliver the same message twice, and counted as
+        attempted, so that no more changes are merged into them.
+
+        :param now: time of the delivery, defaults to now.
+        :returns: number of messages ``sent``, ``retried`` and ``dead``.
+        """
+        now = time.time() if now is None else now
+
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            rows = self._connection.execute(
+                "SELECT id, config_file, channel, recipient, payload, "
+                + "attempts FROM messages WHERE status = 'pending' "
+                + "AND next_attempt <= ? ORDER BY id", (now,)).fetchall()
+            self._connection.executemany(
+                "UPDATE messages SET next_attempt = ?, attempts = ? "
+                + "WHERE id = ?",
+                [(now + self.LEASE, row[5] + 1, row[0]) for row in rows])
+
+        queues = {}
+        for row in rows:
+            queues.setdefault((row[1], row[2]), []).append(row)
+
+        statuses = {}
+        threads = []
+        for (config_file, channel), queue in queues.items():
+            dispatcher = self._dispatcher(config_file)
+            for _ in range(min(self._concurrency(dispatcher, channel),
+                               len(queue))):
+                thread = threading.Thread(
+                    target=self._deliver,
+                    args=(dispatcher, channel, queue, statuses))
+                thread.start()
+                threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        counts = {"sent": 0, "retried": 0, "dead": 0}
+        with self._connection:
+            for message, _, channel, recipient, _, attempts in rows:
+                counts[self._record(message, channel, recipient,
+                                    attempts + 1, statuses[message],
+                                    now)] += 1
+
+        if rows:
+            logging.info("Drained the outbox: {}".format(counts))
+
+        return counts
+
+    def _enqueue(self, results: list, config_file: str, channel: str,
+                 recipient: str, now: float) -> None:
+        """Stores or merges a message for a single channel and
+        recipient."""
+        row = None
+        if self.window:
+            row = self._connection.execute(
+                "SELECT id, payload FROM messages WHERE account = ? "
+                + "AND config_file = ? AND channel = ? AND recipient IS ? "
+                + "AND status = 'pending' AND attempts = 0 "
+                + "AND next_attempt > ? ORDER BY id DESC LIMIT 1",
+                (self.account, config_file, channel, recipient,
+                 now)).fetchone()
+
+        if row is None:
+            self._connection.execute(
+                "INSERT INTO messages (account, config_file, channel, "
+                + "recipient, payload, next_attempt) "
+                + "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.account, config_file, channel, recipient,
+                 json.dumps(results), now + self.window))
+            return
+
+        message, payload = row
+        logging.info("Merging changes into message #{}".format(message))
+        self._connection.execute(
+            "UPDATE messages SET payload = ? WHERE id = ?",
+            (json.dumps(coalesce(json.loads(payload), results,
+                                 self.entities)), message))
+
+    def pending(self) -> int:
+        """Returns the number of messages waiting for a delivery."""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM messages WHERE status = 'pending'"
+        ).fetchone()[0]
+
+    def dead(self) -> list:
+        """Returns the dead-lettered messages, with their ``id``,
+        ``channel``, ``attempts`` and ``last_error``."""
+        rows = self._connection.execute(
+            "SELECT id, channel, attempts, last_error FROM messages "
+            + "WHERE status = 'dead' ORDER BY id")
+
+        return [dict(zip(("id", "channel", "attempts", "last_error"), row))
+                for row in rows]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _migrate(self) -> None:
+        """Adds the columns missing from databases created by the
+        earlier versions of the outbox."""
+        columns = {row[1] for row in self._connection.execute(
+            "PRAGMA table_info(messages)")}
+
+        for column, definition in [("account", "TEXT NOT NULL DEFAULT ''"),
+                                   ("recipient", "TEXT")]:
+            if column not in columns:
+                logging.info("Adding the {} column to '{}'".format(
+                    column, self.database))
+                with self._connection:
+                    self._connection.execute(
+                        "ALTER TABLE messages ADD COLUMN "
+                        + "{} {}".format(column, definition))
+
+    def _deliver(self, dispatcher: object, channel: str, queue: list,
+                 statuses: dict) -> None:
+        """Delivers messages of a channel until the queue is empty."""
+        while True:
+            try:
+                message, _, _, recipient, payload, _ = queue.pop(0)
+            except IndexError:
+                return
+
+            statuses[message] = dispatcher.deliver(
+                channel, json.loads(payload), recipient)
+
+    def _record(self, message: int, channel: str, recipient: str,
+                attempts: int, status: str, now: float) -> str:
+        """Records the outcome of a delivery.
+
+        :returns: ``sent``, ``retried`` or ``dead``.
+        """
+        if status == "sent":
+            self._connection.execute(
+                "DELETE FROM messages WHERE id = ?", (message,))
+            return "sent"
+
+        error = "{} via {}".format(status, channel)
+        if recipient is not None:
+            error += " to {}".format(recipient)
+
+        if attempts >= self.max_attempts:
+            logging.error("Giving up on message #{} after {} ".format(
+                message, attempts) + "attempts: {}".format(error))
+            self._connection.execute(
+                "UPDATE messages SET status = 'dead', attempts = ?, "
+                + "last_error = ? WHERE id = ?", (attempts, error, message))
+            return "dead"
+
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        logging.warning("Message #{} {}, retrying in {:.0f}s".format(
+            message, error, delay))
+        self._connection.execute(
+            "UPDATE messages SET attempts = ?, next_attempt = ?, "
+            + "last_error = ? WHERE id = ?",
+            (attempts, now + delay, error, message))
+        return "retried"
+
+    def _dispatcher(self, config_file: str) -> object:
+        """Returns a dispatcher using a given configuration file."""
+        if config_file not in self._dispatchers:
+            self._dispatchers[config_file] = Dispatcher(
+                channels="", enable=True, config_file=config_file,
+                timeout=self.timeout)
+
+        return self._dispatchers[config_file]
+
+    def _concurrency(self, dispatcher: object, channel: str) -> int:
+        """Returns the number of concurrent deliveries of a channel."""
+        channel_config = dispatcher.config.get(channel)
+        if (isinstance(channel_config, dict)
+                and "concurrency" in channel_config):
+            return max(int(channel_config["concurrency"]), 1)
+
+        return self.concurrency
+
+
+def coalesce(earlier: list, later: list, entities: object = None) -> list:
+    """Merges the results of two runs into a single digest.
+
+    Successive changes of the same item, identified by the ``identity``
+    of its entity, are merged into one, carrying the state before the
+    earliest change and the state after the latest one: ``old_values``
+    of a changed item come from the earlier results, its ``values`` from
+    the later ones. Items sharing their identifiers are paired with the
+    earlier ones in the order they appear. An item added and then
+    removed, or changed back to its old values, is left out. ::
+
+        >>> coalesce(
+        ...     [{"entity": "final-grades", "items": [{
+        ...         "group": "2018L", "subgroup": "Logic", "item": "Logic",
+        ...         "values": ["3"], "old_values": ["2"],
+        ...         "change": "changed"}]}],
+        ...     [{"entity": "final-grades", "items": [{
+        ...         "group": "2018L", "subgroup": "Logic", "item": "Logic",
+        ...         "values": ["4"], "old_values": ["3"],
+        ...         "change": "changed"}]}])[0]["items"][0]["old_values"]
+        ['2']
+
+    :param earlier: results of the earlier runs, in the format of
+        :attr:`usos.data.DataController.results`.
+    :param later: results of the latest run.
+    :param entities: a :class:`usos.entities.EntityRegistry`, the items
+        are identified by the ``identity`` of their entity and split into
+        entries by its ``shard_by`` field, e.g. one entry per course.
+    :returns: the merged results.
+    """
+    entities = entities or EntityRegistry()
+    merged = {}
+    unmatched = {}
+
+    for entity in earlier:
+        entity_type = entities.get(entity["entity"])
+        entries = merged.setdefault(entity["entity"], [])
+
+        for item in entity["items"]:
+            entry = list(_states(item)) + [item]
+            entries.append(entry)
+            unmatched.setdefault((entity["entity"], entity_type.key(
+                Item.from_dict(item), hierarchy=True)), []).append(entry)
+
+    for entity in later:
+        entity_type = entities.get(entity["entity"])
+        entries = merged.setdefault(entity["entity"], [])
+
+        for item in entity["items"]:
+            previous = entity_type.key(Item.from_dict(dict(
+                item, hierarchy=item.get("old_hierarchy",
+                                         item.get("hierarchy")))),
+                hierarchy=True)
+            candidates = unmatched.get((entity["entity"], previous))
+
+            if candidates:
+                entry = candidates.pop(0)
+                entry[1:] = _states(item)[1], item
+            else:
+                entries.append(list(_states(item)) + [item])
+
+    results = []
+    for name, entries in merged.items():
+        shard_by = entities.get(name).shard_by
+        shards = {}
+
+        for before, after, item in entries:
+            entry = _merged_item(before, after, item)
+            if entry is not None:
+                shards.setdefault(item.get(shard_by), []).append(entry)
+
+        results.extend({"entity": name, "items": shard}
+                       for shard in shards.values())
+
+    return results
+
+
+def _states(item: dict) -> tuple:
+    """Returns the state of an item before and after its change, as
+    pairs of its values and hierarchy, ``None`` if it did not exist."""
+    change = item.get("change", "added")
+    after = (item.get("values"), item.get("hierarchy"))
+    before = (item.get("old_values", item.get("values")),
+              item.get("old_hierarchy", item.get("hierarchy")))
+
+    if change == "added":
+        return None, after
+    elif change == "removed":
+        return after, None
+
+    return before, after
+
+
+def _merged_item(before: tuple, after: tuple, item: dict) -> dict:
+    """Returns an item describing the change between two states, or
+    ``None`` if there is none."""
+    entry = {name: value for name, value in item.items()
+             if name not in ("change", "old_values", "old_hierarchy")}
+
+    if before is None and after is None:
+        return None
+    elif before is None:
+        entry["change"] = "added"
+        return entry
+    elif after is None:
+        entry["values"], entry["hierarchy"] = before
+        entry["change"] = "removed"
+        if entry["hierarchy"] is None:
+            del entry["hierarchy"]
+        return entry
+
+    if before[1] != after[1]:
+        entry["change"] = "moved"
+        entry["old_hierarchy"] = before[1]
+    elif before[0] != after[0]:
+        entry["change"] = "changed"
+    else:
+        return None
+
+    if before[0] != after[0]:
+        entry["old_values"] = before[0]
+
+    return entry
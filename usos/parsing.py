@@ -0,0 +1,198 @@
+import logging
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, SoupStrainer
+
+logging = logging.getLogger(__name__)
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+BACKENDS = ("html.parser", "lxml", "selector")
+
+_default_backend = "html.parser"
+
+
+class UnknownBackend(Exception):
+    """The requested parser backend is not supported or not installed."""
+
+
+def set_default_backend(backend: str) -> None:
+    """Selects the backend used by :func:`parse` by default.
+
+    Available backends:
+
+    ``html.parser`` - Python's built-in parser, slow but always available.
+
+    ``lxml`` - a fast parser written in C.
+
+    ``selector`` - parses the page with lxml, then builds BeautifulSoup
+    objects only for the elements matching the ``select`` argument of
+    :func:`parse`, skipping the rest of the page.
+
+    :param backend: name of the backend.
+    :raises UnknownBackend: if the backend is not available.
+    """
+    global _default_backend
+
+    _check_backend(backend)
+    logging.info("Using '{}' parser backend".format(backend))
+    _default_backend = backend
+
+
+def parse(markup: str, select: list = None, backend: str = None) -> object:
+    """Parses HTML into a BeautifulSoup object.
+
+    ScrapingTemplates should use this function, usually through
+    :meth:`Snapshot.parse`, instead of constructing the soup themselves,
+    so that the parser can be configured in one place::
+
+        from usos import parsing
+
+        soup = parsing.parse(snapshot.html, select=["h1", "#drzewo"])
+
+    :param markup: HTML to parse.
+    :param select: simple CSS selectors (``tag``, ``#id``, ``.class`` or
+        ``tag#id``) of the elements the template needs. Elements outside
+        of them are skipped by the ``selector`` backend and, if there is
+        a single selector, by the other backends as well.
+    :param backend: name of the backend, defaults to the one set with
+        :func:`set_default_backend`.
+    :returns: a soup containing the whole document or only the selected
+        elements.
+    """
+    backend = backend or _default_backend
+    _check_backend(backend)
+
+    if backend == "selector":
+        if select:
+            markup = _extract(markup, select)
+        return BeautifulSoup(markup, "lxml")
+
+    parse_only = None
+    if select and len(select) == 1:
+        parse_only = SoupStrainer(**_strainer_arguments(select[0]))
+
+    return BeautifulSoup(markup, backend, parse_only=parse_only)
+
+
+class Snapshot:
+    """HTML of a whole page, taken from a driver in a single transfer.
+
+    ScrapingTemplates receive a snapshot instead of the driver, so
+    extracting data never costs additional round-trips to the browser::
+
+        snapshot = Snapshot.take(web_driver)
+        soup = snapshot.parse(select=["#lista"])
+
+    :param url: url the page has been loaded from.
+    :param html: source of the page.
+    """
+    def __init__(self, url: str, html: str) -> None:
+        self.url = url
+        self.html = html
+
+    @classmethod
+    def take(cls, driver: object) -> object:
+        """Copies the current page of a driver.
+
+        :param driver: a Selenium web driver or a
+            :class:`usos.web_driver.StaticDriver`.
+        """
+        return cls(driver.current_url, driver.page_source)
+
+    def parse(self, select: list = None, backend: str = None) -> object:
+        """Parses the page, see :func:`parse` for the arguments."""
+        return parse(self.html, select=select, backend=backend)
+
+    def absolute_url(self, link: str) -> str:
+        """Resolves a link found on the page the way a browser does,
+        e.g. the ``href`` of an anchor."""
+        return urljoin(self.url, link)
+
+
+def _check_backend(backend: str) -> None:
+    """Raises :class:`UnknownBackend` if the backend can not be used."""
+    if backend not in BACKENDS:
+        raise UnknownBackend("Unknown parser backend '{}', ".format(backend)
+                             + "choose one of {}".format(BACKENDS))
+
+    if backend != "html.parser" and lxml is None:
+        raise UnknownBackend(
+            "Parser backend '{}' requires lxml".format(backend))
+
+
+def _split_selector(selector: str) -> tuple:
+    """Splits a simple CSS selector into a tag name, an id and a class.
+
+    ::
+
+        >>> _split_selector("div#drzewo")
+        ('div', 'drzewo', None)
+        >>> _split_selector(".fwdlink")
+        (None, None, 'fwdlink')
+    """
+    tag, id_, class_ = selector, None, None
+
+    if "#" in tag:
+        tag, id_ = tag.split("#", 1)
+    elif "." in tag:
+        tag, class_ = tag.split(".", 1)
+
+    return tag or None, id_, class_
+
+
+def _strainer_arguments(selector: str) -> dict:
+    """Translates a simple CSS selector into SoupStrainer arguments."""
+    tag, id_, class_ = _split_selector(selector)
+    arguments = {}
+
+    if tag:
+        arguments["name"] = tag
+    if id_:
+        arguments["id"] = id_
+    if class_:
+        arguments["class_"] = class_
+
+    return arguments
+
+
+def _xpath(selector: str) -> str:
+    """Translates a simple CSS selector into an XPath expression."""
+    tag, id_, class_ = _split_selector(selector)
+    expression = "//" + (tag or "*")
+
+    if id_:
+        expression += "[@id='{}']".format(id_)
+    if class_:
+        expression += ("[contains(concat(' ', normalize-space(@class), "
+                       + "' '), ' {} ')]".format(class_))
+
+    return expression
+
+
+def _extract(markup: str, select: list) -> str:
+    """Returns the HTML of the elements matching any of the selectors,
+    in the document order.
+
+    Elements nested in another matching element are included only once,
+    as a part of their ancestor.
+    """
+    if not markup.strip():
+        return ""
+
+    document = lxml.html.document_fromstring(markup)
+    matches = document.xpath(" | ".join(_xpath(s) for s in select))
+
+    selected = set()
+    fragments = []
+    for element in matches:
+        if any(ancestor in selected for ancestor in element.iterancestors()):
+            continue
+
+        selected.add(element)
+        fragments.append(lxml.html.tostring(
+            element, encoding="unicode", with_tail=False))
+
+    return "".join(fragments)
@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+
+logging = logging.getLogger(__name__)
+
+
+class ResultIndex:
+    """Answers queries about the stored entities without opening every
+    one of them. ::
+
+        from usos.query import ResultIndex
+        from usos.storage import JsonStorage
+
+        index = ResultIndex(JsonStorage("data"), cache="data/index.json")
+        index.query(group="2018L")
+        index.query(group="28-INF-S-DOLI", hierarchy="Exam")
+
+    The items of every entity are indexed by their ``group``,
+    ``subgroup`` and ``hierarchy``. The index is built on the first
+    query and kept up to date lazily: before a query, only the entities
+    modified since they have been indexed are loaded again, so a query
+    over thousands of unchanged courses costs a ``stat`` per file, or a
+    single ``SELECT`` with :class:`usos.storage.SqliteStorage`. With a
+    ``cache`` file, the indexed items and the index itself are kept
+    between runs.
+
+    :param storage: a storage of the entities, such as
+        :class:`usos.storage.JsonStorage`.
+    :param cache: an optional JSON file to keep the index in.
+    """
+    FIELDS = ("group", "subgroup", "hierarchy")
+
+    def __init__(self, storage: object, cache: str = None) -> None:
+        self.storage = storage
+        self.cache = cache
+        self._entries = None
+        self._index = {}
+
+    def query(self, entity: str = None, group: str = None,
+              subgroup: str = None, hierarchy: str = None) -> list:
+        """Returns the stored items matching all of the given criteria.
+
+        :param entity: name of the entity, e.g. ``final-grades``.
+        :param group: the item's group, e.g. a semester or a course code.
+        :param subgroup: the item's subgroup.
+        :param hierarchy: the item's hierarchy.
+        :returns: items with the name of their ``entity``, in the order
+            of the storage keys and of the items within an entity.
+        """
+        self.refresh()
+
+        criteria = {name: value for name, value in zip(
+            self.FIELDS, (group, subgroup, hierarchy)) if value is not None}
+
+        if criteria:
+            postings = min((self._index[name].get(value, [])
+                            for name, value in criteria.items()), key=len)
+        else:
+            postings = [(key, position)
+                        for key in sorted(self._entries)
+                        for position in range(
+                            len(self._entries[key]["items"]))]
+
+        results = []
+        for key, position in postings:
+            stored = self._entries[key]
+            item = stored["items"][position]
+
+            if ((entity is None or stored["entity"] == entity)
+                    and all(item.get(name) == value
+                            for name, value in criteria.items())):
+                results.append(dict(item, entity=stored["entity"]))
+
+        return results
+
+    def refresh(self) -> int:
+        """Loads the entities modified since they have been indexed.
+
+        :returns: number of loaded entities.
+        """
+        if self._entries is None:
+            self._entries, self._index = self._load_cache()
+            if self._index is None:
+                self._reindex()
+
+        stamps = self.storage.stamps()
+
+        removed = [key for key in self._entries if key not in stamps]
+        for key in removed:
+            del self._entries[key]
+
+        loaded = 0
+        for key, stamp in stamps.items():
+            stored = self._entries.get(key)
+            if stamp is not None and stored and stored["stamp"] == stamp:
+                continue
+
+            entity = self.storage.load(key)
+            self._entries[key] = {
+                "stamp": stamp,
+                "entity": entity.get("entity"),
+                "items": entity.get("items", []),
+            }
+            loaded += 1
+
+        if loaded or removed:
+            logging.info("Indexed {} entities, {} removed".format(
+                loaded, len(removed)))
+            self._reindex()
+            self._save_cache()
+
+        return loaded
+
+    def _reindex(self) -> None:
+        """Builds the index of the items from scratch."""
+        self._index = {name: {} for name in self.FIELDS}
+
+        for key in sorted(self._entries):
+            for position, item in enumerate(self._entries[key]["items"]):
+                for name in self.FIELDS:
+                    value = item.get(name)
+                    if value is not None:
+                        self._index[name].setdefault(value, []).append(
+                            (key, position))
+
+    def _load_cache(self) -> tuple:
+        """Returns the indexed entities and the index kept in the cache
+        file, or ``None`` instead of an index that has to be built."""
+        if self.cache is None or not os.path.isfile(self.cache):
+            return {}, None
+
+        try:
+            with open(self.cache, 'r', encoding="utf-8") as working_file:
+                cached = json.load(working_file)
+            return cached["entities"], cached.get("index")
+        except (ValueError, KeyError):
+            logging.warning("Ignoring a damaged index '{}'".format(
+                self.cache))
+            return {}, None
+
+    def _save_cache(self) -> None:
+        """Replaces the cache file atomically."""
+        if self.cache is None:
+            return
+
+        dirname = os.path.dirname(self.cache)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        temporary = self.cache + ".tmp"
+        with open(temporary, 'w', encoding="utf-8") as working_file:
+            json.dump({"entities": self._entries, "index": self._index},
+                      working_file)
+        os.replace(temporary, self.cache)
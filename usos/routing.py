@@ -0,0 +1,193 @@
+import os
+import logging
+import importlib.util
+import threading
+
+logging = logging.getLogger(__name__)
+
+
+class Route:
+    """Maps a destination pattern to a ScrapingTemplate.
+
+    The template's module is imported on the first request for
+    :attr:`template`.
+
+    :param action: the action part of a destination, e.g.
+        ``dla_stud/studia/sprawdziany/pokaz``.
+    :param module: name of the module providing the ScrapingTemplate.
+    :param parameters: names of the query parameters that have to be
+        present in the destination, e.g. ``("wez_id",)``.
+    """
+    def __init__(self, action: str, module: str,
+                 parameters: tuple = ()) -> None:
+        self.action = action
+        self.module = module
+        self.parameters = frozenset(parameters)
+        self._template = None
+        self._lock = threading.Lock()
+
+    @property
+    def pattern(self) -> str:
+        """Human-readable pattern of the route, e.g.
+        ``dla_stud/studia/sprawdziany/pokaz&wez_id=*``."""
+        return "".join([self.action] + [
+            "&{}=*".format(name) for name in sorted(self.parameters)])
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the template's module has already been imported."""
+        return self._template is not None
+
+    @property
+    def template(self) -> object:
+        """The ScrapingTemplate class, imported on first access."""
+        if self._template is None:
+            with self._lock:
+                if self._template is None:
+                    logging.info("Importing '{}' template".format(
+                        self.module))
+                    imported = importlib.import_module(self.module)
+                    self._template = imported.ScrapingTemplate
+
+        return self._template
+
+    def matches(self, parameters: frozenset) -> bool:
+        """Checks whether the destination's query parameters satisfy the
+        route.
+
+        :param parameters: names of the destination's query parameters.
+        """
+        return self.parameters <= parameters
+
+
+class TemplateRegistry:
+    """Routes destinations to ScrapingTemplates.
+
+    The route table is built once, from the names of modules in the
+    templates package: ``dla_stud-studia-oceny-index.py`` handles the
+    ``dla_stud/studia/oceny/index`` destination. Routes that require
+    query parameters are declared in the package's ``ROUTES``
+    dictionary::
+
+        ROUTES = {
+            "dla_stud/studia/sprawdziany/pokaz": ["wez_id"],
+        }
+
+    Resolving a destination is a dictionary lookup, the outcome of which
+    (including a missing template) is cached::
+
+        >>> registry = TemplateRegistry()
+        >>> registry.resolve("dla_stud/studia/sprawdziany/pokaz&wez_id=1")
+        <class 'templates.scraping.dla_stud-studia-sprawdziany-pokaz.ScrapingTemplate'>
+        >>> registry.resolve("dla_stud/studia/sprawdziany/pokaz") is None
+        True
+
+    :param package: name of the package containing the templates.
+    """
+    def __init__(self, package: str = "templates.scraping") -> None:
+        self.package = package
+        self._routes = {}
+        self._cache = {}
+        self._discover()
+
+    def register(self, action: str, module: str,
+                 parameters: tuple = ()) -> None:
+        """Adds a route to the table.
+
+        Routes requiring more parameters take precedence over the less
+        specific ones registered for the same action.
+
+        :param action: the action part of a destination.
+        :param module: name of the module providing the ScrapingTemplate.
+        :param parameters: names of the required query parameters.
+        """
+        routes = [route for route in self._routes.get(action, [])
+                  if route.module != module]
+        routes.append(Route(action, module, parameters))
+        routes.sort(key=lambda route: len(route.parameters), reverse=True)
+
+        self._routes[action] = routes
+        self._cache = {}
+
+    def routes(self) -> list:
+        """Returns the route table for inspection.
+
+        :returns: every :class:`Route`, sorted by its pattern.
+        """
+        routes = [route for action_routes in self._routes.values()
+                  for route in action_routes]
+
+        return sorted(routes, key=lambda route: route.pattern)
+
+    def resolve(self, destination: str) -> object:
+        """Finds the ScrapingTemplate for a given destination.
+
+        :param destination: scraper-compatible destination path.
+        :returns: a ScrapingTemplate class or ``None`` if there is no
+            matching route.
+        """
+        action, parameters = self._split(destination)
+        key = (action, parameters)
+
+        if key not in self._cache:
+            route = self._match(action, parameters)
+            if route is None:
+                logging.error(
+                    "No template found for '{}'".format(destination))
+            self._cache[key] = route
+
+        route = self._cache[key]
+
+        if route is None:
+            return None
+        return route.template
+
+    def _match(self, action: str, parameters: frozenset) -> object:
+        """Returns the most specific route matching the destination."""
+        for route in self._routes.get(action, []):
+            if route.matches(parameters):
+                return route
+
+        return None
+
+    def _split(self, destination: str) -> tuple:
+        """Splits a destination into its action and the names of query
+        parameters. ::
+
+            >>> registry._split("dla_stud/studia/sprawdziany/pokaz&wez_id=1")
+            ('dla_stud/studia/sprawdziany/pokaz', frozenset({'wez_id'}))
+        """
+        action, *parameters = destination.split("&")
+        names = frozenset(parameter.split("=")[0]
+                          for parameter in parameters if parameter)
+
+        return action, names
+
+    def _discover(self) -> None:
+        """Builds the route table from the modules of the templates
+        package."""
+        spec = importlib.util.find_spec(self.package)
+
+        if spec is None or not spec.submodule_search_locations:
+            logging.error("Templates package '{}' not found".format(
+                self.package))
+            return
+
+        declared = getattr(
+            importlib.import_module(self.package), "ROUTES", {})
+
+        for directory in spec.submodule_search_locations:
+            for filename in sorted(os.listdir(directory)):
+                name, extension = os.path.splitext(filename)
+
+                if extension != ".py" or name.startswith("_"):
+                    continue
+
+                action = name.replace("-", "/")
+                self.register(
+                    action=action,
+                    module=".".join([self.package, name]),
+                    parameters=declared.get(action, ()))
+
+        logging.debug("Route table: {}".format(
+            [route.pattern for route in self.routes()]))
@@ -1,7 +1,11 @@
 import os
 import logging
-import importlib
+import threading
 from os.path import join, exists
+from usos.frontier import Frontier
+from usos.parsing import Snapshot
+from usos.routing import TemplateRegistry
+from usos.web_driver import SessionExpired
 
 logging = logging.getLogger(__name__)
 
@@ -13,58 +17,272 @@ class Scraper:
     :param destinations: 
     :param authentication: an instance of 
         :class:`usos.authentication.Authentication` for accessing 
-        protected data.
+        protected data, or ``None`` if no authentication is needed, e.g.
+        for pages served by a :class:`usos.web_driver.ReplayDriver`.
     :param data_controller: a controller for storing and analysing 
         scraped data.
     :param web_driver: a Selenium web driver instance for navigating.
+    :param http_driver: an optional :class:`usos.web_driver.HttpDriver` 
+        used for fetching pages without rendering them in the browser. 
+        Templates with ``requires_browser = True`` are always rendered 
+        by ``web_driver``.
+    :param workers: number of destinations scraped concurrently.
+    :param driver_factory: a callable returning a new web driver, 
+        required when ``workers`` is greater than one, e.g. 
+        :meth:`usos.web_driver.SeleniumDriver.new_instance`.
+    :param http_driver_factory: a callable returning a new HTTP driver 
+        for every additional worker, used together with ``http_driver``.
+    :param quit_on_finish: whether to terminate ``web_driver`` once the 
+        scraping is done. Disable it for drivers managed by a 
+        :class:`usos.web_driver.DriverPool`.
+    :param registry: a :class:`usos.routing.TemplateRegistry` routing 
+        destinations to ScrapingTemplates, built from the default 
+        templates package if not provided.
+    :param frontier: a :class:`usos.frontier.Frontier` deciding which 
+        destinations are visited and in what order.
+    :param archive: a :class:`usos.archive.PageArchive` the HTML of every
+        visited destination is recorded in.
+    :raises ValueError: if more than one worker is requested without 
+        the factories of their drivers.
     """
     def __init__(self, root_url: str, destinations: str,
                  authentication: object, data_controller: object,
-                 web_driver: object) -> None:
+                 web_driver: object, http_driver: object = None,
+                 workers: int = 1, driver_factory: object = None,
+                 http_driver_factory: object = None,
+                 quit_on_finish: bool = True,
+                 registry: object = None, frontier: object = None,
+                 archive: object = None) -> None:
+        if workers > 1 and driver_factory is None:
+            raise ValueError("A driver_factory is required to run "
+                             + "{} workers".format(workers))
+        if (workers > 1 and http_driver is not None
+                and http_driver_factory is None):
+            raise ValueError("An http_driver_factory is required to run "
+                             + "{} workers over HTTP".format(workers))
+
         self.root_url = root_url
         self.destinations = destinations.split(" ")
-        self.visited = []
         self.authentication = authentication
         self.data_controller = data_controller
         self.driver = web_driver
+        self.http_driver = http_driver
+        self.workers = workers
+        self.driver_factory = driver_factory
+        self.http_driver_factory = http_driver_factory
+        self.quit_on_finish = quit_on_finish
+        self.registry = registry or TemplateRegistry()
+        self.frontier = frontier if frontier is not None else Frontier()
+        self.archive = archive
 
     def run(self) -> None:
-        """Runs the process of iterating through provided destinations."""
+        """Runs the process of iterating through provided destinations.
+
+        Destinations discovered by the ScrapingTemplates are added to the 
+        frontier and visited in the same run. With more than one worker, 
+        the frontier is drained by a pool of threads, each one navigating 
+        with its own set of drivers.
+        """
         logging.info("Launching the scraper")
 
         for destination in self.destinations:
-            self.go_to(destination)
+            self.frontier.put(self._normalize_destination_url(destination))
+        self.frontier.restore()
 
+        if self.http_driver is not None and self.authentication:
+            self.authentication.share_session(self.http_driver)
+
+        if self.workers > 1:
+            self._run_parallel()
+        else:
+            self._work(self.driver, self.http_driver)
+
+        self.frontier.save()
         self.quit()
 
     def quit(self) -> None:
         """Terminates the scraper."""
         logging.info("Terminating the scraper")
 
-        self.driver.quit()
+        if self.http_driver is not None:
+            self.http_driver.quit()
+        if self.quit_on_finish:
+            self.driver.quit()
 
-    def go_to(self, destination: str) -> None:
+    def go_to(self, destination: str, depth: int = 0,
+              web_driver: object = None, http_driver: object = None) -> None:
         """Navigates to the provided destination.
         
         :param destination: a part of the url that will be used to match 
             the ScrapingTemplate.
+        :param depth: number of links followed to reach the destination.
+        :param web_driver: a driver to navigate with, defaults to the one
+            passed to the initializer.
+        :param http_driver: an HTTP driver to fetch with, defaults to the
+            one passed to the initializer.
         """
         logging.info("Going to the destination: '{}'".format(
             destination))
         destination = self._normalize_destination_url(destination)
-        self.visited.append(destination)
 
-        if self.authentication.is_authenticated():
-            self.driver.get(''.join([self.root_url, destination]))
-            self._perform(destination)
+        if web_driver is None:
+            web_driver = self.driver
+            http_driver = self.http_driver
+
+        if self._is_authenticated():
+            template = self._detect(destination)
+
+            if template is not None:
+                snapshot = self._fetch(
+                    destination, template, web_driver, http_driver)
+                self._perform(destination, depth, template, snapshot)
+
+    def _run_parallel(self) -> None:
+        """Drains the frontier with a pool of workers.
+
+        The driver passed to the initializer serves as the first worker, 
+        the remaining ones are created with ``driver_factory`` and share 
+        its authenticated session.
+        """
+        logging.info("Starting {} workers".format(self.workers))
+
+        if not self._is_authenticated():
+            return
+
+        workers = [(self.driver, self.http_driver)]
+        try:
+            for _ in range(self.workers - 1):
+                workers.append(self._spawn_worker())
+
+            threads = []
+            for web_driver, http_driver in workers:
+                thread = threading.Thread(
+                    target=self._work, args=(web_driver, http_driver))
+                thread.start()
+                threads.append(thread)
+
+            for thread in threads:
+                thread.join()
+        finally:
+            for web_driver, http_driver in workers[1:]:
+                self._quit_worker(web_driver, http_driver)
+
+    def _spawn_worker(self) -> tuple:
+        """Creates a set of drivers for an additional worker.
+
+        :returns: a web driver and an HTTP driver (or ``None``), both 
+            carrying cookies of the authenticated session.
+        """
+        web_driver = self.driver_factory()
+        http_driver = None
+
+        try:
+            if self.authentication:
+                web_driver.get(self.root_url)
+                self.authentication.share_session(web_driver)
+
+            if self.http_driver is not None:
+                http_driver = self.http_driver_factory()
+                if self.authentication:
+                    self.authentication.share_session(http_driver)
+        except:
+            self._quit_worker(web_driver, http_driver)
+            raise
+
+        return web_driver, http_driver
+
+    def _quit_worker(self, web_driver: object, http_driver: object) -> None:
+        """Terminates the drivers of an additional worker."""
+        for driver in (http_driver, web_driver):
+            if driver is None:
+                continue
+            try:
+                driver.quit()
+            except:
+                logging.exception("Worker's driver could not be closed")
+
+    def _work(self, web_driver: object, http_driver: object) -> None:
+        """Visits destinations from the frontier until the crawl is 
+        complete.
+
+        :param web_driver: a driver owned by this worker.
+        :param http_driver: an HTTP driver owned by this worker.
+        """
+        while True:
+            entry = self.frontier.get()
+
+            if entry is None:
+                break
+
+            destination, depth = entry
+            try:
+                self.go_to(destination, depth, web_driver, http_driver)
+            except:
+                logging.exception("Visiting '{}' ".format(destination)
+                                  + "has failed")
+            finally:
+                self.frontier.task_done()
+
+    def _is_authenticated(self) -> bool:
+        """Checks whether protected pages can be accessed."""
+        if self.authentication is None:
+            return True
+        return self.authentication.is_authenticated()
+
+    def _fetch(self, destination: str, template: object,
+               web_driver: object, http_driver: object) -> object:
+        """Loads the destination using the cheapest driver suitable for 
+        a given ScrapingTemplate.
+
+        Pages are fetched over HTTP when an ``http_driver`` is available,
+        unless the template requires a browser. If the HTTP request 
+        fails or is redirected to the sign in page, the page is rendered 
+        by the browser instead.
 
-    def _process_results(self, data: dict) -> None:
+        The HTML of the page is transferred from the driver once, as a 
+        snapshot shared by the archive and the template.
+
+        :param destination: scraper-compatible destination path.
+        :param template: a ScrapingTemplate class.
+        :param web_driver: a browser-based driver.
+        :param http_driver: an HTTP driver or ``None``.
+        :returns: a :class:`usos.parsing.Snapshot` of the loaded page.
+        """
+        url = ''.join([self.root_url, destination])
+
+        driver = web_driver
+
+        if (http_driver is not None
+                and not getattr(template, "requires_browser", False)):
+            try:
+                http_driver.get(url)
+                driver = http_driver
+            except SessionExpired:
+                logging.warning("HTTP session has expired, rendering "
+                                + "'{}' in the browser".format(url))
+            except:
+                logging.exception("Fetching '{}' over HTTP ".format(url)
+                                  + "has failed, falling back to "
+                                  + "the browser")
+
+        if driver is web_driver:
+            web_driver.get(url)
+
+        snapshot = Snapshot.take(driver)
+
+        if self.archive is not None:
+            self.archive.record(destination, snapshot.html)
+
+        return snapshot
+
+    def _process_results(self, data: dict, depth: int = 0) -> None:
         """Processes data returned from ScrapingTemplates.
         
         If the data includes these keys:
         ``new_destinations`` - adds new destinations to the scraper queue.
         ``parsed_results`` - uploads the data for later analysis.
         :param data: data passed from a ScrapingTemplate.
+        :param depth: depth of the destination the data comes from.
         """
         logging.info("Processing results initialized")
         logging.debug("Data: {}".format(data))
@@ -74,28 +292,30 @@ class Scraper:
                 logging.info("New destinations detected in the data"
                              + "package")
                 self._process_results_destinations(
-                    data["new_destinations"])
+                    data["new_destinations"], depth + 1)
 
             if "parsed_results" in data:
                 logging.info("Results detected in the data package")
                 self._process_results_parsed(data["parsed_results"])
 
-    def _process_results_destinations(self, data: list) -> None:
+    def _process_results_destinations(self, data: list,
+                                      depth: int = 1) -> None:
         """Adds new, unvisited destinations to the scraper queue from the 
         ScrapingTemplate results.
         
         :param data: destinations excluded from results dict.
+        :param depth: depth of the new destinations.
         """
         for link in data:
             link = self._normalize_destination_url(link)
 
-            if link in self.visited:
+            if self.frontier.put(link, depth):
                 logging.info(
-                    "'{}' has already been visited".format(link))
+                    "Adding '{}' to the scraping queue".format(link))
             else:
                 logging.info(
-                    "Adding '{}' to the scraping queue".format(link))
-                self.destinations.append(link)
+                    "'{}' has already been queued or is ".format(link)
+                    + "out of the crawl's limits")
 
     def _process_results_parsed(self, data: list) -> None:
         """Uploads parsed results to the data controller.
@@ -110,6 +330,15 @@ class Scraper:
 
     def _normalize_destination_url(self, destination: str) -> str:
         """Translates url into a scraper-compatible destination.
+
+        The destination is also brought to a canonical form, with the
+        fragment removed and GET parameters sorted, so that every page
+        has a single representation. ::
+
+            >>> scraper._normalize_destination_url(
+            ...     root_url + "dla_stud/studia/sprawdziany/pokaz"
+            ...     + "&wez_id=33693&lang=pl#tab")
+            'dla_stud/studia/sprawdziany/pokaz&lang=pl&wez_id=33693'
         
         :param destination: a full url inside of a USOSweb application.
         :returns: a destination.
@@ -124,62 +353,42 @@ class Scraper:
             else:
                 logging.error("Normalizing url '{}'".format(destination)
                               + " has failed: no rule has been set")
-        return destination
+                return destination
+
+        action, *parameters = destination.split("#")[0].split("&")
+        parameters = sorted(parameter for parameter in parameters
+                            if parameter)
 
-    def _perform(self, destination: str) -> None:
+        return "&".join([action] + parameters)
+
+    def _perform(self, destination: str, depth: int, template: object,
+                 snapshot: object) -> None:
         """Performs the scraping and parsing of a given destination.
 
         :param destination: scraper-compatible destination path.
+        :param depth: number of links followed to reach the destination.
+        :param template: a ScrapingTemplate class.
+        :param snapshot: a :class:`usos.parsing.Snapshot` of the 
+            destination.
         """
         logging.info(
             "Performing the scraping of '{}'".format(destination))
 
-        scraping_template = self._detect(destination)
         data = None
 
-        if scraping_template is not None:
-            try:
-                data = scraping_template.get_data()
-                self._process_results(data)
-            except:
-                logging.exception("Execution of a ScrapingTemplate has failed")
-        
-        logging.debug("Retrieved data: {}".format(data))
+        try:
+            scraping_template = template(snapshot=snapshot)
+            data = scraping_template.get_data()
+            self._process_results(data, depth)
+        except:
+            logging.exception("Execution of a ScrapingTemplate has failed")
 
+        logging.debug("Retrieved data: {}".format(data))
 
     def _detect(self, destination: str) -> object:
-        """Detects the template to import based on a given destination. 
+        """Detects the template to use for a given destination. 
         
         :param destination: scraper-compatible destination path.
-        :returns: an imported ScrapingTemplate.
-        """
-        destination = destination.replace("/", "-")
-        parameter = destination.find("&")
-
-        if parameter >= 0:
-            destination = destination[:parameter]
-
-        module = ".".join(["templates", "scraping", destination])
-        logging.debug("Looking for '{}' class".format(destination))
-
-        return self._import(module=module)
-
-    def _import(self, module: str) -> object:
-        """Provides a requested ScrapingTemplate.
-        
-        :param module: a name of ScrapingTemplate to import.
-        :returns: an imported ScrapingTemplate.
+        :returns: a ScrapingTemplate class or ``None``.
         """
-        spec = importlib.util.find_spec(module)
-
-        if spec is None:
-            logging.error("'{}' template not found".format(module))
-
-            return None
-        else:
-            logging.info("'{}' template file found".format(module))
-            imported = importlib.import_module(module)
-
-            logging.debug(
-                imported.ScrapingTemplate(web_driver=self.driver))
-            return imported.ScrapingTemplate(web_driver=self.driver)
+        return self.registry.resolve(destination)
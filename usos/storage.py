@@ -0,0 +1,454 @@
+import os
+import json
+import sqlite3
+import logging
+
+logging = logging.getLogger(__name__)
+
+
+class UnknownPolicy(Exception):
+    """The requested fsync policy is not supported."""
+
+
+FSYNC_POLICIES = ("never", "data", "full")
+
+# flushing every written file costs little once per run and keeps the
+# entities of a run intact through a power loss
+DEFAULT_FSYNC = "data"
+
+
+class JsonStorage:
+    """Stores every entity in its own JSON file. ::
+
+        >>> storage = JsonStorage("data")
+        >>> storage.filename("courses/28-inf-s-doli")
+        'data/courses/28-inf-s-doli.json'
+
+    Saved entities are kept in memory until :meth:`commit`, which writes
+    all of them in one batch. Every file is written to a temporary file
+    first and then renamed over the old one, so a crash never leaves a
+    truncated entity behind.
+
+    Suitable for a single account with a handful of entities, the files
+    are easy to inspect and to back up.
+
+    :param data_dir: directory the entities are stored in.
+    :param fsync: ``never`` leaves flushing the files to the operating
+        system, ``data`` forces the contents of every file to the disk
+        before it is renamed, ``full`` also forces the renames, once per
+        directory. Defaults to :data:`DEFAULT_FSYNC`, ``data``.
+    :raises UnknownPolicy: if the fsync policy is not supported.
+    """
+    DIGESTS = "digests"
+    RESERVED = ("digests", "frontier", "index")
+
+    def __init__(self, data_dir: str = "data",
+                 fsync: str = DEFAULT_FSYNC) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise UnknownPolicy("Unknown fsync policy '{}', ".format(fsync)
+                                + "choose one of {}".format(FSYNC_POLICIES))
+
+        self.data_dir = data_dir
+        self.fsync = fsync
+        self.flushed_files = 0
+        self.flushed_bytes = 0
+        self._dirty = {}
+
+    def filename(self, key: str) -> str:
+        """Returns the path of the JSON file of a given entity."""
+        return os.path.join(self.data_dir, key + ".json")
+
+    def keys(self) -> list:
+        """Returns the keys of every stored entity, e.g.
+        ``final-grades``, ``courses/28-inf-s-doli`` or 
+        ``entities/exam-schedule``."""
+        keys = set(key for key in self._dirty if key not in self.RESERVED)
+        directories = [self.data_dir, os.path.join(self.data_dir, "courses")]
+
+        for directory, _, _ in os.walk(
+                os.path.join(self.data_dir, "entities")):
+            directories.append(directory)
+
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+
+            for filename in os.listdir(directory):
+                name, extension = os.path.splitext(filename)
+                key = os.path.relpath(
+                    os.path.join(directory, name), self.data_dir)
+
+                if extension == ".json" and key not in self.RESERVED:
+                    keys.add(key.replace(os.sep, "/"))
+
+        return sorted(keys)
+
+    def exists(self, key: str) -> bool:
+        return key in self._dirty or os.path.isfile(self.filename(key))
+
+    def modified(self, key: str) -> object:
+        """Returns the modification time of a committed entity, in 
+        nanoseconds, or ``None`` if its file does not exist."""
+        try:
+            return os.stat(self.filename(key)).st_mtime_ns
+        except OSError:
+            return None
+
+    def stamps(self) -> dict:
+        """Returns :meth:`modified` of every stored entity, keyed by the
+        entity's key."""
+        return {key: self.modified(key) for key in self.keys()}
+
+    def load(self, key: str) -> dict:
+        """Loads an entity.
+
+        :param key: key of the entity.
+        :returns: the stored entity or an empty dictionary.
+        """
+        if key in self._dirty:
+            return self._dirty[key]
+
+        return self._load(self.filename(key)) or {}
+
+    def save(self, key: str, entity: dict) -> None:
+        """Replaces the stored entity once the changes are committed.
+
+        :param key: key of the entity.
+        :param entity: the entity to store.
+        """
+        self._dirty[key] = entity
+
+    def load_digests(self) -> dict:
+        """Loads digests of the stored entities, keyed by the entity's
+        key."""
+        if self.DIGESTS in self._dirty:
+            return self._dirty[self.DIGESTS]
+
+        digests = self._load(self.filename(self.DIGESTS))
+
+        return digests if isinstance(digests, dict) else {}
+
+    def save_digests(self, digests: dict) -> None:
+        self._dirty[self.DIGESTS] = dict(digests)
+
+    def commit(self) -> None:
+        """Writes every saved entity to its file.
+
+        The digests are written last, so that an entity whose file has
+        not been written is compared again by the next run. An entity is
+        kept in memory until its file has been written, so a failed
+        commit can be retried.
+        """
+        if not self._dirty:
+            return
+
+        keys = sorted(self._dirty, key=lambda key: key == self.DIGESTS)
+        directories = set()
+        written = 0
+
+        for key in keys:
+            filename = self.filename(key)
+            written += self._save(filename, self._dirty[key])
+            del self._dirty[key]
+            directories.add(os.path.dirname(filename))
+
+        if self.fsync == "full":
+            for dirname in directories:
+                self._fsync_directory(dirname)
+
+        self.flushed_files += len(keys)
+        self.flushed_bytes += written
+        logging.info("Flushed {} files ({} bytes) to '{}'".format(
+            len(keys), written, self.data_dir))
+
+    def close(self) -> None:
+        """Discards the changes that have not been committed."""
+        self._dirty = {}
+
+    def _load(self, filename: str) -> object:
+        """Loads the data from a specified JSON file.
+
+        :param filename: name of the JSON file to load the data from.
+        :returns: data retrieved from a file.
+        """
+        logging.info("Loading entity from '{}'".format(filename))
+        data = []
+
+        if os.path.isfile(filename):
+            try:
+                with open(filename, 'r') as working_file:
+                    data = json.load(working_file)
+                    logging.info("'{}'".format(filename)
+                                 + "- json has been fetched correctly")
+            except IOError:
+                logging.exception("File could not be opened")
+            except:
+                logging.exception("'{}'".format(filename)
+                                  + "- fetching json has failed "
+                                  + "for an unknown reason")
+
+        return data
+
+    def _save(self, filename: str, data: object) -> int:
+        """Saves the data to a specified JSON file, replacing it
+        atomically.
+
+        :param filename: name of the JSON file to save the data to.
+        :param data: data to store.
+        :returns: number of bytes written.
+        """
+        logging.info("Saving entity to '{}'".format(filename))
+
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        content = json.dumps(data).encode("utf-8")
+        temporary = filename + ".tmp"
+
+        with open(temporary, 'wb') as working_file:
+            working_file.write(content)
+            if self.fsync != "never":
+                working_file.flush()
+                os.fsync(working_file.fileno())
+
+        os.replace(temporary, filename)
+
+        return len(content)
+
+    def _fsync_directory(self, dirname: str) -> None:
+        """Forces the renames made in a directory to the disk."""
+        directory = os.open(dirname, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class SqliteStorage:
+    """Stores the entities of many accounts in a single SQLite database.
+
+    Every item is a separate row, keyed by the account, the entity and
+    the item's identifiers, so saving an entity updates only the rows of
+    the items that have changed. The changes of a run are committed in a
+    single transaction by :meth:`commit`. The storage may be passed
+    between threads, but used by one thread at a time. ::
+
+        storage = SqliteStorage("data/usos.sqlite3", account="anna")
+        data = DataController(dispatcher=dispatcher, storage=storage)
+
+        ...
+        data.analyze()
+        storage.close()
+
+    :param database: path to the database file, created if missing.
+    :param account: name of the account the entities belong to.
+    :param fsync: ``never``, ``data`` or ``full``, mapped onto SQLite's
+        ``synchronous`` setting: ``OFF``, ``NORMAL`` and ``FULL``.
+        Defaults to :data:`DEFAULT_FSYNC`, ``data``.
+    :raises UnknownPolicy: if the fsync policy is not supported.
+    """
+    SYNCHRONOUS = {"never": "OFF", "data": "NORMAL", "full": "FULL"}
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entities (
+            account TEXT NOT NULL,
+            key TEXT NOT NULL,
+            attributes TEXT NOT NULL,
+            digest TEXT,
+            PRIMARY KEY (account, key)
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            account TEXT NOT NULL,
+            key TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (account, key, identity)
+        );
+    """
+
+    def __init__(self, database: str, account: str = "",
+                 fsync: str = DEFAULT_FSYNC) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise UnknownPolicy("Unknown fsync policy '{}', ".format(fsync)
+                                + "choose one of {}".format(FSYNC_POLICIES))
+
+        self.database = database
+        self.account = account
+
+        dirname = os.path.dirname(database)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._connection = sqlite3.connect(
+            database, timeout=30, check_same_thread=False)
+        self._connection.execute(
+            "PRAGMA synchronous = {}".format(self.SYNCHRONOUS[fsync]))
+        self._connection.executescript(self.SCHEMA)
+
+    def keys(self) -> list:
+        """Returns the keys of every entity stored for the account."""
+        rows = self._connection.execute(
+            "SELECT key FROM entities WHERE account = ? ORDER BY key",
+            (self.account,))
+
+        return [key for key, in rows]
+
+    def exists(self, key: str) -> bool:
+        row = self._connection.execute(
+            "SELECT 1 FROM entities WHERE account = ? AND key = ?",
+            (self.account, key)).fetchone()
+
+        return row is not None
+
+    def modified(self, key: str) -> object:
+        """Returns the digest of a stored entity, which changes with 
+        every analysed version of it, or ``None`` if it has none."""
+        row = self._connection.execute(
+            "SELECT digest FROM entities WHERE account = ? AND key = ?",
+            (self.account, key)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def stamps(self) -> dict:
+        """Returns :meth:`modified` of every entity stored for the
+        account, keyed by the entity's key, in a single query."""
+        rows = self._connection.execute(
+            "SELECT key, digest FROM entities WHERE account = ?",
+            (self.account,))
+
+        return dict(rows)
+
+    def load(self, key: str) -> dict:
+        """Loads an entity, with its items in the stored order.
+
+        :param key: key of the entity.
+        :returns: the stored entity or an empty dictionary.
+        """
+        logging.info("Loading entity '{}' of '{}'".format(
+            key, self.account))
+
+        row = self._connection.execute(
+            "SELECT attributes FROM entities WHERE account = ? AND key = ?",
+            (self.account, key)).fetchone()
+
+        if row is None:
+            return {}
+
+        entity = json.loads(row[0])
+        entity["items"] = [json.loads(payload) for payload, in
+                           self._connection.execute(
+                               "SELECT payload FROM items "
+                               + "WHERE account = ? AND key = ? "
+                               + "ORDER BY position",
+                               (self.account, key))]
+
+        return entity
+
+    def save(self, key: str, entity: dict) -> None:
+        """Stores an entity, inserting new items, updating the changed
+        ones and deleting the items that are gone.
+
+        :param key: key of the entity.
+        :param entity: the entity to store.
+        """
+        logging.info("Saving entity '{}' of '{}'".format(
+            key, self.account))
+
+        attributes = {name: value for name, value in entity.items()
+                      if name != "items"}
+        self._connection.execute(
+            "INSERT INTO entities (account, key, attributes) "
+            + "VALUES (?, ?, ?) ON CONFLICT (account, key) "
+            + "DO UPDATE SET attributes = excluded.attributes",
+            (self.account, key, json.dumps(attributes, sort_keys=True)))
+
+        rows = self._rows(key, entity.get("items", []))
+        self._connection.executemany(
+            "INSERT INTO items (account, key, identity, position, payload) "
+            + "VALUES (?, ?, ?, ?, ?) "
+            + "ON CONFLICT (account, key, identity) DO UPDATE SET "
+            + "position = excluded.position, payload = excluded.payload "
+            + "WHERE position != excluded.position "
+            + "OR payload != excluded.payload",
+            rows)
+
+        identities = {row[2] for row in rows}
+        stored = self._connection.execute(
+            "SELECT identity FROM items WHERE account = ? AND key = ?",
+            (self.account, key))
+        self._connection.executemany(
+            "DELETE FROM items WHERE account = ? AND key = ? "
+            + "AND identity = ?",
+            [(self.account, key, identity) for identity, in stored.fetchall()
+             if identity not in identities])
+
+    def load_digests(self) -> dict:
+        """Loads digests of the stored entities, keyed by the entity's
+        key."""
+        rows = self._connection.execute(
+            "SELECT key, digest FROM entities "
+            + "WHERE account = ? AND digest IS NOT NULL",
+            (self.account,))
+
+        return dict(rows)
+
+    def save_digests(self, digests: dict) -> None:
+        self._connection.executemany(
+            "UPDATE entities SET digest = ? WHERE account = ? AND key = ?",
+            [(digest, self.account, key)
+             for key, digest in digests.items()])
+
+    def commit(self) -> None:
+        """Commits the changes made since the last commit."""
+        self._connection.commit()
+
+    def close(self) -> None:
+        """Closes the database, discarding uncommitted changes."""
+        self._connection.close()
+
+    def _rows(self, key: str, items: list) -> list:
+        """Returns the rows of the items table for a list of items.
+
+        Items sharing the same identifiers are told apart by the number
+        of their occurrence.
+        """
+        rows = []
+        occurrences = {}
+
+        for position, item in enumerate(items):
+            identifiers = [item.get(name) for name in
+                           ("group", "subgroup", "hierarchy", "item")]
+            identity = json.dumps(identifiers)
+            occurrence = occurrences.get(identity, 0)
+            occurrences[identity] = occurrence + 1
+
+            rows.append((
+                self.account, key,
+                json.dumps(identifiers + [occurrence]),
+                position,
+                json.dumps(item, sort_keys=True)))
+
+        return rows
+
+
+def migrate(source: object, target: object) -> int:
+    """Copies every entity, together with its digest, between two
+    storages, e.g. from :class:`JsonStorage` to :class:`SqliteStorage`.
+
+    :param source: the storage to copy the entities from.
+    :param target: the storage to copy the entities to.
+    :returns: number of copied entities.
+    """
+    keys = source.keys()
+
+    for key in keys:
+        target.save(key, source.load(key))
+
+    digests = source.load_digests()
+    target.save_digests({key: digest for key, digest in digests.items()
+                         if key in keys})
+    target.commit()
+
+    logging.info("Migrated {} entities".format(len(keys)))
+    return len(keys)
@@ -1,5 +1,9 @@
 import os
+import queue
 import logging
+import requests
+import threading
+from contextlib import contextmanager
 from selenium import webdriver
 from datetime import datetime
 
@@ -57,6 +61,21 @@ class SeleniumDriver:
 
         return self._driver
 
+    def new_instance(self) -> object:
+        """Returns a new, independent instance of a web driver.
+
+        Unlike :meth:`get_instance`, this method does not replace the 
+        driver managed by this object, so it can be used for spawning 
+        additional workers. The new browser runs with a temporary 
+        profile, because the persistent one can be opened by a single 
+        browser at a time.
+
+        :returns: a new object of ChromeDriver.
+        """
+        logging.info("Creating new worker Chrome Driver")
+
+        return webdriver.Chrome(chrome_options=self._chrome_options())
+
     def exception_take_screenshot(self, codename: str) -> None:
         """Takes a screenshot of web driver's current viewport.
         
@@ -106,13 +125,253 @@ class SeleniumDriver:
         """Adds ChromeDriver support."""
         logging.info("Creating new Chrome Driver")
 
+        options = self._chrome_options()
+        options.add_argument(
+            "user-data-dir=data/chrome_profile")
+        driver = webdriver.Chrome(chrome_options=options)
+
+        self._driver = driver
+
+    def _chrome_options(self) -> object:
+        """Returns ChromeDriver options shared by every instance."""
         options = webdriver.ChromeOptions()
         options.add_argument("--log-level=5")
         options.add_argument("--disable-extensions")
         if self.headless:
             options.add_argument("headless")
-        options.add_argument(
-            "user-data-dir=data/chrome_profile")
-        driver = webdriver.Chrome(chrome_options=options)
 
-        self._driver = driver
+        return options
+
+
+class DriverPool:
+    """Keeps a bounded number of web drivers that can be reused by 
+    consecutive tasks, e.g. when scraping multiple accounts. ::
+
+        pool = DriverPool(
+            factory=SeleniumDriver(headless=True).new_instance,
+            size=4)
+
+        with pool.lease() as web_driver:
+            ...
+
+        pool.quit()
+
+    Drivers are created on demand. Once a lease ends, every cookie of 
+    the driver is deleted, so the next task starts signed out.
+
+    :param factory: a callable returning a new web driver.
+    :param size: maximum number of drivers alive at the same time.
+    """
+    def __init__(self, factory: object, size: int) -> None:
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._available = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def lease(self) -> object:
+        """Provides a driver for the duration of a ``with`` block, 
+        blocking until one becomes available."""
+        self._available.acquire()
+        try:
+            web_driver = self._acquire()
+        except:
+            self._available.release()
+            raise
+
+        try:
+            yield web_driver
+        finally:
+            self._release(web_driver)
+            self._available.release()
+
+    def quit(self) -> None:
+        """Forces every driver of the pool to terminate."""
+        logging.info("Closing {} pooled web drivers".format(
+            len(self._drivers)))
+
+        with self._lock:
+            for web_driver in self._drivers:
+                try:
+                    web_driver.quit()
+                except:
+                    logging.exception("Web driver could not be closed")
+            self._drivers = []
+
+    def _acquire(self) -> object:
+        """Returns an idle driver or creates a new one."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            web_driver = self.factory()
+            with self._lock:
+                self._drivers.append(web_driver)
+            return web_driver
+
+    def _release(self, web_driver: object) -> None:
+        """Clears the driver's cookies and puts it back into the pool. 
+        
+        Drivers that can no longer be controlled are terminated, as far 
+        as possible, and discarded."""
+        try:
+            if hasattr(web_driver, "execute_cdp_cmd"):
+                web_driver.execute_cdp_cmd(
+                    "Network.clearBrowserCookies", {})
+            web_driver.delete_all_cookies()
+        except:
+            logging.exception("Web driver is no longer responding, "
+                              + "discarding it")
+            with self._lock:
+                self._drivers.remove(web_driver)
+            try:
+                web_driver.quit()
+            except:
+                logging.exception("Web driver could not be closed")
+            return
+
+        self._idle.put(web_driver)
+
+
+class SessionExpired(requests.RequestException):
+    """The server has redirected a request to the sign in page."""
+
+
+class StaticDriver:
+    """Serves a static HTML document through the parts of the Selenium 
+    driver API used by the scraper: ``current_url`` and ``page_source``.
+
+    Subclasses are responsible for implementing ``get(url)``, which 
+    should load the document with :meth:`_load`.
+    """
+    def __init__(self) -> None:
+        self.current_url = None
+        self.page_source = ""
+
+    def quit(self) -> None:
+        pass
+
+    def _load(self, url: str, page_source: str) -> None:
+        """Replaces the currently served document."""
+        self.current_url = url
+        self.page_source = page_source
+
+
+class HttpDriver(StaticDriver):
+    """Fetches pages directly over HTTP, reusing cookies of a session 
+    authenticated in the browser.
+
+    Connections are kept alive and pooled, so every destination costs a 
+    single request instead of a full browser render. Hand the cookies 
+    over with :meth:`usos.authentication.Authentication.share_session`::
+
+        http_driver = HttpDriver()
+        authentication.share_session(http_driver)
+        http_driver.get(root_url + "dla_stud/studia/oceny/index")
+
+    A request redirected to the sign in page of the Central 
+    Authentication System, e.g. once the shared session has expired, 
+    raises :class:`SessionExpired` instead of serving the sign in form.
+
+    :param config: set of config variables, supports ``timeout`` (in 
+        seconds), ``pool_size`` and ``login_path``, a part of the url of 
+        the sign in page (``/cas/login`` by default).
+    """
+    def __init__(self, config: dict = {}) -> None:
+        super().__init__()
+        self.config = config
+        self._session = requests.Session()
+
+        pool_size = config.get("pool_size", 10)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def add_cookie(self, cookie: dict) -> None:
+        """Adds a cookie in the format returned by Selenium's 
+        ``get_cookies()``.
+
+        :param cookie: a dictionary with at least ``name`` and ``value``.
+        """
+        self._session.cookies.set(
+            cookie["name"], cookie["value"],
+            domain=cookie.get("domain", ""),
+            path=cookie.get("path", "/"),
+            secure=cookie.get("secure", False))
+
+    def delete_all_cookies(self) -> None:
+        self._session.cookies.clear()
+
+    def get(self, url: str) -> None:
+        """Fetches the page.
+
+        :param url: an absolute url of the page.
+        :raises SessionExpired: if the request has been redirected to 
+            the sign in page.
+        :raises requests.RequestException: if the page could not be 
+            fetched.
+        """
+        logging.debug("Fetching '{}' over HTTP".format(url))
+
+        response = self._session.get(
+            url, timeout=self.config.get("timeout", 30))
+        response.raise_for_status()
+
+        if (response.history and self.config.get(
+                "login_path", "/cas/login") in response.url):
+            raise SessionExpired(
+                "Fetching '{}' has been redirected to ".format(url)
+                + "the sign in page", response=response)
+
+        self._load(response.url, response.text)
+
+    def quit(self) -> None:
+        """Closes pooled connections."""
+        logging.info("Closing the HTTP session")
+
+        self._session.close()
+
+
+class ReplayDriver(StaticDriver):
+    """Serves pages recorded in a :class:`usos.archive.PageArchive`
+    instead of fetching them, which allows running the ScrapingTemplates
+    offline. ::
+
+        replay_driver = ReplayDriver(
+            archive=PageArchive("data/archive"),
+            root_url=os.environ["USOS_SCRAPER_ROOT_URL"])
+
+        replay_driver.get(root_url + "dla_stud/studia/oceny/index")
+
+    :param archive: an archive with the recorded pages.
+    :param root_url: root url the destinations were recorded with.
+    :param at: a timestamp to replay the pages as they were at that 
+        time, defaults to the latest recordings.
+    """
+    def __init__(self, archive: object, root_url: str,
+                 at: str = None) -> None:
+        super().__init__()
+        self.archive = archive
+        self.root_url = root_url
+        self.at = at
+
+    def add_cookie(self, cookie: dict) -> None:
+        pass
+
+    def delete_all_cookies(self) -> None:
+        pass
+
+    def get(self, url: str) -> None:
+        """Loads a recorded page.
+
+        :param url: an absolute url of the page.
+        :raises usos.archive.PageNotArchived: if the page has not been 
+            recorded.
+        """
+        destination = url
+        if url.startswith(self.root_url):
+            destination = url[len(self.root_url):]
+
+        self._load(url, self.archive.load(destination, at=self.at))